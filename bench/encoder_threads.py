@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: ascii -*-
+u"""
+:Copyright:
+
+ Copyright 2017
+ Andr\xe9 Malo or his licensors, as applicable
+
+:License:
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+==========================================
+ Multi-threaded TextEncoder throughput
+==========================================
+
+Encodes large payloads from a growing number of threads and reports the
+aggregate throughput. With the C implementation the escape loops run
+without the GIL, so throughput should scale with the number of cores.
+
+Usage: python bench/encoder_threads.py [-s size] [-n rounds] [-t threads]
+"""
+from __future__ import print_function
+
+__author__ = u"Andr\xe9 Malo"
+__docformat__ = "restructuredtext en"
+
+import optparse as _optparse
+import os as _os
+import sys as _sys
+import threading as _threading
+import time as _time
+
+_sys.path.insert(0, _os.path.dirname(_os.path.dirname(
+    _os.path.abspath(__file__)
+)))
+
+# pylint: disable = wrong-import-position
+from tdi.markup.text import encoder as _encoder
+
+
+def _payloads(size):
+    """ Create the payloads (one bytes, one unicode) """
+    chunk = b'{"key": "[value]", "path": "c:\\\\tmp"} '
+    data = (chunk * (size // len(chunk) + 1))[:size]
+    return data, data.decode('ascii').replace(u'k', u'\xe9')
+
+
+def _work(encoder, payloads, rounds):
+    """ Run the encoder operations """
+    data, text = payloads
+    for _ in range(rounds):
+        encoder.attribute(data)
+        encoder.escape_content(data)
+        encoder.escape_content(text)
+
+
+def _run(threads, payloads, rounds):
+    """ Run the work in parallel, return the elapsed time """
+    encoder = _encoder.TextEncoder('utf-8')
+    workers = [
+        _threading.Thread(target=_work, args=(encoder, payloads, rounds))
+        for _ in range(threads)
+    ]
+    start = _time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return _time.time() - start
+
+
+def main():
+    """ Main """
+    parser = _optparse.OptionParser()
+    parser.add_option('-s', '--size', type='int', default=4 * 1024 * 1024,
+                      help="payload size in bytes [%default]")
+    parser.add_option('-n', '--rounds', type='int', default=10,
+                      help="rounds per thread [%default]")
+    parser.add_option('-t', '--threads', type='int', default=8,
+                      help="maximum number of threads [%default]")
+    options, _ = parser.parse_args()
+
+    print("Implementation: %s" % (
+        'C' if _encoder.TextEncoder.__module__.startswith('tdi.c')
+        else 'Python',
+    ))
+    payloads = _payloads(options.size)
+    volume = 3 * options.size * options.rounds / (1024.0 * 1024.0)
+
+    base = None
+    threads = 1
+    while threads <= options.threads:
+        elapsed = _run(threads, payloads, options.rounds)
+        throughput = threads * volume / elapsed
+        if base is None:
+            base = throughput
+        print("%2d thread(s): %8.1f MiB/s  (x%.2f)" % (
+            threads, throughput, throughput / base,
+        ))
+        threads *= 2
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: ascii -*-
+u"""
+:Copyright:
+
+ Copyright 2017
+ Andr\xe9 Malo or his licensors, as applicable
+
+:License:
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+
+==================================
+ TextEncoder value cache benchmark
+==================================
+
+Encodes a fixed set of distinct text values over and over (like a page
+rendered repeatedly with recurring values) and reports the time per call
+with and without the value cache.
+
+Usage: python bench/encoder_value_cache.py [-d distinct] [-n rounds]
+"""
+from __future__ import print_function
+
+__author__ = u"Andr\xe9 Malo"
+__docformat__ = "restructuredtext en"
+
+import optparse as _optparse
+import os as _os
+import sys as _sys
+import timeit as _timeit
+
+_sys.path.insert(0, _os.path.dirname(_os.path.dirname(
+    _os.path.abspath(__file__)
+)))
+
+# pylint: disable = wrong-import-position
+from tdi.markup.text import encoder as _encoder
+
+
+def _values(distinct, length):
+    """ Create distinct values of a given length """
+    result = []
+    for idx in range(distinct):
+        value = u'%d Andr\xe9 "[x]" ' % (idx,)
+        result.append((value * (length // len(value) + 1))[:length])
+    return result
+
+
+def _time(func, values, rounds):
+    """ Return the best time per call in nanoseconds """
+    def run():
+        """ Encode all values once """
+        for value in values:
+            func(value)
+    best = min(_timeit.repeat(run, number=rounds, repeat=3))
+    return best * 1e9 / (rounds * len(values))
+
+
+def main():
+    """ Main """
+    parser = _optparse.OptionParser()
+    parser.add_option('-d', '--distinct', type='int', default=500,
+                      help="number of distinct values [%default]")
+    parser.add_option('-n', '--rounds', type='int', default=200,
+                      help="rounds over all values [%default]")
+    options, _ = parser.parse_args()
+
+    print("Implementation: %s" % (
+        'C' if _encoder.TextEncoder.__module__.startswith('tdi.c')
+        else 'Python',
+    ))
+    plain = _encoder.TextEncoder('utf-8')
+    cached = _encoder.TextEncoder('utf-8', value_cache=1024)
+
+    print("%-15s %6s %10s %10s %7s" % (
+        "method", "length", "plain ns", "cached ns", "speedup"
+    ))
+    for length in (8, 15, 28, 64, 200):
+        values = _values(options.distinct, length)
+        for method in ('attribute', 'content', 'escape_content'):
+            base = _time(getattr(plain, method), values, options.rounds)
+            fast = _time(getattr(cached, method), values, options.rounds)
+            print("%-15s %6d %10.0f %10.0f %6.2fx" % (
+                method, length, base, fast, base / fast
+            ))
+
+
+if __name__ == '__main__':
+    main()
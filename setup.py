@@ -145,15 +145,27 @@ class Extension(_core.Extension):
 EXTENSIONS = [Extension('tdi.c._tdi_impl', [
     "tdi/c/main.c",
 
+    "tdi/c/args.c",
+    "tdi/c/buffer.c",
+    "tdi/c/bytestr.c",
+    "tdi/c/codec.c",
+
     "tdi/c/markup/attr.c",
     "tdi/c/markup/text/decoder.c",
     "tdi/c/markup/text/encoder.c",
+    "tdi/c/markup/text/starttag.c",
+    "tdi/c/markup/text/tokenizer.c",
 ], depends=[
+    "tdi/c/include/args.h",
+    "tdi/c/include/buffer.h",
     "tdi/c/include/bytestr.h",
+    "tdi/c/include/codec.h",
     "tdi/c/include/length.h",
     "tdi/c/include/markup/attr.h",
     "tdi/c/include/markup/text/decoder.h",
     "tdi/c/include/markup/text/encoder.h",
+    "tdi/c/include/markup/text/starttag.h",
+    "tdi/c/include/markup/text/tokenizer.h",
 ], include_dirs=[
     "tdi/c/include",
 ])]
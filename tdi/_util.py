@@ -28,6 +28,8 @@ Misc utilities.
 __author__ = u"Andr\xe9 Malo"
 __docformat__ = "restructuredtext en"
 
+import codecs as _codecs
+
 
 def find_public(space):
     """
@@ -45,6 +47,72 @@ def find_public(space):
     return [key for key in space.keys() if not key.startswith('_')]
 
 
+def text_encoding(encoding):
+    """
+    Validate an encoding name
+
+    :Parameters:
+      `encoding` : ``str``
+        The encoding name
+
+    :Return: The encoding name (converted to ``str``)
+    :Rtype: ``str``
+
+    :Exceptions:
+      - `LookupError` : The encoding is unknown or not a text encoding
+    """
+    encoding = str(encoding)
+    info = _codecs.lookup(encoding)
+    if not getattr(info, '_is_text_encoding', True):
+        raise LookupError("%r is not a text encoding" % (encoding,))
+    return encoding
+
+
+def buffer_view(value, offset=0, length=None):
+    """
+    Select a range of a bytes-like object
+
+    :Parameters:
+      `value` : ``bytes``
+        The value, any object providing the buffer protocol
+
+      `offset` : ``int``
+        Start of the range (clamped to the available data, ``None`` means
+        0)
+
+      `length` : ``int``
+        Maximum length of the range (``None`` for the rest of the data)
+
+    :Return: The value itself if the range covers a complete bytes object,
+             a ``memoryview`` of the range otherwise (no data is copied)
+    :Rtype: ``bytes`` or ``memoryview``
+
+    :Exceptions:
+      - `ValueError` : Negative offset or length
+      - `TypeError` : The value is text or does not support the buffer
+        protocol
+    """
+    if offset is None:
+        offset = 0
+    elif offset < 0:
+        raise ValueError("offset must not be negative")
+    if length is not None and length < 0:
+        raise ValueError("length must not be negative")
+
+    if isinstance(value, bytes):
+        if not offset and length is None:
+            return value
+    elif isinstance(value, type(u'')):
+        raise TypeError("decoding str is not supported")
+
+    view = memoryview(value)
+    if str is not bytes and (view.ndim != 1 or view.itemsize != 1):
+        view = view.cast('B')
+    if length is None:
+        return view[offset:]
+    return view[offset:offset + length]
+
+
 # pylint: disable = invalid-name
 if str is bytes:
     ur = lambda s: s.decode('ascii')
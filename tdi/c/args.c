@@ -0,0 +1,156 @@
+/*
+ * Copyright 2017
+ * Andr\xe9 Malo or his licensors, as applicable
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include "args.h"
+
+#ifdef EXT2
+#define KEY_CHECK PyString_Check
+#define KEY_AS_STRING PyString_AS_STRING
+#else
+#define KEY_CHECK PyUnicode_Check
+#define KEY_AS_STRING PyUnicode_AsUTF8
+#endif
+
+
+/*
+ * Find the parameter index of a keyword
+ *
+ * Return the index, -1 if not found, -2 on error
+ */
+static Py_ssize_t
+args_index(const tdi_args_t *spec, PyObject *key)
+{
+    const char *key_s;
+    Py_ssize_t j;
+
+    if (!KEY_CHECK(key)) {
+        PyErr_SetString(PyExc_TypeError, "keywords must be strings");
+        return -2;
+    }
+    if (!(key_s = KEY_AS_STRING(key)))
+        LCOV_EXCL_LINE_RETURN(-2);
+
+    for (j = 0; spec->kwlist[j]; ++j) {
+        if (!strcmp(key_s, spec->kwlist[j]))
+            return j;
+    }
+
+    PyErr_Format(PyExc_TypeError,
+                 "'%s' is an invalid keyword argument for %s()",
+                 key_s, spec->fname);
+    return -1;
+}
+
+
+/*
+ * Store a keyword argument
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+args_keyword(const tdi_args_t *spec, PyObject **result, Py_ssize_t nargs,
+             PyObject *key, PyObject *value)
+{
+    Py_ssize_t j;
+
+    if ((j = args_index(spec, key)) < 0)
+        return -1;
+
+    if (j < nargs) {
+        PyErr_Format(PyExc_TypeError,
+                     "argument for %s() given by name ('%s') "
+                     "and position (%d)",
+                     spec->fname, spec->kwlist[j], (int)j + 1);
+        return -1;
+    }
+
+    result[j] = value;
+    return 0;
+}
+
+
+/*
+ * Parse method arguments into an array of (borrowed) objects
+ *
+ * Return -1 on error, 0 on success
+ */
+int
+tdi_args_parse(const tdi_args_t *spec, PyObject **result, TDI_ARGS_DEF)
+{
+    Py_ssize_t j, size;
+#ifdef TDI_ARGS_FASTCALL
+    Py_ssize_t nkw;
+#else
+    PyObject *key, *value;
+    Py_ssize_t nargs, pos;
+#endif
+
+    for (size = 0; spec->kwlist[size]; ++size)
+        ;
+
+#ifndef TDI_ARGS_FASTCALL
+    nargs = PyTuple_GET_SIZE(args);
+#endif
+
+    if (nargs > size) {
+        PyErr_Format(PyExc_TypeError,
+                     "%s() takes at most %d argument%s (%d given)",
+                     spec->fname, (int)size, size == 1 ? "" : "s",
+                     (int)nargs);
+        return -1;
+    }
+
+    for (j = 0; j < spec->required; ++j)
+        result[j] = NULL;
+
+#ifdef TDI_ARGS_FASTCALL
+    for (j = 0; j < nargs; ++j)
+        result[j] = args[j];
+
+    if (kwnames) {
+        nkw = PyTuple_GET_SIZE(kwnames);
+        for (j = 0; j < nkw; ++j) {
+            if (-1 == args_keyword(spec, result, nargs,
+                                   PyTuple_GET_ITEM(kwnames, j),
+                                   args[nargs + j]))
+                return -1;
+        }
+    }
+#else
+    for (j = 0; j < nargs; ++j)
+        result[j] = PyTuple_GET_ITEM(args, j);
+
+    if (kwds) {
+        pos = 0;
+        while (PyDict_Next(kwds, &pos, &key, &value)) {
+            if (-1 == args_keyword(spec, result, nargs, key, value))
+                return -1;
+        }
+    }
+#endif
+
+    for (j = nargs; j < spec->required; ++j) {
+        if (!result[j]) {
+            PyErr_Format(PyExc_TypeError,
+                         "%s() missing required argument '%s' (pos %d)",
+                         spec->fname, spec->kwlist[j], (int)j + 1);
+            return -1;
+        }
+    }
+
+    return 0;
+}
@@ -0,0 +1,184 @@
+/*
+ * Copyright 2017
+ * Andr\xe9 Malo or his licensors, as applicable
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include "buffer.h"
+#include "length.h"
+
+#define BUF_MIN_SIZE (256)
+
+
+/*
+ * Initialize buffer
+ *
+ * Return -1 on error, 0 on success
+ */
+int
+tdi_buf_init(tdi_buf_t *buf, Py_ssize_t hint)
+{
+    if (hint < BUF_MIN_SIZE)
+        hint = BUF_MIN_SIZE;
+
+    buf->length = 0;
+    if (!(buf->obj = PyBytes_FromStringAndSize(NULL, hint))) {
+        LCOV_EXCL_START
+
+        buf->size = 0;
+        return -1;
+
+        LCOV_EXCL_STOP
+    }
+    buf->size = hint;
+
+    return 0;
+}
+
+
+/*
+ * Reserve space at the end of the buffer
+ *
+ * Return a pointer to the reserved space, NULL on error
+ */
+char *
+tdi_buf_extend(tdi_buf_t *buf, Py_ssize_t length)
+{
+    Py_ssize_t needed, size;
+    char *result;
+
+    if (-1 == (needed = length_add(buf->length, length)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    if (needed > buf->size) {
+        size = buf->size;
+        if (size > PY_SSIZE_T_MAX / 2)
+            size = needed;
+        else if ((size *= 2) < needed)
+            size = needed;
+
+        if (-1 == _PyBytes_Resize(&buf->obj, size)) {
+            LCOV_EXCL_START
+
+            buf->size = buf->length = 0;
+            return NULL;
+
+            LCOV_EXCL_STOP
+        }
+        buf->size = size;
+    }
+
+    result = PyBytes_AS_STRING(buf->obj) + buf->length;
+    buf->length = needed;
+
+    return result;
+}
+
+
+/*
+ * Append bytes to the buffer
+ *
+ * Return -1 on error, 0 on success
+ */
+int
+tdi_buf_write(tdi_buf_t *buf, const char *bytes, Py_ssize_t length)
+{
+    char *target;
+
+    if (!(target = tdi_buf_extend(buf, length)))
+        LCOV_EXCL_LINE_RETURN(-1);
+
+    (void)memcpy(target, bytes, (size_t)length);
+    return 0;
+}
+
+
+/*
+ * Finish the buffer
+ *
+ * Return the resulting bytes object or NULL on error
+ */
+PyObject *
+tdi_buf_finish(tdi_buf_t *buf)
+{
+    PyObject *result = buf->obj;
+
+    buf->obj = NULL;
+    if (result && buf->length != buf->size) {
+        if (-1 == _PyBytes_Resize(&result, buf->length))
+            LCOV_EXCL_LINE_RETURN(NULL);
+    }
+    buf->size = buf->length = 0;
+
+    return result;
+}
+
+
+/*
+ * Clear buffer
+ */
+void
+tdi_buf_clear(tdi_buf_t *buf)
+{
+    Py_CLEAR(buf->obj);
+    buf->size = buf->length = 0;
+}
+
+
+/*
+ * Reserve space at the end of a bytearray
+ *
+ * Return a pointer to the reserved space, NULL on error
+ */
+char *
+tdi_bytearray_extend(PyObject *bytearray, Py_ssize_t length)
+{
+    Py_ssize_t size, needed;
+
+    size = PyByteArray_GET_SIZE(bytearray);
+    if (-1 == (needed = length_add(size, length)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    if (-1 == PyByteArray_Resize(bytearray, needed))
+        return NULL;
+
+    return PyByteArray_AS_STRING(bytearray) + size;
+}
+
+
+/*
+ * Append bytes to a target object
+ *
+ * Return -1 on error, 0 on success
+ */
+int
+tdi_append(PyObject *target, PyObject *bytes)
+{
+    PyObject *tmp;
+    char *c;
+
+    if (PyByteArray_CheckExact(target)) {
+        if (!(c = tdi_bytearray_extend(target, PyBytes_GET_SIZE(bytes))))
+            return -1;
+        (void)memcpy(c, PyBytes_AS_STRING(bytes),
+                     (size_t)PyBytes_GET_SIZE(bytes));
+        return 0;
+    }
+
+    if (!(tmp = PyObject_CallMethod(target, "extend", "(O)", bytes)))
+        return -1;
+    Py_DECREF(tmp);
+
+    return 0;
+}
@@ -0,0 +1,82 @@
+/*
+ * Copyright 2017
+ * Andr\xe9 Malo or his licensors, as applicable
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include "bytestr.h"
+
+
+/*
+ * Fill bytestr from bytes or a contiguous buffer
+ *
+ * Return -1 on error, 0 on success
+ */
+int
+tdi_bytestr_init(tdi_bytestr_t *str, PyObject *obj)
+{
+    Py_buffer *view;
+
+    str->view = NULL;
+    if (PyBytes_Check(obj)) {
+        str->obj = obj;
+        str->bytes = PyBytes_AS_STRING(obj);
+        str->length = PyBytes_GET_SIZE(obj);
+        return 0;
+    }
+
+    str->obj = NULL;
+    if (PyUnicode_Check(obj)) {
+        PyErr_SetString(PyExc_TypeError, "expected bytes");
+        goto error;
+    }
+
+    if (!(view = PyMem_Malloc(sizeof *view))) {
+        LCOV_EXCL_START
+
+        PyErr_SetNone(PyExc_MemoryError);
+        goto error;
+
+        LCOV_EXCL_STOP
+    }
+    if (-1 == PyObject_GetBuffer(obj, view, PyBUF_SIMPLE)) {
+        PyMem_Free(view);
+        goto error;
+    }
+
+    str->obj = obj;
+    str->view = view;
+    str->bytes = view->buf;
+    str->length = view->len;
+    return 0;
+
+error:
+    Py_DECREF(obj);
+    return -1;
+}
+
+
+/*
+ * Clear bytestr
+ */
+void
+tdi_bytestr_clear(tdi_bytestr_t *str)
+{
+    if (str->view) {
+        PyBuffer_Release(str->view);
+        PyMem_Free(str->view);
+        str->view = NULL;
+    }
+    Py_CLEAR(str->obj);
+}
@@ -0,0 +1,317 @@
+/*
+ * Copyright 2017
+ * Andr\xe9 Malo or his licensors, as applicable
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include "codec.h"
+
+#ifdef EXT2
+#define AS_STRING PyString_AsString
+#else
+#define AS_STRING PyUnicode_AsUTF8
+#endif
+
+
+/*
+ * Lookup codec info, check that it's a text encoding
+ *
+ * Return the CodecInfo object or NULL on error
+ */
+static PyObject *
+codec_lookup(PyObject *encoding)
+{
+    PyObject *codecs, *info, *tmp;
+    int res;
+
+    if (!(codecs = PyImport_ImportModule("codecs")))
+        LCOV_EXCL_LINE_RETURN(NULL);
+    info = PyObject_CallMethod(codecs, "lookup", "(O)", encoding);
+    Py_DECREF(codecs);
+    if (!info)
+        return NULL;
+
+    if (!(tmp = PyObject_GetAttrString(info, "_is_text_encoding"))) {
+        if (!PyErr_ExceptionMatches(PyExc_AttributeError))
+            LCOV_EXCL_LINE_GOTO(error);
+        PyErr_Clear();
+        return info;
+    }
+    res = PyObject_IsTrue(tmp);
+    Py_DECREF(tmp);
+    if (res == -1)
+        LCOV_EXCL_LINE_GOTO(error);
+    if (!res) {
+        PyErr_Format(PyExc_LookupError, "'%s' is not a text encoding",
+                     AS_STRING(encoding));
+        goto error;
+    }
+
+    return info;
+
+error:
+    Py_DECREF(info);
+    return NULL;
+}
+
+
+/*
+ * Resolve and validate the codec for an encoding name
+ *
+ * Return -1 on error, 0 on success
+ */
+int
+tdi_codec_init(tdi_codec_t *codec, PyObject *encoding)
+{
+    PyObject *info, *name, *encoder, *decoder;
+    const char *name_s;
+    tdi_codec_kind_t kind = TDI_CODEC_OTHER;
+
+    if (!(encoding = PyObject_Str(encoding)))
+        return -1;
+
+    if (!(info = codec_lookup(encoding)))
+        goto error_encoding;
+
+    if (!(name = PyObject_GetAttrString(info, "name")))
+        LCOV_EXCL_LINE_GOTO(error_info);
+    if (!(name_s = AS_STRING(name))) {
+        LCOV_EXCL_START
+
+        Py_DECREF(name);
+        goto error_info;
+
+        LCOV_EXCL_STOP
+    }
+    if (!strcmp(name_s, "utf-8"))
+        kind = TDI_CODEC_UTF8;
+    else if (!strcmp(name_s, "iso8859-1"))
+        kind = TDI_CODEC_LATIN1;
+    else if (!strcmp(name_s, "ascii"))
+        kind = TDI_CODEC_ASCII;
+    Py_DECREF(name);
+
+    if (!(encoder = PyObject_GetAttrString(info, "encode")))
+        LCOV_EXCL_LINE_GOTO(error_info);
+    if (!(decoder = PyObject_GetAttrString(info, "decode")))
+        LCOV_EXCL_LINE_GOTO(error_encoder);
+    Py_DECREF(info);
+
+    codec->kind = kind;
+    codec->encoding = encoding;
+    codec->encoder = encoder;
+    codec->decoder = decoder;
+
+    return 0;
+
+error_encoder:
+    LCOV_EXCL_START
+    Py_DECREF(encoder);
+    LCOV_EXCL_STOP
+error_info:
+    Py_DECREF(info);
+error_encoding:
+    Py_DECREF(encoding);
+
+    return -1;
+}
+
+
+/*
+ * Clear codec
+ */
+void
+tdi_codec_clear(tdi_codec_t *codec)
+{
+    codec->kind = TDI_CODEC_OTHER;
+    Py_CLEAR(codec->decoder);
+    Py_CLEAR(codec->encoder);
+    Py_CLEAR(codec->encoding);
+}
+
+
+/*
+ * Visit codec members
+ */
+int
+tdi_codec_traverse(tdi_codec_t *codec, visitproc visit, void *arg)
+{
+    Py_VISIT(codec->encoding);
+    Py_VISIT(codec->encoder);
+    Py_VISIT(codec->decoder);
+
+    return 0;
+}
+
+
+/*
+ * Pick the first item of a codec function result
+ *
+ * result is stolen.
+ *
+ * Return the item or NULL on error
+ */
+static PyObject *
+codec_result(PyObject *result, int (*check)(PyObject *), const char *message)
+{
+    PyObject *item;
+
+    if (!result)
+        return NULL;
+
+    if (!PyTuple_Check(result) || PyTuple_GET_SIZE(result) != 2
+        || !check(item = PyTuple_GET_ITEM(result, 0))) {
+        PyErr_SetString(PyExc_TypeError, message);
+        Py_DECREF(result);
+        return NULL;
+    }
+
+    Py_INCREF(item);
+    Py_DECREF(result);
+    return item;
+}
+
+/*
+ * Check for bytes (function version)
+ */
+static int
+codec_check_bytes(PyObject *obj)
+{
+    return PyBytes_Check(obj);
+}
+
+/*
+ * Check for unicode (function version)
+ */
+static int
+codec_check_unicode(PyObject *obj)
+{
+    return PyUnicode_Check(obj);
+}
+
+
+/*
+ * Encode unicode strictly
+ *
+ * Return the encoded bytes or NULL on error
+ */
+PyObject *
+tdi_codec_encode(tdi_codec_t *codec, PyObject *value)
+{
+    switch (codec->kind) {
+    case TDI_CODEC_UTF8:
+        return PyUnicode_AsUTF8String(value);
+
+    case TDI_CODEC_LATIN1:
+        return PyUnicode_AsLatin1String(value);
+
+    case TDI_CODEC_ASCII:
+        return PyUnicode_AsASCIIString(value);
+
+    default:
+        break;
+    }
+
+    return codec_result(
+        PyObject_CallFunctionObjArgs(codec->encoder, value, NULL),
+        codec_check_bytes, "encoder must return a tuple (bytes, int)"
+    );
+}
+
+
+/*
+ * Convert an error handler name
+ *
+ * Return the name as char buffer, NULL on error
+ */
+const char *
+tdi_codec_errors(PyObject *errors)
+{
+    if (!errors)
+        return "strict";
+
+    return AS_STRING(errors);
+}
+
+
+/*
+ * Decode a char buffer
+ *
+ * Return the decoded unicode or NULL on error
+ */
+PyObject *
+tdi_codec_decode_string(tdi_codec_t *codec, const char *value,
+                        Py_ssize_t length, const char *errors)
+{
+    PyObject *tmp, *result;
+
+    switch (codec->kind) {
+    case TDI_CODEC_UTF8:
+        return PyUnicode_DecodeUTF8(value, length, errors);
+
+    case TDI_CODEC_LATIN1:
+        return PyUnicode_DecodeLatin1(value, length, errors);
+
+    case TDI_CODEC_ASCII:
+        return PyUnicode_DecodeASCII(value, length, errors);
+
+    default:
+        break;
+    }
+
+    /*
+     * Codec functions may keep a reference to their input (e.g. within
+     * exceptions), so they get a copy.
+     */
+    if (!(tmp = PyBytes_FromStringAndSize(value, length)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    result = codec_result(
+        PyObject_CallFunction(codec->decoder, "(Os)", tmp, errors),
+        codec_check_unicode, "decoder must return a tuple (str, int)"
+    );
+    Py_DECREF(tmp);
+    return result;
+}
+
+
+/*
+ * Decode bytes
+ *
+ * Return the decoded unicode or NULL on error
+ */
+PyObject *
+tdi_codec_decode(tdi_codec_t *codec, PyObject *value, PyObject *errors)
+{
+    const char *errors_s;
+
+    if (!(errors_s = tdi_codec_errors(errors)))
+        return NULL;
+
+    if (PyBytes_Check(value)) {
+        if (codec->kind != TDI_CODEC_OTHER)
+            return tdi_codec_decode_string(codec, PyBytes_AS_STRING(value),
+                                           PyBytes_GET_SIZE(value),
+                                           errors_s);
+    }
+    else if (PyUnicode_Check(value)) {
+        PyErr_SetString(PyExc_TypeError, "decoding str is not supported");
+        return NULL;
+    }
+
+    return codec_result(
+        PyObject_CallFunction(codec->decoder, "(Os)", value, errors_s),
+        codec_check_unicode, "decoder must return a tuple (str, int)"
+    );
+}
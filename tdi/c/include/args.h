@@ -0,0 +1,71 @@
+/*
+ * Copyright 2017
+ * Andr\xe9 Malo or his licensors, as applicable
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#ifndef TDI_ARGS_H
+#define TDI_ARGS_H
+
+#include "cext.h"
+
+
+/*
+ * Method calling convention
+ *
+ * Methods are defined as
+ *
+ *     static PyObject *
+ *     method(PyObject *self, TDI_ARGS_DEF)
+ *
+ * registered with TDI_ARGS_FLAGS and pass TDI_ARGS to tdi_args_parse.
+ * Python 3.7+ uses the fastcall convention (no argument tuple or keyword
+ * dict is created), older versions fall back to METH_VARARGS.
+ */
+#if defined(EXT3) && PY_VERSION_HEX >= 0x03070000
+#define TDI_ARGS_FASTCALL
+#define TDI_ARGS_DEF PyObject *const *args, Py_ssize_t nargs, PyObject *kwnames
+#define TDI_ARGS args, nargs, kwnames
+#define TDI_ARGS_FLAGS (METH_FASTCALL | METH_KEYWORDS)
+#else
+#define TDI_ARGS_DEF PyObject *args, PyObject *kwds
+#define TDI_ARGS args, kwds
+#define TDI_ARGS_FLAGS (METH_VARARGS | METH_KEYWORDS)
+#endif
+
+
+/*
+ * Argument specification
+ */
+typedef struct tdi_args_t {
+    const char *fname;          /* function name (for error messages) */
+    const char * const *kwlist; /* parameter names, NULL terminated */
+    Py_ssize_t required;        /* number of required parameters */
+} tdi_args_t;
+
+
+/*
+ * Parse method arguments into an array of (borrowed) objects
+ *
+ * The array must provide a slot per parameter. Slots of optional
+ * parameters not passed are left untouched, so they can be initialized
+ * with defaults.
+ *
+ * Return -1 on error, 0 on success
+ */
+EXT_LOCAL int
+tdi_args_parse(const tdi_args_t *, PyObject **, TDI_ARGS_DEF);
+
+
+#endif
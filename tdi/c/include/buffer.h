@@ -0,0 +1,107 @@
+/*
+ * Copyright 2017
+ * Andr\xe9 Malo or his licensors, as applicable
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#ifndef TDI_BUFFER_H
+#define TDI_BUFFER_H
+
+#include "cext.h"
+
+
+/*
+ * Growable bytes buffer
+ *
+ * The buffer writes directly into a bytes object, which is resized as
+ * needed and shrunk to the final size by tdi_buf_finish.
+ */
+typedef struct tdi_buf_t {
+    PyObject *obj;
+    Py_ssize_t length;
+    Py_ssize_t size;
+} tdi_buf_t;
+
+
+/*
+ * Initialize buffer
+ *
+ * hint is the initially allocated size.
+ *
+ * Return -1 on error, 0 on success
+ */
+EXT_LOCAL int
+tdi_buf_init(tdi_buf_t *, Py_ssize_t);
+
+
+/*
+ * Reserve space at the end of the buffer
+ *
+ * Return a pointer to the reserved space (which must be filled by the
+ * caller), NULL on error
+ */
+EXT_LOCAL char *
+tdi_buf_extend(tdi_buf_t *, Py_ssize_t);
+
+
+/*
+ * Append bytes to the buffer
+ *
+ * Return -1 on error, 0 on success
+ */
+EXT_LOCAL int
+tdi_buf_write(tdi_buf_t *, const char *, Py_ssize_t);
+
+
+/*
+ * Finish the buffer
+ *
+ * The buffer is cleared.
+ *
+ * Return the resulting bytes object or NULL on error
+ */
+EXT_LOCAL PyObject *
+tdi_buf_finish(tdi_buf_t *);
+
+
+/*
+ * Clear buffer
+ */
+EXT_LOCAL void
+tdi_buf_clear(tdi_buf_t *);
+
+
+/*
+ * Reserve space at the end of a bytearray
+ *
+ * Return a pointer to the reserved space (which must be filled by the
+ * caller), NULL on error
+ */
+EXT_LOCAL char *
+tdi_bytearray_extend(PyObject *, Py_ssize_t);
+
+
+/*
+ * Append bytes to a target object
+ *
+ * Exact bytearrays are extended in place, other objects are extended via
+ * their extend method.
+ *
+ * Return -1 on error, 0 on success
+ */
+EXT_LOCAL int
+tdi_append(PyObject *, PyObject *);
+
+
+#endif
@@ -21,11 +21,39 @@
 #include "cext.h"
 
 
+/*
+ * Byte string (bytes or contiguous buffer)
+ *
+ * view is only allocated for objects other than bytes.
+ */
 typedef struct tdi_bytestr_t {
     PyObject *obj;
     char *bytes;
     Py_ssize_t length;
+    Py_buffer *view;
 } tdi_bytestr_t;
 
 
+/*
+ * Fill bytestr from bytes or any other object providing a contiguous
+ * buffer (but not from unicode)
+ *
+ * obj is stolen, regardless of success. The bytestr is left empty on
+ * error.
+ *
+ * Return -1 on error, 0 on success
+ */
+EXT_LOCAL int
+tdi_bytestr_init(tdi_bytestr_t *, PyObject *);
+
+
+/*
+ * Clear bytestr (release the buffer)
+ *
+ * An empty bytestr (obj == NULL) is left untouched.
+ */
+EXT_LOCAL void
+tdi_bytestr_clear(tdi_bytestr_t *);
+
+
 #endif
@@ -0,0 +1,113 @@
+/*
+ * Copyright 2017
+ * Andr\xe9 Malo or his licensors, as applicable
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#ifndef TDI_CODEC_H
+#define TDI_CODEC_H
+
+#include "cext.h"
+
+
+/*
+ * Codecs with native fast paths
+ */
+typedef enum {
+    TDI_CODEC_OTHER,
+    TDI_CODEC_UTF8,
+    TDI_CODEC_LATIN1,
+    TDI_CODEC_ASCII
+} tdi_codec_kind_t;
+
+/*
+ * Resolved codec
+ */
+typedef struct tdi_codec_t {
+    tdi_codec_kind_t kind;
+    PyObject *encoding;  /* encoding name as passed in */
+    PyObject *encoder;   /* codec encode function (TDI_CODEC_OTHER only) */
+    PyObject *decoder;   /* codec decode function (TDI_CODEC_OTHER only) */
+} tdi_codec_t;
+
+
+/*
+ * Resolve and validate the codec for an encoding name
+ *
+ * The encoding is converted to str. codec is left untouched on error and
+ * must be cleared (tdi_codec_clear) before it is initialized again.
+ *
+ * Return -1 on error (LookupError for unknown codecs), 0 on success
+ */
+EXT_LOCAL int
+tdi_codec_init(tdi_codec_t *, PyObject *);
+
+
+/*
+ * Clear codec
+ */
+EXT_LOCAL void
+tdi_codec_clear(tdi_codec_t *);
+
+
+/*
+ * Visit codec members (for GC)
+ */
+EXT_LOCAL int
+tdi_codec_traverse(tdi_codec_t *, visitproc, void *);
+
+
+/*
+ * Encode unicode strictly
+ *
+ * Return the encoded bytes or NULL on error
+ */
+EXT_LOCAL PyObject *
+tdi_codec_encode(tdi_codec_t *, PyObject *);
+
+
+/*
+ * Convert an error handler name (NULL meaning "strict")
+ *
+ * Return the name as char buffer, NULL on error
+ */
+EXT_LOCAL const char *
+tdi_codec_errors(PyObject *);
+
+
+/*
+ * Decode a char buffer
+ *
+ * errors must not be NULL. Codecs without native fast path are passed a
+ * copy of the buffer.
+ *
+ * Return the decoded unicode or NULL on error
+ */
+EXT_LOCAL PyObject *
+tdi_codec_decode_string(tdi_codec_t *, const char *, Py_ssize_t,
+                        const char *);
+
+
+/*
+ * Decode bytes
+ *
+ * errors may be NULL (meaning "strict").
+ *
+ * Return the decoded unicode or NULL on error
+ */
+EXT_LOCAL PyObject *
+tdi_codec_decode(tdi_codec_t *, PyObject *, PyObject *);
+
+
+#endif
@@ -28,63 +28,104 @@ typedef struct tdi_attr_t {
     tdi_bytestr_t value;
 } tdi_attr_t;
 
-typedef struct tdi_attrlist_t tdi_attrlist_t;
-typedef struct tdi_attrlist_iter_t tdi_attrlist_iter_t;
 
-struct tdi_attrlist_iter_t {
-    void *current;
-    int index;
-};
+/*
+ * Number of attributes stored without extra allocation
+ */
+#define TDI_ATTRLIST_INLINE (8)
 
+/*
+ * Maximum number of attributes kept in a scratch array between calls
+ */
+#define TDI_ATTRSCRATCH_MAX (256)
 
 /*
- * Clear attrlist
+ * Reusable attribute storage
+ *
+ * An attrlist borrows the scratch array instead of allocating its own heap
+ * array, if the scratch array is not in use already. The array is kept
+ * after the list has been cleared, unless it grew beyond
+ * TDI_ATTRSCRATCH_MAX attributes.
+ */
+typedef struct tdi_attrscratch_t {
+    tdi_attr_t *attr;       /* scratch array or NULL */
+    Py_ssize_t size;        /* capacity of attr */
+    int in_use;             /* borrowed by an attrlist? */
+} tdi_attrscratch_t;
+
+/*
+ * Attribute list
+ *
+ * The first TDI_ATTRLIST_INLINE attributes are stored within the struct
+ * itself (which usually lives on the stack). Longer lists are moved into a
+ * single contiguous heap array, which grows as needed. The heap array is
+ * borrowed from the scratch storage, if available.
  *
- * attrs will be set to NULL
+ * The struct must not be copied (attr may point into it).
+ */
+typedef struct tdi_attrlist_t {
+    tdi_attr_t *attr;       /* attribute array (small or heap) */
+    Py_ssize_t length;      /* number of attributes */
+    Py_ssize_t size;        /* capacity of attr */
+    tdi_attrscratch_t *scratch;  /* scratch storage or NULL */
+    tdi_attr_t small[TDI_ATTRLIST_INLINE];
+} tdi_attrlist_t;
+
+
+/*
+ * Initialize scratch storage (empty)
  */
 EXT_LOCAL void
-tdi_attrlist_clear(tdi_attrlist_t **);
+tdi_attrscratch_init(tdi_attrscratch_t *);
 
 
 /*
- * Add attr to attrlist, create if needed
- *
- * key and value are stolen, regardless of success.
+ * Release the scratch array, unless it's in use
+ */
+EXT_LOCAL void
+tdi_attrscratch_trim(tdi_attrscratch_t *);
+
+
+/*
+ * Initialize (empty) attrlist
  *
- * Return -1 on error, 0 on success
+ * scratch may be NULL.
  */
-EXT_LOCAL int
-tdi_attrlist_add(tdi_attrlist_t **, PyObject *, PyObject *);
+EXT_LOCAL void
+tdi_attrlist_init(tdi_attrlist_t *, tdi_attrscratch_t *);
 
 
 /*
- * Create attrlist from iter([(key, value), ...])
+ * Clear attrlist
  *
- * Return -1 on error, 0 on sucess
- * result_ contains the result. may be NULL.
+ * The list is empty (and initialized with the same scratch storage)
+ * afterwards. A borrowed scratch array is given back.
  */
-EXT_LOCAL int
-tdi_attrlist_from_iterable(PyObject *, tdi_attrlist_t **);
+EXT_LOCAL void
+tdi_attrlist_clear(tdi_attrlist_t *);
 
 
 /*
- * Init attribute iterator from attrlist
+ * Add attr to attrlist
  *
- * Allocate tdi_attrlist_iter_t yourself and pass it in.
+ * key and value are stolen, regardless of success.
  *
  * Return -1 on error, 0 on success
  */
 EXT_LOCAL int
-tdi_attrlist_iter_init(tdi_attrlist_iter_t *, tdi_attrlist_t *);
+tdi_attrlist_add(tdi_attrlist_t *, PyObject *, PyObject *);
 
 
 /*
- * Get next attr from attrlist iterator
+ * Fill initialized attrlist from iter([(key, value), ...]) or a mapping
+ *
+ * Mappings (dicts and objects with a keys method) are read via their items.
+ * The list is cleared on error.
  *
- * Return -1 on error, 0 on success, attr is set NULL if exhausted (returning 0)
+ * Return -1 on error, 0 on sucess
  */
 EXT_LOCAL int
-tdi_attrlist_iter_next(tdi_attrlist_iter_t *, tdi_attr_t **);
+tdi_attrlist_from_iterable(PyObject *, tdi_attrlist_t *);
 
 
 #endif
@@ -30,4 +30,27 @@ extern EXT_LOCAL PyTypeObject TDI_TextDecoder;
     ((op)->ob_type == &TDI_TextDecoder)
 
 
+/*
+ * What to decode with tdi_text_decoder_string
+ */
+typedef enum {
+    TDI_TEXT_DECODE_NAME,       /* decode and normalize */
+    TDI_TEXT_DECODE_ATTRIBUTE,
+    TDI_TEXT_DECODE_CONTENT
+} tdi_text_decode_t;
+
+
+/*
+ * Decode a char buffer directly with a TextDecoder
+ *
+ * The decoder must be a TDI_TextDecoder. errors may be NULL (meaning
+ * "strict").
+ *
+ * Return the decoded value or NULL on error
+ */
+EXT_LOCAL PyObject *
+tdi_text_decoder_string(PyObject *, tdi_text_decode_t, const char *,
+                        Py_ssize_t, PyObject *);
+
+
 #endif
@@ -19,6 +19,8 @@
 
 #include "markup/text/decoder.h"
 #include "markup/text/encoder.h"
+#include "markup/text/starttag.h"
+#include "markup/text/tokenizer.h"
 
 EXT_INIT_FUNC;
 
@@ -73,6 +75,10 @@ EXT_INIT_FUNC {
     EXT_ADD_TYPE(m, "TextDecoder", &TDI_TextDecoder);
     EXT_INIT_TYPE(m, &TDI_TextEncoder);
     EXT_ADD_TYPE(m, "TextEncoder", &TDI_TextEncoder);
+    EXT_INIT_TYPE(m, &TDI_CompiledStartTag);
+    EXT_ADD_TYPE(m, "CompiledStartTag", &TDI_CompiledStartTag);
+    EXT_INIT_TYPE(m, &TDI_TextTokenizer);
+    EXT_ADD_TYPE(m, "TextTokenizer", &TDI_TextTokenizer);
 
     EXT_INIT_RETURN(m);
 }
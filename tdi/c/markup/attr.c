@@ -17,197 +17,267 @@
 
 #include "markup/attr.h"
 
-#define ATTR_CHUNK_SIZE (5)
 
-typedef struct tdi_attrlist_chunk_t {
-    struct tdi_attrlist_chunk_t *next;
-    tdi_attr_t attr[ATTR_CHUNK_SIZE];
-    int index;
-} tdi_attrlist_chunk_t;
+/*
+ * Initialize scratch storage (empty)
+ */
+void
+tdi_attrscratch_init(tdi_attrscratch_t *scratch)
+{
+    scratch->attr = NULL;
+    scratch->size = 0;
+    scratch->in_use = 0;
+}
+
+
+/*
+ * Release the scratch array, unless it's in use
+ */
+void
+tdi_attrscratch_trim(tdi_attrscratch_t *scratch)
+{
+    if (!scratch->in_use) {
+        PyMem_Free(scratch->attr);
+        tdi_attrscratch_init(scratch);
+    }
+}
 
-struct tdi_attrlist_t {
-    tdi_attrlist_chunk_t first;
-    tdi_attrlist_chunk_t *last;
-};
+
+/*
+ * Initialize (empty) attrlist
+ */
+void
+tdi_attrlist_init(tdi_attrlist_t *attrs, tdi_attrscratch_t *scratch)
+{
+    attrs->attr = attrs->small;
+    attrs->length = 0;
+    attrs->size = TDI_ATTRLIST_INLINE;
+    attrs->scratch = scratch;
+}
+
+
+/*
+ * Check if the attrlist is using the scratch array
+ */
+#define USES_SCRATCH(attrs) \
+    ((attrs)->scratch && (attrs)->scratch->in_use \
+     && (attrs)->attr == (attrs)->scratch->attr)
 
 
 /*
  * Clear attrlist
- *
- * attrs will be set to NULL
  */
 void
-tdi_attrlist_clear(tdi_attrlist_t **attrs_)
+tdi_attrlist_clear(tdi_attrlist_t *attrs)
 {
-    tdi_attrlist_t *attrs = *attrs_;
-    tdi_attrlist_chunk_t *current, *next;
     tdi_attr_t *attr;
-    int j;
-
-    if (!attrs)
-        return;
-
-    *attrs_ = NULL;
-    current = attrs->last = &attrs->first;
-    while (current) {
-        next = current->next;
-        current->next = NULL;
-        for (j=current->index; j >= 0; --j) {
-            attr = &current->attr[j];
-            Py_CLEAR(attr->key.obj);
-            Py_CLEAR(attr->value.obj);
-        }
-        if (current != &attrs->first)
-            PyMem_Free(current);
-        current = next;
+    Py_ssize_t j;
+
+    for (j = attrs->length - 1; j >= 0; --j) {
+        attr = &attrs->attr[j];
+        tdi_bytestr_clear(&attr->key);
+        tdi_bytestr_clear(&attr->value);
+    }
+    if (USES_SCRATCH(attrs)) {
+        attrs->scratch->in_use = 0;
+        if (attrs->scratch->size > TDI_ATTRSCRATCH_MAX)
+            tdi_attrscratch_trim(attrs->scratch);
     }
+    else if (attrs->attr != attrs->small)
+        PyMem_Free(attrs->attr);
+
+    tdi_attrlist_init(attrs, attrs->scratch);
 }
 
 
 /*
- * Add attr to attrlist, create if needed
- *
- * key and value are stolen, regardless of success.
+ * Make the scratch array hold at least `size` attributes
  *
  * Return -1 on error, 0 on success
  */
-int
-tdi_attrlist_add(tdi_attrlist_t **root_, PyObject *key, PyObject *value)
+static int
+attrlist_reserve_scratch(tdi_attrscratch_t *scratch, Py_ssize_t size)
 {
-    tdi_attrlist_t *root = *root_;
-    tdi_attrlist_chunk_t *current, *next;
     tdi_attr_t *attr;
-    int index;
 
-    if (!root) {
-        if (!(root = PyMem_Malloc(sizeof *root))) {
-            LCOV_EXCL_START
+    if (size <= scratch->size)
+        return 0;
 
-            PyErr_SetNone(PyExc_MemoryError);
-            goto error_kv;
+    if (!(attr = PyMem_Realloc(scratch->attr,
+                               (size_t)size * sizeof *attr))) {
+        LCOV_EXCL_START
 
-            LCOV_EXCL_STOP
-        }
-        root->last = current = &root->first;
-        current->next = NULL;
-        current->index = -1;
+        PyErr_SetNone(PyExc_MemoryError);
+        return -1;
 
-        *root_ = root;
+        LCOV_EXCL_STOP
     }
-    else {
-        current = root->last;
+    scratch->attr = attr;
+    scratch->size = size;
+
+    return 0;
+}
+
+
+/*
+ * Make room for at least `size` attributes
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+attrlist_reserve(tdi_attrlist_t *attrs, Py_ssize_t size)
+{
+    tdi_attr_t *attr;
+
+    if (size <= attrs->size)
+        return 0;
+
+    if (size < attrs->size * 2)
+        size = attrs->size * 2;
+    if ((size_t)size > PY_SSIZE_T_MAX / sizeof *attr) {
+        LCOV_EXCL_START
+
+        PyErr_SetNone(PyExc_MemoryError);
+        return -1;
+
+        LCOV_EXCL_STOP
     }
 
-    index = current->index + 1;
-    if (index >= ATTR_CHUNK_SIZE) {
-        if (!(next = PyMem_Malloc(sizeof *next))) {
+    if (attrs->attr == attrs->small) {
+        if (attrs->scratch && !attrs->scratch->in_use) {
+            if (-1 == attrlist_reserve_scratch(attrs->scratch, size))
+                LCOV_EXCL_LINE_RETURN(-1);
+            attr = attrs->scratch->attr;
+            size = attrs->scratch->size;
+            attrs->scratch->in_use = 1;
+        }
+        else if (!(attr = PyMem_Malloc((size_t)size * sizeof *attr))) {
             LCOV_EXCL_START
 
             PyErr_SetNone(PyExc_MemoryError);
-            goto error_kv;
+            return -1;
 
             LCOV_EXCL_STOP
         }
-        next->next = NULL;
-        next->index = index = 0;
-
-        current->next = next;
-        current = root->last = next;
+        (void)memcpy(attr, attrs->small,
+                     (size_t)attrs->length * sizeof *attr);
     }
-    else {
-        current->index = index;
+    else if (USES_SCRATCH(attrs)) {
+        if (-1 == attrlist_reserve_scratch(attrs->scratch, size))
+            LCOV_EXCL_LINE_RETURN(-1);
+        attr = attrs->scratch->attr;
     }
+    else if (!(attr = PyMem_Realloc(attrs->attr,
+                                    (size_t)size * sizeof *attr))) {
+        LCOV_EXCL_START
 
-    attr = &current->attr[index];
-    attr->key.obj = NULL;
-    attr->value.obj = NULL;
+        PyErr_SetNone(PyExc_MemoryError);
+        return -1;
 
-#ifdef EXT2
-    if (!PyBytes_Check(key)) {
-        PyErr_SetString(PyExc_TypeError, "expected bytes");
-        goto error_kv;
+        LCOV_EXCL_STOP
     }
-#endif
-    if (-1 == PyBytes_AsStringAndSize(key, &attr->key.bytes,
-                                      &attr->key.length))
-        goto error_kv;
+
+    attrs->attr = attr;
+    attrs->size = size;
+
+    return 0;
+}
+
+
+/*
+ * Add attr to attrlist
+ *
+ * key and value are stolen, regardless of success.
+ *
+ * Return -1 on error, 0 on success
+ */
+int
+tdi_attrlist_add(tdi_attrlist_t *attrs, PyObject *key, PyObject *value)
+{
+    tdi_attr_t *attr;
+
+    if (attrs->length >= attrs->size) {
+        if (-1 == attrlist_reserve(attrs, attrs->length + 1))
+            LCOV_EXCL_LINE_GOTO(error_kv);
+    }
+    attr = &attrs->attr[attrs->length];
+
+    if (-1 == tdi_bytestr_init(&attr->key, key))
+        goto error_value;
 
     if (value == Py_None) {
         Py_DECREF(value);
+        attr->value.obj = NULL;
         attr->value.bytes = NULL;
+        attr->value.view = NULL;
     }
-#ifdef EXT2
-    else if (!PyBytes_Check(value)) {
-        PyErr_SetString(PyExc_TypeError, "expected bytes");
-        goto error_kv;
+    else if (-1 == tdi_bytestr_init(&attr->value, value)) {
+        tdi_bytestr_clear(&attr->key);
+        return -1;
     }
-#endif
-    else if (-1 == PyBytes_AsStringAndSize(value, &attr->value.bytes,
-                                           &attr->value.length))
-        goto error_kv;
 
-    attr->key.obj = key;
-    attr->value.obj = value;
+    ++attrs->length;
     return 0;
 
 error_kv:
-    Py_DECREF(value);
+    LCOV_EXCL_START
     Py_DECREF(key);
+    LCOV_EXCL_STOP
+error_value:
+    Py_DECREF(value);
 
     return -1;
 }
 
 
 /*
- * Create attrlist from iter([(key, value), ...])
+ * Split an attribute item into key and value
  *
- * Return -1 on error, 0 on sucess
- * result_ contains the result. may be NULL.
+ * Return -1 on error, 0 on success (key and value are new references)
  */
-int
-tdi_attrlist_from_iterable(PyObject *attr_, tdi_attrlist_t **result_)
+static int
+attrlist_item(PyObject *item, PyObject **key_, PyObject **value_)
 {
-    PyObject *iter, *item, *itemiter, *first, *second, *tmp;
-    tdi_attrlist_t *result = NULL;
+    PyObject *itemiter, *first, *second, *tmp;
+
+    if (PyTuple_CheckExact(item) && PyTuple_GET_SIZE(item) == 2) {
+        first = PyTuple_GET_ITEM(item, 0);
+        second = PyTuple_GET_ITEM(item, 1);
+        Py_INCREF(first);
+        Py_INCREF(second);
+        *key_ = first;
+        *value_ = second;
+        return 0;
+    }
 
-    if (!(iter = PyObject_GetIter(attr_)))
+    if (!(itemiter = PyObject_GetIter(item)))
         return -1;
-
-    while ((item = PyIter_Next(iter))) {
-        if (!(itemiter = PyObject_GetIter(item)))
-            goto error_item;
-        if (!(first = PyIter_Next(itemiter))) {
-            if (!PyErr_Occurred())
-                PyErr_SetString(PyExc_ValueError,
-                                "Expected iterator of length 2");
-            goto error_itemiter;
-        }
-        if (!(second = PyIter_Next(itemiter))) {
-            if (!PyErr_Occurred())
-                PyErr_SetString(PyExc_ValueError,
-                                "Expected iterator of length 2");
-            goto error_first;
-        }
-        if (!(tmp = PyIter_Next(itemiter))) {
-            if (PyErr_Occurred())
-                goto error_second;
-        }
-        else {
-            Py_DECREF(tmp);
+    if (!(first = PyIter_Next(itemiter))) {
+        if (!PyErr_Occurred())
+            PyErr_SetString(PyExc_ValueError,
+                            "Expected iterator of length 2");
+        goto error_itemiter;
+    }
+    if (!(second = PyIter_Next(itemiter))) {
+        if (!PyErr_Occurred())
             PyErr_SetString(PyExc_ValueError,
                             "Expected iterator of length 2");
+        goto error_first;
+    }
+    if (!(tmp = PyIter_Next(itemiter))) {
+        if (PyErr_Occurred())
             goto error_second;
-        }
-        Py_DECREF(itemiter);
-        Py_DECREF(item);
-        if (-1 == tdi_attrlist_add(&result, first, second))
-            goto error_iter;
     }
-    if (PyErr_Occurred())
-        goto error_iter;
-    Py_DECREF(iter);
+    else {
+        Py_DECREF(tmp);
+        PyErr_SetString(PyExc_ValueError,
+                        "Expected iterator of length 2");
+        goto error_second;
+    }
+    Py_DECREF(itemiter);
 
-    *result_ = result;
+    *key_ = first;
+    *value_ = second;
     return 0;
 
 error_second:
@@ -216,60 +286,167 @@ error_first:
     Py_DECREF(first);
 error_itemiter:
     Py_DECREF(itemiter);
-error_item:
-    Py_DECREF(item);
-error_iter:
-    Py_DECREF(iter);
-
-    tdi_attrlist_clear(&result);
 
     return -1;
 }
 
 
 /*
- * Init attribute iterator from attrlist
+ * Fill attrlist from a list or tuple
  *
- * Return -1 on error, 0 on success
+ * Return -1 on error, 0 on sucess
  */
-int
-tdi_attrlist_iter_init(tdi_attrlist_iter_t *iter, tdi_attrlist_t *attrs)
+static int
+attrlist_from_sequence(PyObject *attr_, tdi_attrlist_t *result)
 {
-    iter->current = &attrs->first;
-    iter->index = -1;
+    PyObject *item, *key, *value;
+    Py_ssize_t j;
+
+    if (-1 == attrlist_reserve(result, PySequence_Fast_GET_SIZE(attr_)))
+        LCOV_EXCL_LINE_RETURN(-1);
+
+    /* The size is re-checked, the list may change while unpacking items */
+    for (j = 0; j < PySequence_Fast_GET_SIZE(attr_); ++j) {
+        item = PySequence_Fast_GET_ITEM(attr_, j);
+        Py_INCREF(item);
+        if (-1 == attrlist_item(item, &key, &value)) {
+            Py_DECREF(item);
+            return -1;
+        }
+        Py_DECREF(item);
+        if (-1 == tdi_attrlist_add(result, key, value))
+            return -1;
+    }
 
     return 0;
 }
 
 
 /*
- * Get next attr from attrlist iterator
+ * Fill attrlist from a dict
  *
- * Return -1 on error, 0 on success, attr is set NULL if exhausted.
+ * Return -1 on error, 0 on sucess
  */
-int
-tdi_attrlist_iter_next(tdi_attrlist_iter_t *iter, tdi_attr_t **attr_)
+static int
+attrlist_from_dict(PyObject *attr_, tdi_attrlist_t *result)
 {
-    tdi_attr_t *attr = NULL;
-    tdi_attrlist_chunk_t *current;
-    int index;
-
-    while ((current = iter->current)) {
-        index = iter->index + 1;
-        if (index > current->index) {
-            iter->current = current->next;
-            iter->index = -1;
-        }
-        else {
-            attr = &current->attr[index];
-            iter->index = index;
-            break;
-        }
+    PyObject *key, *value;
+    Py_ssize_t pos = 0;
+
+    if (-1 == attrlist_reserve(result, PyDict_Size(attr_)))
+        LCOV_EXCL_LINE_RETURN(-1);
+
+    /* PyDict_Next stays safe, even if a buffer exporter changes the dict */
+    while (PyDict_Next(attr_, &pos, &key, &value)) {
+        Py_INCREF(key);
+        Py_INCREF(value);
+        if (-1 == tdi_attrlist_add(result, key, value))
+            return -1;
     }
 
-    *attr_ = attr;
     return 0;
 }
 
 
+/*
+ * Fill attrlist from a mapping (via its items method)
+ *
+ * Return -1 on error, 0 on sucess
+ */
+static int
+attrlist_from_mapping(PyObject *attr_, tdi_attrlist_t *result)
+{
+    PyObject *items, *seq;
+    int res;
+
+    if (!(items = PyObject_CallMethod(attr_, "items", NULL)))
+        return -1;
+    seq = PySequence_Fast(items, "items() must return an iterable");
+    Py_DECREF(items);
+    if (!seq)
+        return -1;
 
+    res = attrlist_from_sequence(seq, result);
+    Py_DECREF(seq);
+
+    return res;
+}
+
+
+/*
+ * Check if the object should be treated as a mapping
+ *
+ * Return -1 on error, 0 if not, 1 if yes
+ */
+static int
+attrlist_is_mapping(PyObject *attr_)
+{
+    PyObject *keys;
+
+    if (PyDict_Check(attr_))
+        return 1;
+
+    if (!(keys = PyObject_GetAttrString(attr_, "keys"))) {
+        if (!PyErr_ExceptionMatches(PyExc_AttributeError))
+            return -1;
+        PyErr_Clear();
+        return 0;
+    }
+    Py_DECREF(keys);
+
+    return 1;
+}
+
+
+/*
+ * Fill attrlist from iter([(key, value), ...]) or a mapping
+ *
+ * Return -1 on error, 0 on sucess
+ */
+int
+tdi_attrlist_from_iterable(PyObject *attr_, tdi_attrlist_t *result)
+{
+    PyObject *iter, *item, *key, *value;
+    int res;
+
+    if (PyList_CheckExact(attr_) || PyTuple_CheckExact(attr_)) {
+        if (-1 == attrlist_from_sequence(attr_, result))
+            goto error;
+        return 0;
+    }
+    if (PyDict_CheckExact(attr_)) {
+        if (-1 == attrlist_from_dict(attr_, result))
+            goto error;
+        return 0;
+    }
+    if ((res = attrlist_is_mapping(attr_))) {
+        if (res == -1 || -1 == attrlist_from_mapping(attr_, result))
+            goto error;
+        return 0;
+    }
+
+    if (!(iter = PyObject_GetIter(attr_)))
+        return -1;
+
+    while ((item = PyIter_Next(iter))) {
+        if (-1 == attrlist_item(item, &key, &value))
+            goto error_item;
+        Py_DECREF(item);
+        if (-1 == tdi_attrlist_add(result, key, value))
+            goto error_iter;
+    }
+    if (PyErr_Occurred())
+        goto error_iter;
+    Py_DECREF(iter);
+
+    return 0;
+
+error_item:
+    Py_DECREF(item);
+error_iter:
+    Py_DECREF(iter);
+error:
+    tdi_attrlist_clear(result);
+
+    return -1;
+}
@@ -15,6 +15,8 @@
  * limitations under the License.
  */
 
+#include "args.h"
+#include "codec.h"
 #include "markup/text/decoder.h"
 
 /*
@@ -24,46 +26,191 @@ typedef struct {
     PyObject_HEAD
     PyObject *weakreflist;
 
-    PyObject *encoding;
+    tdi_codec_t codec;
+    PyObject *names;            /* name cache (dict) or NULL */
+    Py_ssize_t names_max;       /* maximum size of the name cache */
 } tdi_text_decoder_t;
 
 
+/*
+ * Raw input (bytes or any object providing the buffer protocol)
+ */
+typedef struct {
+    PyObject *obj;       /* bytes object matching the input exactly or NULL */
+    Py_buffer view;      /* acquired buffer (view.obj is NULL if unused) */
+    const char *source;
+    Py_ssize_t length;
+} input_t;
+
+
+/*
+ * Convert an optional offset or length argument
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+input_size(PyObject *value, const char *name, Py_ssize_t *result)
+{
+    if (!value || value == Py_None)
+        return 0;
+
+    if (-1 == (*result = PyNumber_AsSsize_t(value, PyExc_OverflowError))
+        && PyErr_Occurred())
+        return -1;
+
+    if (*result < 0) {
+        PyErr_Format(PyExc_ValueError, "%s must not be negative", name);
+        return -1;
+    }
+
+    return 0;
+}
+
+
+/*
+ * Initialize input from a value and optional range
+ *
+ * The range is clamped to the available data.
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+input_init(input_t *input, PyObject *value, PyObject *offset_,
+           PyObject *length_)
+{
+    Py_ssize_t offset = 0, length = -1;
+
+    if (-1 == input_size(offset_, "offset", &offset))
+        return -1;
+    if (-1 == input_size(length_, "length", &length))
+        return -1;
+
+    input->view.obj = NULL;
+    if (PyBytes_Check(value)) {
+        input->obj = value;
+        input->source = PyBytes_AS_STRING(value);
+        input->length = PyBytes_GET_SIZE(value);
+    }
+    else if (PyUnicode_Check(value)) {
+        PyErr_SetString(PyExc_TypeError, "decoding str is not supported");
+        return -1;
+    }
+    else {
+        if (-1 == PyObject_GetBuffer(value, &input->view, PyBUF_SIMPLE))
+            return -1;
+        input->obj = NULL;
+        input->source = input->view.buf;
+        input->length = input->view.len;
+    }
+
+    if (offset > input->length)
+        offset = input->length;
+    input->source += offset;
+    input->length -= offset;
+    if (length >= 0 && length < input->length)
+        input->length = length;
+
+    if (input->obj && input->length != PyBytes_GET_SIZE(input->obj))
+        input->obj = NULL;
+
+    return 0;
+}
+
+
+/*
+ * Release input
+ */
+static void
+input_clear(input_t *input)
+{
+    if (input->view.obj)
+        PyBuffer_Release(&input->view);
+}
+
+
+/*
+ * Decode input
+ */
 static PyObject *
-decode(PyObject *value, PyObject *encoding, PyObject *errors)
+input_decode(input_t *input, tdi_codec_t *codec, PyObject *errors)
 {
-    const char *encoding_s, *errors_s = "strict";
+    const char *errors_s;
 
-#ifdef EXT2
-    if (!(encoding_s = PyString_AsString(encoding)))
-        LCOV_EXCL_LINE_RETURN(NULL);
-    if (errors) {
-        if (!(errors_s = PyString_AsString(errors)))
-            return NULL;
+    if (input->obj)
+        return tdi_codec_decode(codec, input->obj, errors);
+
+    if (!(errors_s = tdi_codec_errors(errors)))
+        return NULL;
+
+    return tdi_codec_decode_string(codec, input->source, input->length,
+                                   errors_s);
+}
+
+
+/*
+ * Decode an attribute value without backslashes directly from the input
+ *
+ * The stripped value is decoded strictly. Undecodable input is left to the
+ * generic path, which decodes the complete value (like the Python
+ * implementation does), so error handlers and error positions see the
+ * same data.
+ *
+ * Return -1 on error, 1 if not applicable, 0 on success (with the
+ * decoded value stored in *result)
+ */
+static int
+attribute_native(input_t *input, tdi_codec_t *codec, PyObject **result)
+{
+    const char *source;
+    Py_ssize_t length;
+
+    if (codec->kind == TDI_CODEC_OTHER)
+        return 1;
+
+    source = input->source;
+    length = input->length;
+
+    /* Strip quotes (only if the last character is a single byte) */
+    if (length && (*source == '"' || *source == '\'')) {
+        if (length <= 2 || (source[length - 1] & 0x80))
+            return 1;
+        ++source;
+        length -= 2;
     }
-#else
-    if (!(encoding_s = PyUnicode_AsUTF8(encoding)))
-        LCOV_EXCL_LINE_RETURN(NULL);
-    if (errors) {
-        if (!(errors_s = PyUnicode_AsUTF8(errors)))
-            return NULL;
+
+    if (memchr(source, '\\', (size_t)length))
+        return 1;
+
+    if (!(*result = tdi_codec_decode_string(codec, source, length,
+                                            "strict"))) {
+        if (!PyErr_ExceptionMatches(PyExc_UnicodeDecodeError))
+            return -1;
+        PyErr_Clear();
+        return 1;
     }
-#endif
 
-    return PyUnicode_FromEncodedObject(value, encoding_s, errors_s);
+    return 0;
 }
 
 
 static PyObject *
-attribute(PyObject *value, PyObject *encoding, PyObject *errors)
+attribute(input_t *input, tdi_codec_t *codec, PyObject *errors)
 {
-    PyObject *result;
+    PyObject *value, *result;
     unsigned char *source, *target;
     Py_ssize_t js, jt, length, slength;
     enum PyUnicode_Kind kind;
     EXT_UNI_CP c;
+    int res;
+    EXT_UNI_KIND_DECL(tkind)
     EXT_UNI_MAX_DECL(m)
 
-    if (!(value = decode(value, encoding, errors)))
+    if (-1 == (res = attribute_native(input, codec, &result)))
+        return NULL;
+    else if (!res)
+        return result;
+
+    if (!(value = input_decode(input, codec, errors)))
         return NULL;
 
     length = PyUnicode_GET_LENGTH(value);
@@ -105,13 +252,203 @@ attribute(PyObject *value, PyObject *encoding, PyObject *errors)
         LCOV_EXCL_STOP
     }
 
-    /* 3: Write */
+    /* 3: Write (the result may be narrower, without the quotes) */
     target = PyUnicode_DATA(result);
+    EXT_UNI_KIND_SET(tkind, PyUnicode_KIND(result))
     for (js=0, jt=0; js < slength; ) {
         c = PyUnicode_READ(kind, source, js); ++js;
         if (c == U('\\') && js < slength) {
             c = PyUnicode_READ(kind, source, js); ++js;
         }
+        PyUnicode_WRITE(tkind, target, jt, c); ++jt;
+    }
+    Py_DECREF(value);
+
+    return result;
+}
+
+
+/*
+ * Normalize a name (map to the cached canonical string)
+ *
+ * Return a new reference or NULL on error
+ */
+static PyObject *
+normalize(tdi_text_decoder_t *self, PyObject *name)
+{
+    PyObject *result;
+
+    if (!self->names || !PyUnicode_CheckExact(name))
+        return Py_INCREF(name), name;
+
+    if ((result = PyDict_GetItem(self->names, name)))
+        return Py_INCREF(result), result;
+
+    Py_INCREF(name);
+    if (PyDict_Size(self->names) < self->names_max) {
+#ifdef EXT3
+        PyUnicode_InternInPlace(&name);
+#endif
+        if (-1 == PyDict_SetItem(self->names, name, name)) {
+            LCOV_EXCL_START
+
+            Py_DECREF(name);
+            return NULL;
+
+            LCOV_EXCL_STOP
+        }
+    }
+
+    return name;
+}
+
+
+static PyObject *
+attributes(tdi_text_decoder_t *self, PyObject *attr, PyObject *errors)
+{
+    PyObject *iter, *item, *pair, *result, *name, *value;
+    input_t input;
+
+    if (!(iter = PyObject_GetIter(attr)))
+        return NULL;
+
+    if (!(result = PyList_New(0)))
+        LCOV_EXCL_LINE_GOTO(error_iter);
+
+    while ((item = PyIter_Next(iter))) {
+        pair = PySequence_Fast(item, "Expected attribute sequence");
+        Py_DECREF(item);
+        if (!pair)
+            goto error;
+        if (PySequence_Fast_GET_SIZE(pair) != 2) {
+            PyErr_SetString(PyExc_ValueError,
+                            "Expected attribute of length 2");
+            goto error_pair;
+        }
+
+        if (-1 == input_init(&input, PySequence_Fast_GET_ITEM(pair, 0),
+                             NULL, NULL))
+            goto error_pair;
+        value = input_decode(&input, &self->codec, errors);
+        input_clear(&input);
+        if (!value)
+            goto error_pair;
+        name = normalize(self, value);
+        Py_DECREF(value);
+        if (!name)
+            goto error_pair;
+
+        value = PySequence_Fast_GET_ITEM(pair, 1);
+        if (value == Py_None) {
+            Py_INCREF(value);
+        }
+        else {
+            if (-1 == input_init(&input, value, NULL, NULL))
+                goto error_name;
+            value = attribute(&input, &self->codec, errors);
+            input_clear(&input);
+            if (!value)
+                goto error_name;
+        }
+        Py_DECREF(pair);
+
+        if (!(item = PyTuple_New(2))) {
+            LCOV_EXCL_START
+
+            Py_DECREF(value);
+            Py_DECREF(name);
+            goto error;
+
+            LCOV_EXCL_STOP
+        }
+        PyTuple_SET_ITEM(item, 0, name);
+        PyTuple_SET_ITEM(item, 1, value);
+
+        if (-1 == PyList_Append(result, item)) {
+            LCOV_EXCL_START
+
+            Py_DECREF(item);
+            goto error;
+
+            LCOV_EXCL_STOP
+        }
+        Py_DECREF(item);
+    }
+    if (PyErr_Occurred())
+        goto error;
+
+    Py_DECREF(iter);
+    return result;
+
+error_name:
+    Py_DECREF(name);
+error_pair:
+    Py_DECREF(pair);
+error:
+    Py_DECREF(result);
+error_iter:
+    Py_DECREF(iter);
+    return NULL;
+}
+
+
+static PyObject *
+content(input_t *input, tdi_codec_t *codec, PyObject *errors)
+{
+    PyObject *value, *result;
+    unsigned char *source, *target;
+    Py_ssize_t js, jt, length, slength;
+    enum PyUnicode_Kind kind;
+    EXT_UNI_CP c;
+    EXT_UNI_MAX_DECL(m)
+
+    /* Fast return: nothing escaped (all native codecs are ASCII based) */
+    if (codec->kind != TDI_CODEC_OTHER
+        && !memchr(input->source, '[', (size_t)input->length))
+        return input_decode(input, codec, errors);
+
+    if (!(value = input_decode(input, codec, errors)))
+        return NULL;
+
+    kind = PyUnicode_KIND(value);
+    source = PyUnicode_DATA(value);
+    length = slength = PyUnicode_GET_LENGTH(value);
+
+    if (kind == PyUnicode_1BYTE_KIND
+        && !memchr(source, '[', (size_t)slength))
+        return value;
+
+    /* 1: Inspect */
+    EXT_UNI_MAX_SET(m, 0)
+    for (js=0; js < slength; ) {
+        c = PyUnicode_READ(kind, source, js); ++js;
+        if (c == U('[') && js < slength
+            && PyUnicode_READ(kind, source, js) == U(']')) {
+            ++js;
+            --length;
+        }
+        EXT_UNI_MAX_LEVEL(m, c);
+    }
+    if (length == slength)
+        return value;
+
+    /* 2: Allocate */
+    if (!(result = PyUnicode_New(length, m))) {
+        LCOV_EXCL_START
+
+        Py_DECREF(value);
+        return NULL;
+
+        LCOV_EXCL_STOP
+    }
+
+    /* 3: Write */
+    target = PyUnicode_DATA(result);
+    for (js=0, jt=0; js < slength; ) {
+        c = PyUnicode_READ(kind, source, js); ++js;
+        if (c == U('[') && js < slength
+            && PyUnicode_READ(kind, source, js) == U(']'))
+            ++js;
         PyUnicode_WRITE(kind, target, jt, c); ++jt;
     }
     Py_DECREF(value);
@@ -119,6 +456,64 @@ attribute(PyObject *value, PyObject *encoding, PyObject *errors)
     return result;
 }
 
+
+/*
+ * Call an input function with arguments (value, errors, offset, length)
+ */
+static PyObject *
+with_input(PyObject *(*func)(input_t *, tdi_codec_t *, PyObject *),
+           tdi_codec_t *codec, PyObject **argv)
+{
+    PyObject *result;
+    input_t input;
+
+    if (-1 == input_init(&input, argv[0], argv[2], argv[3]))
+        return NULL;
+
+    result = func(&input, codec, argv[1]);
+    input_clear(&input);
+
+    return result;
+}
+
+/*
+ * Decode a char buffer directly with a TextDecoder
+ *
+ * Return the decoded value or NULL on error
+ */
+PyObject *
+tdi_text_decoder_string(PyObject *decoder, tdi_text_decode_t what,
+                        const char *source, Py_ssize_t length,
+                        PyObject *errors)
+{
+    tdi_text_decoder_t *self = (tdi_text_decoder_t *)decoder;
+    PyObject *name, *result;
+    input_t input;
+
+    input.obj = NULL;
+    input.view.obj = NULL;
+    input.source = source;
+    input.length = length;
+
+    switch (what) {
+    case TDI_TEXT_DECODE_ATTRIBUTE:
+        return attribute(&input, &self->codec, errors);
+
+    case TDI_TEXT_DECODE_CONTENT:
+        return content(&input, &self->codec, errors);
+
+    default:
+        break;
+    }
+
+    if (!(name = input_decode(&input, &self->codec, errors)))
+        return NULL;
+    result = normalize(self, name);
+    Py_DECREF(name);
+
+    return result;
+}
+
 /* ------------------ BEGIN TDI_TextDecoder DEFINITION ----------------- */
 
 PyDoc_STRVAR(TDI_TextDecoder_normalize__doc__,
@@ -127,76 +522,170 @@ PyDoc_STRVAR(TDI_TextDecoder_normalize__doc__,
 :See: `abstract.Decoder`");
 
 static PyObject *
-TDI_TextDecoder_normalize(tdi_text_decoder_t *self, PyObject *args,
-                          PyObject *kwds)
+TDI_TextDecoder_normalize(tdi_text_decoder_t *self, TDI_ARGS_DEF)
 {
-    PyObject *name;
-    static char *kwlist[] = {"name", NULL};
+    static const char * const kwlist[] = {"name", NULL};
+    static const tdi_args_t spec = {"normalize", kwlist, 1};
+    PyObject *argv[1];
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O", kwlist,
-                                     &name))
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
         return NULL;
 
-    return Py_INCREF(name), name;
+    return normalize(self, argv[0]);
 }
 
 
 PyDoc_STRVAR(TDI_TextDecoder_decode__doc__,
-"decode(self, value, errors='strict')\n\
+"decode(self, value, errors='strict', offset=0, length=None)\n\
 \n\
 :See: `abstract.Decoder`");
 
 static PyObject *
-TDI_TextDecoder_decode(tdi_text_decoder_t *self, PyObject *args,
-                       PyObject *kwds)
+TDI_TextDecoder_decode(tdi_text_decoder_t *self, TDI_ARGS_DEF)
 {
-    PyObject *value, *errors = NULL;
-    static char *kwlist[] = {"value", "errors", NULL};
+    static const char * const kwlist[] = {
+        "value", "errors", "offset", "length", NULL
+    };
+    static const tdi_args_t spec = {"decode", kwlist, 1};
+    PyObject *argv[4] = {NULL, NULL, NULL, NULL};
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|O", kwlist,
-                                     &value, &errors))
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
         return NULL;
 
-    return decode(value, self->encoding, errors);
+    return with_input(input_decode, &self->codec, argv);
 }
 
 
 PyDoc_STRVAR(TDI_TextDecoder_attribute__doc__,
-"attribute(self, value, errors='strict')\n\
+"attribute(self, value, errors='strict', offset=0, length=None)\n\
 \n\
 :See: `abstract.Decoder`");
 
 static PyObject *
-TDI_TextDecoder_attribute(tdi_text_decoder_t *self, PyObject *args,
-                          PyObject *kwds)
+TDI_TextDecoder_attribute(tdi_text_decoder_t *self, TDI_ARGS_DEF)
 {
-    PyObject *value, *errors = NULL;
-    static char *kwlist[] = {"value", "errors", NULL};
+    static const char * const kwlist[] = {
+        "value", "errors", "offset", "length", NULL
+    };
+    static const tdi_args_t spec = {"attribute", kwlist, 1};
+    PyObject *argv[4] = {NULL, NULL, NULL, NULL};
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|O", kwlist,
-                                     &value, &errors))
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
         return NULL;
 
-    return attribute(value, self->encoding, errors);
+    return with_input(attribute, &self->codec, argv);
+}
+
+
+PyDoc_STRVAR(TDI_TextDecoder_attributes__doc__,
+"attributes(self, attr, errors='strict')\n\
+\n\
+:See: `abstract.Decoder`");
+
+static PyObject *
+TDI_TextDecoder_attributes(tdi_text_decoder_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {"attr", "errors", NULL};
+    static const tdi_args_t spec = {"attributes", kwlist, 1};
+    PyObject *argv[2] = {NULL, NULL};
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+
+    return attributes(self, argv[0], argv[1]);
+}
+
+
+PyDoc_STRVAR(TDI_TextDecoder_content__doc__,
+"content(self, value, errors='strict', offset=0, length=None)\n\
+\n\
+:See: `abstract.Decoder`");
+
+static PyObject *
+TDI_TextDecoder_content(tdi_text_decoder_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {
+        "value", "errors", "offset", "length", NULL
+    };
+    static const tdi_args_t spec = {"content", kwlist, 1};
+    PyObject *argv[4] = {NULL, NULL, NULL, NULL};
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+
+    return with_input(content, &self->codec, argv);
+}
+
+
+PyDoc_STRVAR(TDI_TextDecoder_incremental__doc__,
+"incremental(self, kind='decode', errors='strict')\n\
+\n\
+:See: `abstract.Decoder`");
+
+static PyObject *
+TDI_TextDecoder_incremental(tdi_text_decoder_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {"kind", "errors", NULL};
+    static const tdi_args_t spec = {"incremental", kwlist, 0};
+    PyObject *argv[2] = {NULL, NULL};
+    PyObject *module, *cls, *cargs, *ckwds, *result = NULL;
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+
+    /* The incremental decoder is implemented in python */
+    if (!(module = PyImport_ImportModule("tdi.markup.text.decoder")))
+        LCOV_EXCL_LINE_RETURN(NULL);
+    cls = PyObject_GetAttrString(module, "IncrementalTextDecoder");
+    Py_DECREF(module);
+    if (!cls)
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    if (!(ckwds = PyDict_New()))
+        LCOV_EXCL_LINE_GOTO(error_cls);
+    if (argv[0] && -1 == PyDict_SetItemString(ckwds, "kind", argv[0]))
+        LCOV_EXCL_LINE_GOTO(error_kwds);
+    if (argv[1] && -1 == PyDict_SetItemString(ckwds, "errors", argv[1]))
+        LCOV_EXCL_LINE_GOTO(error_kwds);
+    if (!(cargs = PyTuple_Pack(1, (PyObject *)self)))
+        LCOV_EXCL_LINE_GOTO(error_kwds);
+
+    result = PyObject_Call(cls, cargs, ckwds);
+    Py_DECREF(cargs);
+
+error_kwds:
+    Py_DECREF(ckwds);
+error_cls:
+    Py_DECREF(cls);
+    return result;
 }
 
 
 static struct PyMethodDef TDI_TextDecoder_methods[] = {
     {"normalize",
-     (PyCFunction)TDI_TextDecoder_normalize,          METH_VARARGS
-                                                    | METH_KEYWORDS,
+     (PyCFunction)TDI_TextDecoder_normalize,          TDI_ARGS_FLAGS,
      TDI_TextDecoder_normalize__doc__},
 
     {"decode",
-     (PyCFunction)TDI_TextDecoder_decode,             METH_VARARGS
-                                                    | METH_KEYWORDS,
+     (PyCFunction)TDI_TextDecoder_decode,             TDI_ARGS_FLAGS,
      TDI_TextDecoder_decode__doc__},
 
     {"attribute",
-     (PyCFunction)TDI_TextDecoder_attribute,          METH_VARARGS
-                                                    | METH_KEYWORDS,
+     (PyCFunction)TDI_TextDecoder_attribute,          TDI_ARGS_FLAGS,
      TDI_TextDecoder_attribute__doc__},
 
+    {"attributes",
+     (PyCFunction)TDI_TextDecoder_attributes,         TDI_ARGS_FLAGS,
+     TDI_TextDecoder_attributes__doc__},
+
+    {"content",
+     (PyCFunction)TDI_TextDecoder_content,            TDI_ARGS_FLAGS,
+     TDI_TextDecoder_content__doc__},
+
+    {"incremental",
+     (PyCFunction)TDI_TextDecoder_incremental,        TDI_ARGS_FLAGS,
+     TDI_TextDecoder_incremental__doc__},
+
     {NULL, NULL}  /* Sentinel */
 };
 
@@ -204,12 +693,18 @@ static int
 TDI_TextDecoder_setencoding(tdi_text_decoder_t *self, PyObject *value,
                             void *closure)
 {
-    PyObject *encoding = PyObject_Str(value);
-    if (!encoding)
+    tdi_codec_t codec;
+
+    if (!value) {
+        PyErr_SetString(PyExc_AttributeError, "cannot delete encoding");
         return -1;
+    }
 
-    Py_CLEAR(self->encoding);
-    self->encoding = encoding;
+    if (-1 == tdi_codec_init(&codec, value))
+        return -1;
+
+    tdi_codec_clear(&self->codec);
+    self->codec = codec;
 
     return 0;
 }
@@ -217,7 +712,7 @@ TDI_TextDecoder_setencoding(tdi_text_decoder_t *self, PyObject *value,
 static PyObject *
 TDI_TextDecoder_getencoding(tdi_text_decoder_t *self, void *closure)
 {
-    return Py_INCREF(self->encoding), self->encoding;
+    return Py_INCREF(self->codec.encoding), self->codec.encoding;
 }
 
 static PyGetSetDef TDI_TextDecoder_getset[] = {
@@ -232,28 +727,47 @@ static PyGetSetDef TDI_TextDecoder_getset[] = {
 static PyObject *
 TDI_TextDecoder_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
 {
-    static char *kwlist[] = {"encoding", NULL};
-    PyObject *encoding;
+    static char *kwlist[] = {"encoding", "name_cache", NULL};
+    PyObject *encoding, *names = NULL;
     tdi_text_decoder_t *self;
+    tdi_codec_t codec;
+    Py_ssize_t names_max = 0;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O", kwlist, &encoding))
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|n", kwlist, &encoding,
+                                     &names_max))
         return NULL;
 
-    if (!(encoding = PyObject_Str(encoding)))
+    if (names_max < 0) {
+        PyErr_SetString(PyExc_ValueError,
+                        "name_cache must not be negative");
         return NULL;
+    }
+    else if (names_max > 0) {
+        if (!(names = PyDict_New()))
+            LCOV_EXCL_LINE_RETURN(NULL);
+    }
+
+    if (-1 == tdi_codec_init(&codec, encoding))
+        goto error_names;
 
     if (!(self = GENERIC_ALLOC(type))) {
         LCOV_EXCL_START
 
-        Py_DECREF(encoding);
-        return NULL;
+        tdi_codec_clear(&codec);
+        goto error_names;
 
         LCOV_EXCL_STOP
     }
 
-    self->encoding = encoding;
+    self->codec = codec;
+    self->names = names;
+    self->names_max = names_max;
 
     return (PyObject *)self;
+
+error_names:
+    Py_XDECREF(names);
+    return NULL;
 }
 
 LCOV_EXCL_START
@@ -261,9 +775,9 @@ static int
 TDI_TextDecoder_traverse(tdi_text_decoder_t *self, visitproc visit,
                          void *arg)
 {
-    Py_VISIT(self->encoding);
+    Py_VISIT(self->names);
 
-    return 0;
+    return tdi_codec_traverse(&self->codec, visit, arg);
 }
 LCOV_EXCL_STOP
 
@@ -273,7 +787,8 @@ TDI_TextDecoder_clear(tdi_text_decoder_t *self)
     if (self->weakreflist)
         PyObject_ClearWeakRefs((PyObject *)self);
 
-    Py_CLEAR(self->encoding);
+    tdi_codec_clear(&self->codec);
+    Py_CLEAR(self->names);
 
     return 0;
 }
@@ -281,7 +796,7 @@ TDI_TextDecoder_clear(tdi_text_decoder_t *self)
 DEFINE_GENERIC_DEALLOC(TDI_TextDecoder)
 
 PyDoc_STRVAR(TDI_TextDecoder__doc__,
-"``TextDecoder(encoding)``\n\
+"``TextDecoder(encoding, name_cache=0)``\n\
 \n\
 Decoder for text input");
 
@@ -15,15 +15,64 @@
  * limitations under the License.
  */
 
+#include "args.h"
+#include "buffer.h"
+#include "codec.h"
 #include "length.h"
 #include "markup/attr.h"
 #include "markup/text/encoder.h"
+#include "markup/text/starttag.h"
 
 #define LENGTH_ADD(toadd) do {                      \
     if (-1 == (length = length_add(length, toadd))) \
         return NULL;                                \
 } while(0)
 
+#define SIZE_ADD(toadd) do {                        \
+    if (-1 == (length = length_add(length, toadd))) \
+        return -1;                                  \
+} while(0)
+
+/*
+ * Release the GIL around pure memory loops over large inputs
+ *
+ * Only immutable sources (bytes, unicode) and targets not visible to other
+ * threads yet may be touched in between. No Python API may be called.
+ */
+#define NOGIL_THRESHOLD (64 * 1024)
+
+#define NOGIL_BEGIN(size) {                         \
+    PyThreadState *nogil_save_ = NULL;              \
+    if ((size) >= NOGIL_THRESHOLD)                  \
+        nogil_save_ = PyEval_SaveThread();
+
+#define NOGIL_END                                   \
+    if (nogil_save_)                                \
+        PyEval_RestoreThread(nogil_save_);          \
+}
+
+/*
+ * Value cache entry
+ *
+ * The entries of a value cache form a circular doubly linked list, ordered
+ * from the least to the most recently used one. The list head is part of
+ * the cache. The entries are owned by the cache dict (wrapped in capsules).
+ */
+typedef struct value_entry {
+    struct value_entry *prev;
+    struct value_entry *next;
+    PyObject *key;              /* the value */
+    PyObject *result;           /* the encoded value */
+} value_entry_t;
+
+/*
+ * Value cache (LRU)
+ */
+typedef struct {
+    PyObject *dict;             /* value -> entry capsule or NULL */
+    value_entry_t head;         /* list head */
+} value_lru_t;
+
 /*
  * Object structure for TextEncoder
  */
@@ -31,57 +80,142 @@ typedef struct {
     PyObject_HEAD
     PyObject *weakreflist;
 
-    PyObject *encoding;
+    tdi_codec_t codec;
+    tdi_attrscratch_t scratch;
+
+    PyObject *names;            /* name cache (dict) or NULL */
+    PyObject *endtags;          /* endtag cache (dict) or NULL */
+    Py_ssize_t names_max;       /* maximum size of each cache */
+    Py_ssize_t hits;            /* cache hits */
+    Py_ssize_t misses;          /* cache misses */
+
+    value_lru_t values[3];      /* value caches */
+    Py_ssize_t values_max;      /* maximum size of each value cache */
+    Py_ssize_t values_length;   /* maximum length of cached values */
+    Py_ssize_t value_hits;      /* value cache hits */
+    Py_ssize_t value_misses;    /* value cache misses */
 } tdi_text_encoder_t;
 
+/*
+ * Value cache slots
+ */
+typedef enum {
+    VALUE_ATTRIBUTE,
+    VALUE_CONTENT,
+    VALUE_ESCAPE_CONTENT
+} value_cache_t;
 
-static PyObject *
-encode_starttag(tdi_bytestr_t *name, tdi_attrlist_t *attrs, int closed)
+
+/*
+ * Prepared starttag
+ */
+typedef struct {
+    tdi_bytestr_t name;
+    tdi_attrlist_t attrs;
+    int closed;
+    Py_ssize_t length;
+} starttag_t;
+
+
+/*
+ * Get tag name (bytes or buffer) as bytestr
+ *
+ * The name must be cleared by the caller (tdi_bytestr_clear) on success.
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+tag_name(PyObject *name_, tdi_bytestr_t *name)
 {
-    PyObject *result;
-    tdi_attrlist_iter_t attriter;
-    tdi_attr_t *attr;
-    char *c;
+    Py_INCREF(name_);
+    return tdi_bytestr_init(name, name_);
+}
+
+
+/*
+ * Prepare a starttag - convert arguments and calculate the length
+ *
+ * scratch (may be NULL) provides reusable storage for long attribute lists.
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+starttag_init(starttag_t *tag, PyObject *name_, PyObject *attr_,
+              PyObject *closed_, tdi_attrscratch_t *scratch)
+{
+    tdi_attr_t *attr, *sentinel;
     Py_ssize_t length;
 
-    length = name->length;
-    LENGTH_ADD(closed ? 4 : 2);
-    if (-1 == tdi_attrlist_iter_init(&attriter, attrs))
-        LCOV_EXCL_LINE_RETURN(NULL);
+    tdi_attrlist_init(&tag->attrs, scratch);
+    if (-1 == (tag->closed = PyObject_IsTrue(closed_)))
+        return -1;
 
-    for(;;) {
-        if (-1 == tdi_attrlist_iter_next(&attriter, &attr))
-            LCOV_EXCL_LINE_RETURN(NULL);
-        if (!attr)
-            break;
+    if (-1 == tag_name(name_, &tag->name))
+        return -1;
+
+    if (-1 == tdi_attrlist_from_iterable(attr_, &tag->attrs)) {
+        tdi_bytestr_clear(&tag->name);
+        return -1;
+    }
 
-        LENGTH_ADD(1);
-        LENGTH_ADD(attr->key.length);
+    length = tag->name.length;
+    if (-1 == (length = length_add(length, tag->closed ? 4 : 2)))
+        LCOV_EXCL_LINE_GOTO(error);
+
+    attr = tag->attrs.attr;
+    for (sentinel = attr + tag->attrs.length; attr < sentinel; ++attr) {
+        if (-1 == (length = length_add(length, attr->key.length + 1)))
+            LCOV_EXCL_LINE_GOTO(error);
         if (attr->value.bytes) {
-            LENGTH_ADD(1);
-            LENGTH_ADD(attr->value.length);
+            if (-1 == (length = length_add(length, attr->value.length + 1)))
+                LCOV_EXCL_LINE_GOTO(error);
         }
     }
 
-    if (!(result = PyBytes_FromStringAndSize(NULL, length)))
-        LCOV_EXCL_LINE_RETURN(NULL);
+    tag->length = length;
+    return 0;
 
-    c = PyBytes_AS_STRING(result);
+error:
+    LCOV_EXCL_START
 
-    *c++ = '[';
-    if (closed) *c++ = '[';
-    (void)memcpy(c, name->bytes, (size_t)name->length);
-    c += name->length;
+    tdi_attrlist_clear(&tag->attrs);
+    tdi_bytestr_clear(&tag->name);
+    return -1;
 
-    if (-1 == tdi_attrlist_iter_init(&attriter, attrs))
-        LCOV_EXCL_LINE_GOTO(error_result);
+    LCOV_EXCL_STOP
+}
 
-    for(;;) {
-        if (-1 == tdi_attrlist_iter_next(&attriter, &attr))
-            LCOV_EXCL_LINE_GOTO(error_result);
-        if (!attr)
-            break;
 
+/*
+ * Clear a prepared starttag
+ */
+static void
+starttag_clear(starttag_t *tag)
+{
+    tdi_attrlist_clear(&tag->attrs);
+    tdi_bytestr_clear(&tag->name);
+}
+
+
+/*
+ * Write a prepared starttag
+ *
+ * The target needs to be big enough (see starttag_init).
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+starttag_write(char *c, starttag_t *tag)
+{
+    tdi_attr_t *attr, *sentinel;
+
+    *c++ = '[';
+    if (tag->closed) *c++ = '[';
+    (void)memcpy(c, tag->name.bytes, (size_t)tag->name.length);
+    c += tag->name.length;
+
+    attr = tag->attrs.attr;
+    for (sentinel = attr + tag->attrs.length; attr < sentinel; ++attr) {
         *c++ = ' ';
         (void)memcpy(c, attr->key.bytes, (size_t)attr->key.length);
         c += attr->key.length;
@@ -92,198 +226,630 @@ encode_starttag(tdi_bytestr_t *name, tdi_attrlist_t *attrs, int closed)
         }
     }
 
-    if (closed) *c++ = ']';
+    if (tag->closed) *c++ = ']';
     *c = ']';
 
-    return result;
-
-error_result:
-    LCOV_EXCL_START
-
-    Py_DECREF(result);
-
-    return NULL;
-
-    LCOV_EXCL_STOP
+    return 0;
 }
 
 
-static PyObject *
-encode_endtag(tdi_bytestr_t *name)
+/*
+ * Calculate the length of an endtag
+ *
+ * Return -1 on error
+ */
+static Py_ssize_t
+endtag_length(tdi_bytestr_t *name)
 {
-    PyObject *result;
-    char *c;
     Py_ssize_t length;
 
     length = name->length;
-    LENGTH_ADD(3);
+    SIZE_ADD(3);
+
+    return length;
+}
 
-    if (!(result = PyBytes_FromStringAndSize(NULL, length)))
-        LCOV_EXCL_LINE_RETURN(NULL);
-    c = PyBytes_AS_STRING(result);
 
+/*
+ * Write an endtag
+ *
+ * The target needs to be big enough (see endtag_length).
+ */
+static void
+endtag_write(char *c, tdi_bytestr_t *name)
+{
     *c++ = '[';
     *c++ = '/';
     (void)memcpy(c, name->bytes, (size_t)name->length);
     c += name->length;
     *c = ']';
-
-    return result;
 }
 
+
 /*
- * Encode an object
+ * Look up a cache entry
+ *
+ * Return a new reference or NULL if not found (no exception is set)
  */
 static PyObject *
-do_encode(PyObject *value, PyObject *encoding)
+cache_get(tdi_text_encoder_t *self, PyObject *cache, PyObject *key)
 {
-    const char *encoding_s, *errors_s = "strict";
+    PyObject *result;
 
-#ifdef EXT2
-    if (!PyUnicode_Check(value))
-        return PyObject_Str(value);
+    if ((result = PyDict_GetItem(cache, key))) {
+        ++self->hits;
+        return Py_INCREF(result), result;
+    }
+    ++self->misses;
 
-    if (!(encoding_s = PyString_AsString(encoding)))
-        LCOV_EXCL_LINE_RETURN(NULL);
-    return PyUnicode_AsEncodedString(value, encoding_s, errors_s);
+    return NULL;
+}
 
-#else
-    PyObject *tmp;
 
-    if (PyBytes_Check(value)) {
-        Py_INCREF(value);
-        return value;
-    }
+/*
+ * Store a cache entry, unless the cache is full
+ *
+ * value is stolen and returned (or NULL on error)
+ */
+static PyObject *
+cache_set(tdi_text_encoder_t *self, PyObject *cache, PyObject *key,
+          PyObject *value)
+{
+    if (value && PyDict_Size(cache) < self->names_max) {
+        if (-1 == PyDict_SetItem(cache, key, value)) {
+            LCOV_EXCL_START
 
-    if (!(encoding_s = PyUnicode_AsUTF8(encoding)))
-        LCOV_EXCL_LINE_RETURN(NULL);
+            Py_DECREF(value);
+            return NULL;
+
+            LCOV_EXCL_STOP
+        }
+    }
 
-    if (!(tmp = PyObject_Str(value)))
-        return NULL;
-    value = PyUnicode_AsEncodedString(tmp, encoding_s, errors_s);
-    Py_DECREF(tmp);
     return value;
-#endif
 }
 
 
 /*
- * Encode name
+ * Release a value cache entry (capsule destructor)
  */
-static PyObject *
-encode_name(PyObject *name, PyObject *encoding)
+static void
+value_entry_free(PyObject *capsule)
 {
-    return do_encode(name, encoding);
+    value_entry_t *entry = PyCapsule_GetPointer(capsule, NULL);
+
+    Py_DECREF(entry->result);
+    Py_DECREF(entry->key);
+    PyMem_Free(entry);
 }
 
 
 /*
- * Encode attribute from unicode
+ * Unlink a value cache entry from the list
  */
-static PyObject *
-encode_attribute_unicode(PyObject *value, PyObject *encoding)
+static void
+value_entry_unlink(value_entry_t *entry)
 {
-    PyObject *uresult, *result;
-    unsigned char *source, *target;
-    Py_ssize_t length, slength, js, jt;
-    EXT_UNI_CP c;
-    EXT_UNI_KIND_DECL(kind)
-    EXT_UNI_KIND_DECL(tkind)
-    EXT_UNI_MAX_DECL(m)
+    entry->prev->next = entry->next;
+    entry->next->prev = entry->prev;
+}
 
-    EXT_UNI_KIND_SET(kind, PyUnicode_KIND(value))
-    source = PyUnicode_DATA(value);
 
-    length = slength = PyUnicode_GET_LENGTH(value);
-    LENGTH_ADD(2);  /* quotes */
+/*
+ * Link a value cache entry as the most recently used one
+ */
+static void
+value_entry_link(value_lru_t *lru, value_entry_t *entry)
+{
+    entry->prev = lru->head.prev;
+    entry->next = &lru->head;
+    lru->head.prev->next = entry;
+    lru->head.prev = entry;
+}
 
-    EXT_UNI_MAX_SET(m, 0)
-    EXT_UNI_MAX_LEVEL(m, U('"'));
-    for (js=0; js < slength; ) {
-        c = PyUnicode_READ(kind, source, js); ++js;
-        if (c == U('\\') || c == U('"')) {
-            EXT_UNI_MAX_LEVEL(m, U('\\'));
-            LENGTH_ADD(1);  /* backslash */
-        }
-        EXT_UNI_MAX_LEVEL(m, c);
+
+/*
+ * Empty a value cache
+ */
+static void
+value_lru_clear(value_lru_t *lru)
+{
+    lru->head.prev = lru->head.next = &lru->head;
+    if (lru->dict)
+        PyDict_Clear(lru->dict);
+}
+
+
+/*
+ * Store a new result in a value cache
+ *
+ * The least recently used entry is dropped if the cache is full.
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+value_lru_store(value_lru_t *lru, Py_ssize_t max, PyObject *value,
+                PyObject *result)
+{
+    PyObject *capsule;
+    value_entry_t *entry;
+
+    if (PyDict_Size(lru->dict) >= max) {
+        entry = lru->head.next;
+        value_entry_unlink(entry);
+        if (-1 == PyDict_DelItem(lru->dict, entry->key))
+            LCOV_EXCL_LINE_RETURN(-1);
     }
 
-    if (!(uresult = PyUnicode_New(length, m)))
-        LCOV_EXCL_LINE_RETURN(NULL);
-    target = PyUnicode_DATA(uresult);
-    EXT_UNI_KIND_SET(tkind, PyUnicode_KIND(uresult))
+    if (!(entry = PyMem_Malloc(sizeof *entry))) {
+        LCOV_EXCL_START
 
-    jt = 0;
-    PyUnicode_WRITE(tkind, target, jt, U('"')); ++jt;
+        PyErr_SetNone(PyExc_MemoryError);
+        return -1;
 
-    for (js=0; js < slength; ) {
-        c = PyUnicode_READ(kind, source, js); ++js;
-        if (c == U('\\') || c == U('"')) {
-            PyUnicode_WRITE(tkind, target, jt, U('\\')); ++jt;
-        }
-        PyUnicode_WRITE(tkind, target, jt, c); ++jt;
+        LCOV_EXCL_STOP
     }
-    PyUnicode_WRITE(tkind, target, jt, U('"'));
+    Py_INCREF(value);
+    entry->key = value;
+    Py_INCREF(result);
+    entry->result = result;
 
-    result = do_encode(uresult, encoding);
-    Py_DECREF(uresult);
-    return result;
+    if (!(capsule = PyCapsule_New(entry, NULL, value_entry_free))) {
+        LCOV_EXCL_START
+
+        Py_DECREF(result);
+        Py_DECREF(value);
+        PyMem_Free(entry);
+        return -1;
+
+        LCOV_EXCL_STOP
+    }
+    if (-1 == PyDict_SetItem(lru->dict, value, capsule)) {
+        LCOV_EXCL_START
+
+        Py_DECREF(capsule);
+        return -1;
+
+        LCOV_EXCL_STOP
+    }
+    Py_DECREF(capsule);
+    value_entry_link(lru, entry);
+
+    return 0;
 }
 
 
 /*
- * Encode attribute from bytes
+ * Encode a value, using the value cache if possible
+ *
+ * Only exact unicode values are cached. A full cache drops its least
+ * recently used entry before the next result is stored.
+ *
+ * Return a new reference or NULL on error
  */
 static PyObject *
-encode_attribute_bytes(PyObject *value)
+value_cached(tdi_text_encoder_t *self, value_cache_t which, PyObject *value,
+             PyObject *(*func)(PyObject *, tdi_codec_t *))
 {
-    PyObject *result;
-    char *source, *target, *sentinel;
-    Py_ssize_t length, slength;
-    char c;
+    value_lru_t *lru = &self->values[which];
+    PyObject *capsule, *result;
+    value_entry_t *entry;
+
+    if (!lru->dict || !PyUnicode_CheckExact(value)
+        || PyUnicode_GET_LENGTH(value) > self->values_length)
+        return func(value, &self->codec);
+
+    if ((capsule = PyDict_GetItem(lru->dict, value))) {
+        ++self->value_hits;
+        entry = PyCapsule_GetPointer(capsule, NULL);
+        value_entry_unlink(entry);
+        value_entry_link(lru, entry);
+        return Py_INCREF(entry->result), entry->result;
+    }
+    ++self->value_misses;
 
-    source = PyBytes_AS_STRING(value);
-    length = slength = PyBytes_GET_SIZE(value);
-    LENGTH_ADD(2);  /* quotes */
+    if (!(result = func(value, &self->codec)))
+        return NULL;
 
-    for (sentinel = source + slength; source < sentinel; ) {
-        c = *source++;
-        if (c == '\\' || c == '"')
-            LENGTH_ADD(1);  /* backslash */
-    }
+    if (-1 == value_lru_store(lru, self->values_max, value, result)) {
+        LCOV_EXCL_START
 
-    if (!(result = PyBytes_FromStringAndSize(NULL, length)))
-        LCOV_EXCL_LINE_RETURN(NULL);
+        Py_DECREF(result);
+        return NULL;
 
-    source = PyBytes_AS_STRING(value);
-    target = PyBytes_AS_STRING(result);
-    *target++ = '"';
-    for (sentinel = source + slength; source < sentinel; ) {
-        c = *source++;
-        if (c == '\\' || c == '"')
-            *target++ = '\\';
-        *target++ = c;
+        LCOV_EXCL_STOP
     }
-    *target++ = '"';
 
     return result;
 }
 
 
 /*
- * Encode attribute (bytes or unicode)
+ * Empty the value caches
+ */
+static void
+values_clear(tdi_text_encoder_t *self)
+{
+    int j;
+
+    for (j = 0; j < 3; ++j)
+        value_lru_clear(&self->values[j]);
+}
+
+
+/*
+ * Build an endtag
+ *
+ * Return a new reference or NULL on error
  */
 static PyObject *
-encode_attribute(PyObject *value, PyObject *encoding)
+endtag(PyObject *name_)
 {
-    PyObject *tmp;
+    PyObject *result;
+    tdi_bytestr_t name;
+    Py_ssize_t length;
 
-#ifdef EXT2
-    if (PyUnicode_Check(value)) {
-        return encode_attribute_unicode(value, encoding);
-    }
-    else {
-        if (!(tmp = PyObject_Str(value)))
+    if (-1 == tag_name(name_, &name))
+        return NULL;
+
+    if (-1 == (length = endtag_length(&name)))
+        LCOV_EXCL_LINE_GOTO(error);
+
+    if (!(result = PyBytes_FromStringAndSize(NULL, length)))
+        LCOV_EXCL_LINE_GOTO(error);
+
+    endtag_write(PyBytes_AS_STRING(result), &name);
+    tdi_bytestr_clear(&name);
+    return result;
+
+error:
+    LCOV_EXCL_START
+
+    tdi_bytestr_clear(&name);
+    return NULL;
+
+    LCOV_EXCL_STOP
+}
+
+
+/*
+ * Reserve space for writing into a target
+ *
+ * Exact bytearrays are written in place. For all other targets a temporary
+ * bytes object is created and stored in tmp (see into_finish).
+ *
+ * Return a pointer to the reserved space, NULL on error
+ */
+static char *
+into_reserve(PyObject *target, Py_ssize_t length, PyObject **tmp)
+{
+    *tmp = NULL;
+    if (PyByteArray_CheckExact(target))
+        return tdi_bytearray_extend(target, length);
+
+    if (!(*tmp = PyBytes_FromStringAndSize(NULL, length)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    return PyBytes_AS_STRING(*tmp);
+}
+
+
+/*
+ * Finish writing into a target
+ *
+ * tmp is stolen.
+ *
+ * Return the number of bytes written as python object, NULL on error
+ */
+static PyObject *
+into_finish(PyObject *target, PyObject *tmp, Py_ssize_t length)
+{
+    int res;
+
+    if (tmp) {
+        res = tdi_append(target, tmp);
+        Py_DECREF(tmp);
+        if (res == -1)
+            return NULL;
+    }
+
+    return PyLong_FromSsize_t(length);
+}
+
+
+/*
+ * Write bytes into a target
+ *
+ * Return the number of bytes written as python object, NULL on error
+ */
+static PyObject *
+into_bytes(PyObject *target, PyObject *bytes)
+{
+    if (-1 == tdi_append(target, bytes))
+        return NULL;
+
+    return PyLong_FromSsize_t(PyBytes_GET_SIZE(bytes));
+}
+
+
+/*
+ * Encode an object
+ */
+static PyObject *
+do_encode(PyObject *value, tdi_codec_t *codec)
+{
+#ifdef EXT2
+    if (!PyUnicode_Check(value))
+        return PyObject_Str(value);
+
+    return tdi_codec_encode(codec, value);
+
+#else
+    PyObject *tmp;
+
+    if (PyBytes_Check(value)) {
+        Py_INCREF(value);
+        return value;
+    }
+
+    if (!(tmp = PyObject_Str(value)))
+        return NULL;
+    value = tdi_codec_encode(codec, tmp);
+    Py_DECREF(tmp);
+    return value;
+#endif
+}
+
+
+/*
+ * Encode name
+ */
+static PyObject *
+encode_name(PyObject *name, tdi_codec_t *codec)
+{
+    return do_encode(name, codec);
+}
+
+
+/*
+ * Encode attribute from unicode
+ */
+static PyObject *
+encode_attribute_unicode(PyObject *value, tdi_codec_t *codec)
+{
+    PyObject *uresult, *result;
+    unsigned char *source, *target;
+    Py_ssize_t length, slength, js, jt;
+    EXT_UNI_CP c;
+    EXT_UNI_KIND_DECL(kind)
+    EXT_UNI_KIND_DECL(tkind)
+    EXT_UNI_MAX_DECL(m)
+
+    EXT_UNI_KIND_SET(kind, PyUnicode_KIND(value))
+    source = PyUnicode_DATA(value);
+
+    length = slength = PyUnicode_GET_LENGTH(value);
+    LENGTH_ADD(2);  /* quotes */
+
+    EXT_UNI_MAX_SET(m, 0)
+    EXT_UNI_MAX_LEVEL(m, U('"'));
+    for (js=0; js < slength; ) {
+        c = PyUnicode_READ(kind, source, js); ++js;
+        if (c == U('\\') || c == U('"')) {
+            EXT_UNI_MAX_LEVEL(m, U('\\'));
+            LENGTH_ADD(1);  /* backslash */
+        }
+        EXT_UNI_MAX_LEVEL(m, c);
+    }
+
+    if (!(uresult = PyUnicode_New(length, m)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+    target = PyUnicode_DATA(uresult);
+    EXT_UNI_KIND_SET(tkind, PyUnicode_KIND(uresult))
+
+    jt = 0;
+    PyUnicode_WRITE(tkind, target, jt, U('"')); ++jt;
+
+    for (js=0; js < slength; ) {
+        c = PyUnicode_READ(kind, source, js); ++js;
+        if (c == U('\\') || c == U('"')) {
+            PyUnicode_WRITE(tkind, target, jt, U('\\')); ++jt;
+        }
+        PyUnicode_WRITE(tkind, target, jt, c); ++jt;
+    }
+    PyUnicode_WRITE(tkind, target, jt, U('"'));
+
+    result = do_encode(uresult, codec);
+    Py_DECREF(uresult);
+    return result;
+}
+
+
+/*
+ * Calculate the length of an encoded attribute from bytes
+ *
+ * The GIL is released for large sources.
+ *
+ * Return -1 on error
+ */
+static Py_ssize_t
+attribute_bytes_length(const char *source, Py_ssize_t slength)
+{
+    const char *sentinel;
+    Py_ssize_t length, count = 0;
+    char c;
+
+    NOGIL_BEGIN(slength)
+    for (sentinel = source + slength; source < sentinel; ) {
+        c = *source++;
+        if (c == '\\' || c == '"')
+            ++count;  /* backslash */
+    }
+    NOGIL_END
+
+    length = slength;
+    SIZE_ADD(count);
+    SIZE_ADD(2);  /* quotes */
+
+    return length;
+}
+
+
+/*
+ * Write an encoded attribute from bytes
+ *
+ * The target needs to be big enough (see attribute_bytes_length). The GIL
+ * is released for large sources.
+ */
+static void
+attribute_bytes_write(char *target, const char *source, Py_ssize_t slength)
+{
+    const char *sentinel;
+    char c;
+
+    NOGIL_BEGIN(slength)
+    *target++ = '"';
+    for (sentinel = source + slength; source < sentinel; ) {
+        c = *source++;
+        if (c == '\\' || c == '"')
+            *target++ = '\\';
+        *target++ = c;
+    }
+    *target = '"';
+    NOGIL_END
+}
+
+
+/*
+ * Encode attribute from bytes
+ */
+static PyObject *
+encode_attribute_bytes(PyObject *value)
+{
+    PyObject *result;
+    Py_ssize_t length;
+
+    length = attribute_bytes_length(PyBytes_AS_STRING(value),
+                                    PyBytes_GET_SIZE(value));
+    if (length == -1)
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    if (!(result = PyBytes_FromStringAndSize(NULL, length)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    attribute_bytes_write(PyBytes_AS_STRING(result),
+                          PyBytes_AS_STRING(value), PyBytes_GET_SIZE(value));
+
+    return result;
+}
+
+
+#ifdef EXT2
+#define FLOAT_FORMAT_CODE 'g'
+#define FLOAT_FORMAT_PRECISION 12
+#else
+#define FLOAT_FORMAT_CODE 'r'
+#define FLOAT_FORMAT_PRECISION 0
+#endif
+
+/*
+ * Create bytes from a formatted number, optionally quoted
+ *
+ * Return the bytes or NULL on error
+ */
+static PyObject *
+number_bytes(const char *number, size_t length, int quote)
+{
+    PyObject *result;
+    char *target;
+
+    if (!(result = PyBytes_FromStringAndSize(NULL, (Py_ssize_t)length
+                                                   + (quote ? 2 : 0))))
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    target = PyBytes_AS_STRING(result);
+    if (quote) *target++ = '"';
+    (void)memcpy(target, number, length);
+    if (quote) target[length] = '"';
+
+    return result;
+}
+
+
+/*
+ * Format exact ints and floats directly
+ *
+ * The formatted number is equivalent to str(value), but written as bytes
+ * directly for ASCII compatible codecs. Numbers contain nothing to escape.
+ * If quote is true, the number is put into double quotes (for attributes).
+ *
+ * Return -1 on error, 0 on success (*result is set), 1 if value is not
+ * handled here
+ */
+static int
+encode_number(PyObject *value, tdi_codec_t *codec, int quote,
+              PyObject **result)
+{
+    char buf[32], *formatted;
+    long number;
+    int overflow;
+
+    if (codec->kind == TDI_CODEC_OTHER)
+        return 1;
+
+#ifdef EXT2
+    if (PyInt_CheckExact(value)) {
+        (void)PyOS_snprintf(buf, sizeof buf, "%ld", PyInt_AS_LONG(value));
+        *result = number_bytes(buf, strlen(buf), quote);
+        return *result ? 0 : -1;
+    }
+#endif
+    if (PyLong_CheckExact(value)) {
+        number = PyLong_AsLongAndOverflow(value, &overflow);
+        if (overflow)
+            return 1;
+        if (number == -1 && PyErr_Occurred())
+            LCOV_EXCL_LINE_RETURN(-1);
+
+        (void)PyOS_snprintf(buf, sizeof buf, "%ld", number);
+        *result = number_bytes(buf, strlen(buf), quote);
+        return *result ? 0 : -1;
+    }
+
+    if (PyFloat_CheckExact(value)) {
+        if (!(formatted = PyOS_double_to_string(PyFloat_AS_DOUBLE(value),
+                                                FLOAT_FORMAT_CODE,
+                                                FLOAT_FORMAT_PRECISION,
+                                                Py_DTSF_ADD_DOT_0, NULL)))
+            LCOV_EXCL_LINE_RETURN(-1);
+
+        *result = number_bytes(formatted, strlen(formatted), quote);
+        PyMem_Free(formatted);
+        return *result ? 0 : -1;
+    }
+
+    return 1;
+}
+
+
+/*
+ * Encode attribute (bytes or unicode)
+ */
+static PyObject *
+encode_attribute(PyObject *value, tdi_codec_t *codec)
+{
+    PyObject *tmp;
+    int res;
+
+    if (1 != (res = encode_number(value, codec, 1, &tmp)))
+        return res ? NULL : tmp;
+
+#ifdef EXT2
+    if (PyUnicode_Check(value)) {
+        return encode_attribute_unicode(value, codec);
+    }
+    else {
+        if (!(tmp = PyObject_Str(value)))
             return NULL;
         value = encode_attribute_bytes(tmp);
         Py_DECREF(tmp);
@@ -293,7 +859,7 @@ encode_attribute(PyObject *value, PyObject *encoding)
     if (!PyBytes_Check(value)) {
         if (!(tmp = PyObject_Str(value)))
             return NULL;
-        value = encode_attribute_unicode(tmp, encoding);
+        value = encode_attribute_unicode(tmp, codec);
         Py_DECREF(tmp);
         return value;
     }
@@ -308,9 +874,15 @@ encode_attribute(PyObject *value, PyObject *encoding)
  * Encode content (bytes or unicode)
  */
 static PyObject *
-encode_content(PyObject *value, PyObject *encoding)
+encode_content(PyObject *value, tdi_codec_t *codec)
 {
-    return do_encode(value, encoding);
+    PyObject *result;
+    int res;
+
+    if (1 != (res = encode_number(value, codec, 0, &result)))
+        return res ? NULL : result;
+
+    return do_encode(value, codec);
 }
 
 
@@ -318,9 +890,9 @@ encode_content(PyObject *value, PyObject *encoding)
  * Encode generic (bytes or unicode)
  */
 static PyObject *
-encode_encode(PyObject *value, PyObject *encoding)
+encode_encode(PyObject *value, tdi_codec_t *codec)
 {
-    return do_encode(value, encoding);
+    return do_encode(value, codec);
 }
 
 
@@ -328,7 +900,7 @@ encode_encode(PyObject *value, PyObject *encoding)
  * Escape unicode
  */
 static PyObject *
-encode_escape_unicode(PyObject *value, PyObject *encoding)
+encode_escape_unicode(PyObject *value, tdi_codec_t *codec)
 {
     PyObject *uresult;
     unsigned char *source, *target;
@@ -368,77 +940,655 @@ encode_escape_unicode(PyObject *value, PyObject *encoding)
         }
     }
 
-    return uresult;
+    return uresult;
+}
+
+
+/*
+ * Calculate the length of escaped bytes
+ *
+ * The GIL is released for large sources.
+ *
+ * Return -1 on error
+ */
+static Py_ssize_t
+escape_bytes_length(const char *source, Py_ssize_t slength)
+{
+    const char *sentinel;
+    Py_ssize_t length, count = 0;
+
+    NOGIL_BEGIN(slength)
+    for (sentinel = source + slength; source < sentinel; ) {
+        if (*source++ == '[')
+            ++count;  /* escape */
+    }
+    NOGIL_END
+
+    length = slength;
+    SIZE_ADD(count);
+
+    return length;
+}
+
+
+/*
+ * Write escaped bytes
+ *
+ * The target needs to be big enough (see escape_bytes_length). The GIL is
+ * released for large sources.
+ */
+static void
+escape_bytes_write(char *target, const char *source, Py_ssize_t slength)
+{
+    const char *sentinel;
+    char c;
+
+    NOGIL_BEGIN(slength)
+    for (sentinel = source + slength; source < sentinel; ) {
+        c = *source++;
+        *target++ = c;
+        if (c == '[')
+            *target++ = ']';
+    }
+    NOGIL_END
+}
+
+
+/*
+ * Escape bytes
+ */
+static PyObject *
+encode_escape_bytes(PyObject *value)
+{
+    PyObject *result;
+    Py_ssize_t length;
+
+    length = escape_bytes_length(PyBytes_AS_STRING(value),
+                                 PyBytes_GET_SIZE(value));
+    if (length == -1)
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    if (!(result = PyBytes_FromStringAndSize(NULL, length)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    escape_bytes_write(PyBytes_AS_STRING(result), PyBytes_AS_STRING(value),
+                       PyBytes_GET_SIZE(value));
+
+    return result;
+}
+
+
+/*
+ * escape content (bytes or unicode)
+ */
+static PyObject *
+encode_escape(PyObject *value, tdi_codec_t *codec)
+{
+    PyObject *tmp;
+
+#ifdef EXT2
+    if (PyUnicode_Check(value)) {
+        return encode_escape_unicode(value, codec);
+    }
+    else {
+        if (!(tmp = PyObject_Str(value)))
+            return NULL;
+        value = encode_escape_bytes(tmp);
+        Py_DECREF(tmp);
+        return value;
+    }
+#else
+    if (!PyBytes_Check(value)) {
+        if (!(tmp = PyObject_Str(value)))
+            return NULL;
+        value = encode_escape_unicode(tmp, codec);
+        Py_DECREF(tmp);
+        return value;
+    }
+    else {
+        return encode_escape_bytes(value);
+    }
+#endif
+}
+
+
+#ifdef EXT_PEP393
+/*
+ * Calculate the length of natively escaped and encoded unicode
+ *
+ * Supported are UTF-8, Latin-1 and ASCII.
+ *
+ * The GIL is released for large values.
+ *
+ * Return -1 on error, -2 if the value cannot be encoded natively (the
+ * caller falls back to the codec, which reports the error)
+ */
+static Py_ssize_t
+escape_content_native_length(PyObject *value, tdi_codec_kind_t ckind)
+{
+    unsigned char *source;
+    Py_ssize_t length, slength, js;
+    size_t extra = 0;
+    Py_UCS4 c, limit;
+    enum PyUnicode_Kind kind;
+    int surrogate = 0;
+
+    limit = ckind == TDI_CODEC_ASCII ? 0x7F
+          : ckind == TDI_CODEC_LATIN1 ? 0xFF : 0x10FFFF;
+    if (PyUnicode_MAX_CHAR_VALUE(value) > limit)
+        return -2;
+
+    kind = PyUnicode_KIND(value);
+    source = PyUnicode_DATA(value);
+    slength = PyUnicode_GET_LENGTH(value);
+
+    /*
+     * There are at most kind extra bytes per character, so the sum cannot
+     * exceed the size of the unicode data.
+     */
+    NOGIL_BEGIN(slength)
+    for (js = 0; js < slength; ++js) {
+        c = PyUnicode_READ(kind, source, js);
+        if (c == U('['))
+            ++extra;  /* escape */
+        else if (c < 0x80 || ckind != TDI_CODEC_UTF8)
+            continue;
+        else if (c < 0x800)
+            extra += 1;
+        else if (c < 0x10000) {
+            if (Py_UNICODE_IS_SURROGATE(c)) {
+                surrogate = 1;
+                break;
+            }
+            extra += 2;
+        }
+        else
+            extra += 3;
+    }
+    NOGIL_END
+
+    if (surrogate)
+        return -2;
+
+    length = slength;
+    SIZE_ADD((Py_ssize_t)extra);
+
+    return length;
+}
+
+
+/*
+ * Write natively escaped and encoded unicode
+ *
+ * The target needs to be big enough (see escape_content_native_length).
+ * The GIL is released for large values.
+ */
+static void
+escape_content_native_write(unsigned char *target, PyObject *value,
+                            tdi_codec_kind_t ckind)
+{
+    unsigned char *source;
+    Py_ssize_t slength, js;
+    Py_UCS4 c;
+    enum PyUnicode_Kind kind;
+
+    kind = PyUnicode_KIND(value);
+    source = PyUnicode_DATA(value);
+    slength = PyUnicode_GET_LENGTH(value);
+
+    NOGIL_BEGIN(slength)
+    for (js = 0; js < slength; ++js) {
+        c = PyUnicode_READ(kind, source, js);
+        if (c < 0x80 || ckind != TDI_CODEC_UTF8) {
+            *target++ = (unsigned char)c;
+            if (c == U('['))
+                *target++ = ']';
+        }
+        else if (c < 0x800) {
+            *target++ = (unsigned char)(0xC0 | (c >> 6));
+            *target++ = (unsigned char)(0x80 | (c & 0x3F));
+        }
+        else if (c < 0x10000) {
+            *target++ = (unsigned char)(0xE0 | (c >> 12));
+            *target++ = (unsigned char)(0x80 | ((c >> 6) & 0x3F));
+            *target++ = (unsigned char)(0x80 | (c & 0x3F));
+        }
+        else {
+            *target++ = (unsigned char)(0xF0 | (c >> 18));
+            *target++ = (unsigned char)(0x80 | ((c >> 12) & 0x3F));
+            *target++ = (unsigned char)(0x80 | ((c >> 6) & 0x3F));
+            *target++ = (unsigned char)(0x80 | (c & 0x3F));
+        }
+    }
+    NOGIL_END
+}
+
+
+/*
+ * Escape and encode unicode natively in one pass
+ *
+ * The result size is determined by a pre-scan.
+ *
+ * Return -1 on error, 1 if the value cannot be encoded natively (the
+ * caller falls back to the codec, which reports the error), 0 on success
+ * (with the bytes stored in *result)
+ */
+static int
+escape_content_native(PyObject *value, tdi_codec_kind_t ckind,
+                      PyObject **result)
+{
+    Py_ssize_t length;
+
+    if ((length = escape_content_native_length(value, ckind)) < 0)
+        return length == -1 ? -1 : 1;
+
+    if (!(*result = PyBytes_FromStringAndSize(NULL, length)))
+        LCOV_EXCL_LINE_RETURN(-1);
+
+    escape_content_native_write((unsigned char *)PyBytes_AS_STRING(*result),
+                                value, ckind);
+    return 0;
+}
+#endif
+
+
+/*
+ * Escape and encode unicode
+ */
+static PyObject *
+escape_content_unicode(PyObject *value, tdi_codec_t *codec)
+{
+    PyObject *tmp, *result;
+#ifdef EXT_PEP393
+    int res;
+
+    if (codec->kind != TDI_CODEC_OTHER) {
+        if (-1 == (res = escape_content_native(value, codec->kind, &result)))
+            return NULL;
+        if (!res)
+            return result;
+    }
+#endif
+
+    if (!(tmp = encode_escape_unicode(value, codec)))
+        return NULL;
+    result = tdi_codec_encode(codec, tmp);
+    Py_DECREF(tmp);
+    return result;
+}
+
+
+/*
+ * Escape and encode content (bytes or unicode)
+ */
+static PyObject *
+escape_content(PyObject *value, tdi_codec_t *codec)
+{
+    PyObject *tmp;
+
+#ifdef EXT2
+    if (PyUnicode_Check(value)) {
+        return escape_content_unicode(value, codec);
+    }
+    else {
+        if (!(tmp = PyObject_Str(value)))
+            return NULL;
+        value = encode_escape_bytes(tmp);
+        Py_DECREF(tmp);
+        return value;
+    }
+#else
+    if (!PyBytes_Check(value)) {
+        if (!(tmp = PyObject_Str(value)))
+            return NULL;
+        value = escape_content_unicode(tmp, codec);
+        Py_DECREF(tmp);
+        return value;
+    }
+    else {
+        return encode_escape_bytes(value);
+    }
+#endif
+}
+
+
+/*
+ * Write one content_join item into the buffer
+ *
+ * Bytes and natively encodable unicode are escaped directly into the
+ * buffer. Everything else is converted to a temporary bytes object first.
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+join_item(tdi_buf_t *buf, PyObject *item, tdi_codec_t *codec, int escape)
+{
+    PyObject *tmp;
+    char *target;
+    Py_ssize_t length;
+    int res;
+
+    if (PyBytes_Check(item)) {
+        if (!escape)
+            return tdi_buf_write(buf, PyBytes_AS_STRING(item),
+                                 PyBytes_GET_SIZE(item));
+
+        length = escape_bytes_length(PyBytes_AS_STRING(item),
+                                     PyBytes_GET_SIZE(item));
+        if (length == -1 || !(target = tdi_buf_extend(buf, length)))
+            LCOV_EXCL_LINE_RETURN(-1);
+        escape_bytes_write(target, PyBytes_AS_STRING(item),
+                           PyBytes_GET_SIZE(item));
+        return 0;
+    }
+
+#ifdef EXT_PEP393
+    if (escape && PyUnicode_CheckExact(item)
+        && codec->kind != TDI_CODEC_OTHER) {
+        length = escape_content_native_length(item, codec->kind);
+        if (length == -1)
+            LCOV_EXCL_LINE_RETURN(-1);
+        if (length != -2) {
+            if (!(target = tdi_buf_extend(buf, length)))
+                LCOV_EXCL_LINE_RETURN(-1);
+            escape_content_native_write((unsigned char *)target, item,
+                                        codec->kind);
+            return 0;
+        }
+    }
+#endif
+
+    if (!(tmp = escape ? escape_content(item, codec)
+                       : encode_content(item, codec)))
+        return -1;
+
+    res = tdi_buf_write(buf, PyBytes_AS_STRING(tmp), PyBytes_GET_SIZE(tmp));
+    Py_DECREF(tmp);
+
+    return res;
+}
+
+
+/*
+ * Encode the items of an iterable and join them
+ */
+static PyObject *
+content_join(PyObject *items, PyObject *sep, int escape,
+             tdi_codec_t *codec)
+{
+    PyObject *iter, *item;
+    tdi_buf_t buf;
+    int res, first = 1;
+
+    if (!PyBytes_Check(sep)) {
+        PyErr_SetString(PyExc_TypeError, "expected bytes");
+        return NULL;
+    }
+
+    if (!(iter = PyObject_GetIter(items)))
+        return NULL;
+
+    if (-1 == tdi_buf_init(&buf, 0))
+        LCOV_EXCL_LINE_GOTO(error_iter);
+
+    while ((item = PyIter_Next(iter))) {
+        if (first)
+            first = 0;
+        else if (-1 == tdi_buf_write(&buf, PyBytes_AS_STRING(sep),
+                                     PyBytes_GET_SIZE(sep))) {
+            LCOV_EXCL_START
+
+            Py_DECREF(item);
+            goto error;
+
+            LCOV_EXCL_STOP
+        }
+
+        res = join_item(&buf, item, codec, escape);
+        Py_DECREF(item);
+        if (res == -1)
+            goto error;
+    }
+    if (PyErr_Occurred())
+        goto error;
+
+    Py_DECREF(iter);
+    return tdi_buf_finish(&buf);
+
+error:
+    tdi_buf_clear(&buf);
+error_iter:
+    Py_DECREF(iter);
+
+    return NULL;
+}
+
+
+/*
+ * Operation codes for encode_tags
+ */
+typedef enum {
+    TAGS_OP_UNKNOWN,
+    TAGS_OP_START,
+    TAGS_OP_END,
+    TAGS_OP_CONTENT
+} tags_op_t;
+
+
+/*
+ * Find the operation code of a name
+ */
+static tags_op_t
+tags_opcode_name(const char *kind_s, Py_ssize_t length)
+{
+#define OPCODE_IS(name) \
+    (length == sizeof(name) - 1 && !memcmp(kind_s, name, sizeof(name) - 1))
+
+    if (OPCODE_IS("start"))
+        return TAGS_OP_START;
+    if (OPCODE_IS("end"))
+        return TAGS_OP_END;
+    if (OPCODE_IS("content"))
+        return TAGS_OP_CONTENT;
+
+    return TAGS_OP_UNKNOWN;
+
+#undef OPCODE_IS
+}
+
+
+/*
+ * Find the operation code
+ *
+ * On Python 2 both str and unicode names are accepted (they compare
+ * equal in the Python implementation).
+ */
+static tags_op_t
+tags_opcode(PyObject *kind)
+{
+    const char *kind_s;
+    Py_ssize_t length;
+
+#ifdef EXT2
+    if (PyUnicode_Check(kind)) {
+        PyObject *ascii;
+        tags_op_t result;
+
+        if (!(ascii = PyUnicode_AsASCIIString(kind))) {
+            PyErr_Clear();
+            return TAGS_OP_UNKNOWN;
+        }
+        result = tags_opcode_name(PyString_AS_STRING(ascii),
+                                  PyString_GET_SIZE(ascii));
+        Py_DECREF(ascii);
+        return result;
+    }
+    if (!PyString_Check(kind))
+        return TAGS_OP_UNKNOWN;
+    kind_s = PyString_AS_STRING(kind);
+    length = PyString_GET_SIZE(kind);
+#else
+    if (!PyUnicode_Check(kind))
+        return TAGS_OP_UNKNOWN;
+    if (!(kind_s = PyUnicode_AsUTF8AndSize(kind, &length))) {
+        PyErr_Clear();
+        return TAGS_OP_UNKNOWN;
+    }
+#endif
+
+    return tags_opcode_name(kind_s, length);
+}
+
+
+/*
+ * Write a starttag operation into the buffer
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+tags_starttag(tdi_buf_t *buf, PyObject *name_, PyObject *attr_,
+              PyObject *closed_, tdi_attrscratch_t *scratch)
+{
+    starttag_t tag;
+    char *target;
+    int res = -1;
+
+    if (-1 == starttag_init(&tag, name_, attr_, closed_, scratch))
+        return -1;
+
+    if ((target = tdi_buf_extend(buf, tag.length)))
+        res = starttag_write(target, &tag);
+
+    starttag_clear(&tag);
+    return res;
+}
+
+
+/*
+ * Write an endtag operation into the buffer
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+tags_endtag(tdi_buf_t *buf, PyObject *name_)
+{
+    tdi_bytestr_t name;
+    char *target;
+    Py_ssize_t length;
+
+    if (-1 == tag_name(name_, &name))
+        return -1;
+
+    if (-1 == (length = endtag_length(&name))
+        || !(target = tdi_buf_extend(buf, length))) {
+        LCOV_EXCL_START
+
+        tdi_bytestr_clear(&name);
+        return -1;
+
+        LCOV_EXCL_STOP
+    }
+
+    endtag_write(target, &name);
+    tdi_bytestr_clear(&name);
+    return 0;
+}
+
+
+/*
+ * Write a content operation into the buffer
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+tags_content(tdi_buf_t *buf, PyObject *value, tdi_codec_t *codec)
+{
+    PyObject *encoded;
+    int res;
+
+    if (!(encoded = encode_content(value, codec)))
+        return -1;
+
+    res = tdi_buf_write(buf, PyBytes_AS_STRING(encoded),
+                        PyBytes_GET_SIZE(encoded));
+    Py_DECREF(encoded);
+
+    return res;
 }
 
 
 /*
- * Escape bytes
+ * Encode a sequence of tag operations
  */
 static PyObject *
-encode_escape_bytes(PyObject *value)
+encode_tags(PyObject *ops, tdi_codec_t *codec, tdi_attrscratch_t *scratch)
 {
-    PyObject *result;
-    char *source, *target, *sentinel;
-    Py_ssize_t length, slength;
-    char c;
+    PyObject *iter, *item, *op, **items;
+    tdi_buf_t buf;
+    Py_ssize_t size;
+    int res;
 
-    source = PyBytes_AS_STRING(value);
-    length = slength = PyBytes_GET_SIZE(value);
+    if (!(iter = PyObject_GetIter(ops)))
+        return NULL;
 
-    for (sentinel = source + slength; source < sentinel; ) {
-        c = *source++;
-        if (c == '[')
-            LENGTH_ADD(1);  /* backslash */
-    }
+    if (-1 == tdi_buf_init(&buf, 0))
+        LCOV_EXCL_LINE_GOTO(error_iter);
+
+    while ((item = PyIter_Next(iter))) {
+        op = PySequence_Fast(item, "expected sequence");
+        Py_DECREF(item);
+        if (!op)
+            goto error;
+
+        size = PySequence_Fast_GET_SIZE(op);
+        items = PySequence_Fast_ITEMS(op);
+        res = -1;
+        switch (size ? tags_opcode(items[0]) : TAGS_OP_UNKNOWN) {
+        case TAGS_OP_START:
+            if (size == 4)
+                res = tags_starttag(&buf, items[1], items[2], items[3],
+                                    scratch);
+            else
+                PyErr_SetString(PyExc_ValueError,
+                                "Expected start operation of length 4");
+            break;
 
-    if (!(result = PyBytes_FromStringAndSize(NULL, length)))
-        LCOV_EXCL_LINE_RETURN(NULL);
+        case TAGS_OP_END:
+            if (size == 2)
+                res = tags_endtag(&buf, items[1]);
+            else
+                PyErr_SetString(PyExc_ValueError,
+                                "Expected end operation of length 2");
+            break;
 
-    source = PyBytes_AS_STRING(value);
-    target = PyBytes_AS_STRING(result);
-    for (sentinel = source + slength; source < sentinel; ) {
-        c = *source++;
-        *target++ = c;
-        if (c == '[')
-            *target++ = ']';
-    }
+        case TAGS_OP_CONTENT:
+            if (size == 2)
+                res = tags_content(&buf, items[1], codec);
+            else
+                PyErr_SetString(PyExc_ValueError,
+                                "Expected content operation of length 2");
+            break;
 
-    return result;
-}
+        default:
+            PyErr_SetString(PyExc_ValueError, "Unknown operation");
+            break;
+        }
+        Py_DECREF(op);
+        if (res == -1)
+            goto error;
+    }
+    if (PyErr_Occurred())
+        goto error;
 
+    Py_DECREF(iter);
+    return tdi_buf_finish(&buf);
 
-/*
- * escape content (bytes or unicode)
- */
-static PyObject *
-encode_escape(PyObject *value, PyObject *encoding)
-{
-    PyObject *tmp;
+error:
+    tdi_buf_clear(&buf);
+error_iter:
+    Py_DECREF(iter);
 
-#ifdef EXT2
-    if (PyUnicode_Check(value)) {
-        return encode_escape_unicode(value, encoding);
-    }
-    else {
-        if (!(tmp = PyObject_Str(value)))
-            return NULL;
-        value = encode_escape_bytes(tmp);
-        Py_DECREF(tmp);
-        return value;
-    }
-#else
-    if (!PyBytes_Check(value)) {
-        if (!(tmp = PyObject_Str(value)))
-            return NULL;
-        value = encode_escape_unicode(tmp, encoding);
-        Py_DECREF(tmp);
-        return value;
-    }
-    else {
-        return encode_escape_bytes(value);
-    }
-#endif
+    return NULL;
 }
 
 
@@ -451,44 +1601,102 @@ PyDoc_STRVAR(TDI_TextEncoder_starttag__doc__,
 :See: `abstract.Encoder`");
 
 static PyObject *
-TDI_TextEncoder_starttag(tdi_text_encoder_t *self, PyObject *args,
-                         PyObject *kwds)
+TDI_TextEncoder_starttag(tdi_text_encoder_t *self, TDI_ARGS_DEF)
 {
+    static const char * const kwlist[] = {"name", "attr", "closed", NULL};
+    static const tdi_args_t spec = {"starttag", kwlist, 3};
     PyObject *name_, *attr_, *closed_, *result;
-    static char *kwlist[] = {"name", "attr", "closed", NULL};
-    tdi_bytestr_t name = {0};
-    tdi_attrlist_t *attrs;
-    int closed;
+    PyObject *argv[3];
+    starttag_t tag;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OOO", kwlist,
-                                     &name_, &attr_, &closed_))
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
         return NULL;
+    name_ = argv[0];
+    attr_ = argv[1];
+    closed_ = argv[2];
 
-    if (-1 == (closed = PyObject_IsTrue(closed_)))
+    if (-1 == starttag_init(&tag, name_, attr_, closed_, &self->scratch))
         return NULL;
 
-    Py_INCREF(name_);
-#ifdef EXT2
-    if (!PyBytes_Check(name_)) {
-        PyErr_SetString(PyExc_TypeError, "expected bytes");
-        goto error_name;
-    }
-#endif
-    if (-1 == PyBytes_AsStringAndSize(name_, &name.bytes, &name.length))
-        goto error_name;
+    if ((result = PyBytes_FromStringAndSize(NULL, tag.length))) {
+        if (-1 == starttag_write(PyBytes_AS_STRING(result), &tag)) {
+            LCOV_EXCL_START
 
-    if (-1 == tdi_attrlist_from_iterable(attr_, &attrs))
-        goto error_name;
+            Py_CLEAR(result);
 
-    result = encode_starttag(&name, attrs, closed);
+            LCOV_EXCL_STOP
+        }
+    }
 
-    tdi_attrlist_clear(&attrs);
-    Py_DECREF(name_);
+    starttag_clear(&tag);
     return result;
+}
 
-error_name:
-    Py_DECREF(name_);
 
+PyDoc_STRVAR(TDI_TextEncoder_compile_starttag__doc__,
+"compile_starttag(self, name, keys, closed)\n\
+\n\
+:See: `abstract.Encoder`");
+
+static PyObject *
+TDI_TextEncoder_compile_starttag(tdi_text_encoder_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {"name", "keys", "closed", NULL};
+    static const tdi_args_t spec = {"compile_starttag", kwlist, 3};
+    PyObject *argv[3];
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+
+    return PyObject_CallFunctionObjArgs((PyObject *)&TDI_CompiledStartTag,
+                                        argv[0], argv[1], argv[2], NULL);
+}
+
+
+PyDoc_STRVAR(TDI_TextEncoder_starttag_into__doc__,
+"starttag_into(self, buffer, name, attr, closed)\n\
+\n\
+:See: `abstract.Encoder`");
+
+static PyObject *
+TDI_TextEncoder_starttag_into(tdi_text_encoder_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {
+        "buffer", "name", "attr", "closed", NULL
+    };
+    static const tdi_args_t spec = {"starttag_into", kwlist, 4};
+    PyObject *buffer, *name_, *attr_, *closed_, *tmp;
+    PyObject *argv[4];
+    starttag_t tag;
+    char *target;
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+    buffer = argv[0];
+    name_ = argv[1];
+    attr_ = argv[2];
+    closed_ = argv[3];
+
+    if (-1 == starttag_init(&tag, name_, attr_, closed_, &self->scratch))
+        return NULL;
+
+    if (!(target = into_reserve(buffer, tag.length, &tmp)))
+        goto error;
+
+    if (-1 == starttag_write(target, &tag)) {
+        LCOV_EXCL_START
+
+        Py_XDECREF(tmp);
+        goto error;
+
+        LCOV_EXCL_STOP
+    }
+
+    starttag_clear(&tag);
+    return into_finish(buffer, tmp, tag.length);
+
+error:
+    starttag_clear(&tag);
     return NULL;
 }
 
@@ -499,35 +1707,63 @@ PyDoc_STRVAR(TDI_TextEncoder_endtag__doc__,
 :See: `abstract.Encoder`");
 
 static PyObject *
-TDI_TextEncoder_endtag(tdi_text_encoder_t *self, PyObject *args,
-                         PyObject *kwds)
+TDI_TextEncoder_endtag(tdi_text_encoder_t *self, TDI_ARGS_DEF)
 {
+    static const char * const kwlist[] = {"name", NULL};
+    static const tdi_args_t spec = {"endtag", kwlist, 1};
     PyObject *name_, *result;
-    static char *kwlist[] = {"name", NULL};
-    tdi_bytestr_t name = {0};
+    PyObject *argv[1];
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O", kwlist,
-                                     &name_))
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
         return NULL;
+    name_ = argv[0];
 
-    Py_INCREF(name_);
-#ifdef EXT2
-    if (!PyBytes_Check(name_)) {
-        PyErr_SetString(PyExc_TypeError, "expected bytes");
-        goto error_name;
-    }
-#endif
-    if (-1 == PyBytes_AsStringAndSize(name_, &name.bytes, &name.length))
-        goto error_name;
+    if (!self->endtags || !PyBytes_CheckExact(name_))
+        return endtag(name_);
 
-    result = encode_endtag(&name);
+    if ((result = cache_get(self, self->endtags, name_)))
+        return result;
 
-    Py_DECREF(name_);
-    return result;
+    return cache_set(self, self->endtags, name_, endtag(name_));
+}
 
-error_name:
-    Py_DECREF(name_);
 
+PyDoc_STRVAR(TDI_TextEncoder_endtag_into__doc__,
+"endtag_into(self, buffer, name)\n\
+\n\
+:See: `abstract.Encoder`");
+
+static PyObject *
+TDI_TextEncoder_endtag_into(tdi_text_encoder_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {"buffer", "name", NULL};
+    static const tdi_args_t spec = {"endtag_into", kwlist, 2};
+    PyObject *buffer, *name_, *tmp;
+    PyObject *argv[2];
+    tdi_bytestr_t name;
+    Py_ssize_t length;
+    char *target;
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+    buffer = argv[0];
+    name_ = argv[1];
+
+    if (-1 == tag_name(name_, &name))
+        return NULL;
+
+    if (-1 == (length = endtag_length(&name)))
+        LCOV_EXCL_LINE_GOTO(error);
+
+    if (!(target = into_reserve(buffer, length, &tmp)))
+        goto error;
+
+    endtag_write(target, &name);
+    tdi_bytestr_clear(&name);
+    return into_finish(buffer, tmp, length);
+
+error:
+    tdi_bytestr_clear(&name);
     return NULL;
 }
 
@@ -538,87 +1774,222 @@ PyDoc_STRVAR(TDI_TextEncoder_name__doc__,
 :See: `abstract.Encoder`");
 
 static PyObject *
-TDI_TextEncoder_name(tdi_text_encoder_t *self, PyObject *args,
-                     PyObject *kwds)
+TDI_TextEncoder_name(tdi_text_encoder_t *self, TDI_ARGS_DEF)
 {
+    static const char * const kwlist[] = {"name", NULL};
+    static const tdi_args_t spec = {"name", kwlist, 1};
     PyObject *name_, *result;
-    static char *kwlist[] = {"name", NULL};
+    PyObject *argv[1];
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O", kwlist,
-                                     &name_))
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
         return NULL;
+    name_ = argv[0];
 
     Py_INCREF(name_);
-    result = encode_name(name_, self->encoding);
+    if (!self->names || !PyUnicode_CheckExact(name_))
+        result = encode_name(name_, &self->codec);
+    else if (!(result = cache_get(self, self->names, name_)))
+        result = cache_set(self, self->names, name_,
+                           encode_name(name_, &self->codec));
     Py_DECREF(name_);
     return result;
 }
 
 
+PyDoc_STRVAR(TDI_TextEncoder_name_cache_info__doc__,
+"name_cache_info(self)\n\
+\n\
+Return name cache statistics\n\
+\n\
+:Return: Hits, misses, maximum size and current size (summed over the\n\
+         name and endtag caches)\n\
+:Rtype: ``tuple``");
+
+static PyObject *
+TDI_TextEncoder_name_cache_info(tdi_text_encoder_t *self, PyObject *args)
+{
+    Py_ssize_t size = 0;
+
+    if (self->names)
+        size = PyDict_Size(self->names) + PyDict_Size(self->endtags);
+
+    return Py_BuildValue("(nnnn)", self->hits, self->misses,
+                         self->names_max, size);
+}
+
+
+PyDoc_STRVAR(TDI_TextEncoder_value_cache_info__doc__,
+"value_cache_info(self)\n\
+\n\
+Return value cache statistics\n\
+\n\
+:Return: Hits, misses, maximum size and current size (summed over the\n\
+         attribute, content and escape_content caches)\n\
+:Rtype: ``tuple``");
+
+static PyObject *
+TDI_TextEncoder_value_cache_info(tdi_text_encoder_t *self, PyObject *args)
+{
+    Py_ssize_t size = 0;
+    int j;
+
+    for (j = 0; j < 3; ++j) {
+        if (self->values[j].dict)
+            size += PyDict_Size(self->values[j].dict);
+    }
+
+    return Py_BuildValue("(nnnn)", self->value_hits, self->value_misses,
+                         self->values_max, size);
+}
+
+
 PyDoc_STRVAR(TDI_TextEncoder_attribute__doc__,
 "attribute(self, value)\n\
 \n\
 :See: `abstract.Encoder`");
 
 static PyObject *
-TDI_TextEncoder_attribute(tdi_text_encoder_t *self, PyObject *args,
-                          PyObject *kwds)
+TDI_TextEncoder_attribute(tdi_text_encoder_t *self, TDI_ARGS_DEF)
 {
+    static const char * const kwlist[] = {"value", NULL};
+    static const tdi_args_t spec = {"attribute", kwlist, 1};
     PyObject *value_, *result;
-    static char *kwlist[] = {"value", NULL};
+    PyObject *argv[1];
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O", kwlist,
-                                     &value_))
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
         return NULL;
+    value_ = argv[0];
 
     Py_INCREF(value_);
-    result = encode_attribute(value_, self->encoding);
+    result = value_cached(self, VALUE_ATTRIBUTE, value_, encode_attribute);
     Py_DECREF(value_);
     return result;
 }
 
 
+PyDoc_STRVAR(TDI_TextEncoder_attribute_into__doc__,
+"attribute_into(self, buffer, value)\n\
+\n\
+:See: `abstract.Encoder`");
+
+static PyObject *
+TDI_TextEncoder_attribute_into(tdi_text_encoder_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {"buffer", "value", NULL};
+    static const tdi_args_t spec = {"attribute_into", kwlist, 2};
+    PyObject *buffer, *value, *tmp;
+    PyObject *argv[2];
+    Py_buffer view;
+    Py_ssize_t length;
+    char *target;
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+    buffer = argv[0];
+    value = argv[1];
+
+    if (!PyBytes_Check(value)) {
+        if (!(value = value_cached(self, VALUE_ATTRIBUTE, value,
+                                   encode_attribute)))
+            return NULL;
+        tmp = into_bytes(buffer, value);
+        Py_DECREF(value);
+        return tmp;
+    }
+
+    length = attribute_bytes_length(PyBytes_AS_STRING(value),
+                                    PyBytes_GET_SIZE(value));
+    if (length == -1)
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    if (!(target = into_reserve(buffer, length, &tmp)))
+        return NULL;
+
+    /*
+     * The write may release the GIL. An exported view keeps the bytearray
+     * from being resized by other threads meanwhile.
+     */
+    if (!tmp && -1 == PyObject_GetBuffer(buffer, &view, PyBUF_SIMPLE))
+        LCOV_EXCL_LINE_RETURN(NULL);
+    attribute_bytes_write(target, PyBytes_AS_STRING(value),
+                          PyBytes_GET_SIZE(value));
+    if (!tmp)
+        PyBuffer_Release(&view);
+
+    return into_finish(buffer, tmp, length);
+}
+
+
 PyDoc_STRVAR(TDI_TextEncoder_content__doc__,
 "content(self, value)\n\
 \n\
 :See: `abstract.Encoder`");
 
 static PyObject *
-TDI_TextEncoder_content(tdi_text_encoder_t *self, PyObject *args,
-                        PyObject *kwds)
+TDI_TextEncoder_content(tdi_text_encoder_t *self, TDI_ARGS_DEF)
 {
+    static const char * const kwlist[] = {"value", NULL};
+    static const tdi_args_t spec = {"content", kwlist, 1};
     PyObject *value_, *result;
-    static char *kwlist[] = {"value", NULL};
+    PyObject *argv[1];
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O", kwlist,
-                                     &value_))
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
         return NULL;
+    value_ = argv[0];
 
     Py_INCREF(value_);
-    result = encode_content(value_, self->encoding);
+    result = value_cached(self, VALUE_CONTENT, value_, encode_content);
     Py_DECREF(value_);
     return result;
 }
 
 
+PyDoc_STRVAR(TDI_TextEncoder_content_into__doc__,
+"content_into(self, buffer, value)\n\
+\n\
+:See: `abstract.Encoder`");
+
+static PyObject *
+TDI_TextEncoder_content_into(tdi_text_encoder_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {"buffer", "value", NULL};
+    static const tdi_args_t spec = {"content_into", kwlist, 2};
+    PyObject *buffer, *value, *result;
+    PyObject *argv[2];
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+    buffer = argv[0];
+    value = argv[1];
+
+    if (!(value = value_cached(self, VALUE_CONTENT, value, encode_content)))
+        return NULL;
+
+    result = into_bytes(buffer, value);
+    Py_DECREF(value);
+    return result;
+}
+
+
 PyDoc_STRVAR(TDI_TextEncoder_encode__doc__,
 "encode(self, value)\n\
 \n\
 :See: `abstract.Encoder`");
 
 static PyObject *
-TDI_TextEncoder_encode(tdi_text_encoder_t *self, PyObject *args,
-                       PyObject *kwds)
+TDI_TextEncoder_encode(tdi_text_encoder_t *self, TDI_ARGS_DEF)
 {
+    static const char * const kwlist[] = {"value", NULL};
+    static const tdi_args_t spec = {"encode", kwlist, 1};
     PyObject *value_, *result;
-    static char *kwlist[] = {"value", NULL};
+    PyObject *argv[1];
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O", kwlist,
-                                     &value_))
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
         return NULL;
+    value_ = argv[0];
 
     Py_INCREF(value_);
-    result = encode_encode(value_, self->encoding);
+    result = encode_encode(value_, &self->codec);
     Py_DECREF(value_);
     return result;
 }
@@ -630,59 +2001,186 @@ PyDoc_STRVAR(TDI_TextEncoder_escape__doc__,
 :See: `abstract.Encoder`");
 
 static PyObject *
-TDI_TextEncoder_escape(tdi_text_encoder_t *self, PyObject *args,
-                       PyObject *kwds)
+TDI_TextEncoder_escape(tdi_text_encoder_t *self, TDI_ARGS_DEF)
 {
+    static const char * const kwlist[] = {"value", NULL};
+    static const tdi_args_t spec = {"escape", kwlist, 1};
     PyObject *value_, *result;
-    static char *kwlist[] = {"value", NULL};
+    PyObject *argv[1];
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O", kwlist,
-                                     &value_))
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
         return NULL;
+    value_ = argv[0];
 
     Py_INCREF(value_);
-    result = encode_escape(value_, self->encoding);
+    result = encode_escape(value_, &self->codec);
     Py_DECREF(value_);
     return result;
 }
 
 
+PyDoc_STRVAR(TDI_TextEncoder_escape_content__doc__,
+"escape_content(self, value)\n\
+\n\
+:See: `abstract.Encoder`");
+
+static PyObject *
+TDI_TextEncoder_escape_content(tdi_text_encoder_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {"value", NULL};
+    static const tdi_args_t spec = {"escape_content", kwlist, 1};
+    PyObject *argv[1];
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+
+    return value_cached(self, VALUE_ESCAPE_CONTENT, argv[0],
+                        escape_content);
+}
+
+
+PyDoc_STRVAR(TDI_TextEncoder_encode_tags__doc__,
+"encode_tags(self, ops)\n\
+\n\
+:See: `abstract.Encoder`");
+
+static PyObject *
+TDI_TextEncoder_encode_tags(tdi_text_encoder_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {"ops", NULL};
+    static const tdi_args_t spec = {"encode_tags", kwlist, 1};
+    PyObject *ops;
+    PyObject *argv[1];
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+    ops = argv[0];
+
+    return encode_tags(ops, &self->codec, &self->scratch);
+}
+
+
+PyDoc_STRVAR(TDI_TextEncoder_content_join__doc__,
+"content_join(self, iterable, sep=b'', escape=True)\n\
+\n\
+:See: `abstract.Encoder`");
+
+static PyObject *
+TDI_TextEncoder_content_join(tdi_text_encoder_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {
+        "iterable", "sep", "escape", NULL
+    };
+    static const tdi_args_t spec = {"content_join", kwlist, 1};
+    PyObject *argv[3] = {NULL, NULL, NULL};
+    PyObject *result;
+    int escape = 1;
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+
+    if (argv[2] && -1 == (escape = PyObject_IsTrue(argv[2])))
+        return NULL;
+
+    if (argv[1])
+        return content_join(argv[0], argv[1], escape, &self->codec);
+
+    if (!(argv[1] = PyBytes_FromStringAndSize("", 0)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+    result = content_join(argv[0], argv[1], escape, &self->codec);
+    Py_DECREF(argv[1]);
+
+    return result;
+}
+
+
+PyDoc_STRVAR(TDI_TextEncoder_trim__doc__,
+"trim(self)\n\
+\n\
+:See: `abstract.Encoder`");
+
+static PyObject *
+TDI_TextEncoder_trim(tdi_text_encoder_t *self, PyObject *args)
+{
+    tdi_attrscratch_trim(&self->scratch);
+
+    Py_RETURN_NONE;
+}
+
+
 static struct PyMethodDef TDI_TextEncoder_methods[] = {
     {"starttag",
-     (PyCFunction)TDI_TextEncoder_starttag,           METH_VARARGS
-                                                    | METH_KEYWORDS,
+     (PyCFunction)TDI_TextEncoder_starttag,           TDI_ARGS_FLAGS,
      TDI_TextEncoder_starttag__doc__},
 
+    {"compile_starttag",
+     (PyCFunction)TDI_TextEncoder_compile_starttag,   TDI_ARGS_FLAGS,
+     TDI_TextEncoder_compile_starttag__doc__},
+
+    {"starttag_into",
+     (PyCFunction)TDI_TextEncoder_starttag_into,      TDI_ARGS_FLAGS,
+     TDI_TextEncoder_starttag_into__doc__},
+
     {"endtag",
-     (PyCFunction)TDI_TextEncoder_endtag,             METH_VARARGS
-                                                    | METH_KEYWORDS,
+     (PyCFunction)TDI_TextEncoder_endtag,             TDI_ARGS_FLAGS,
      TDI_TextEncoder_endtag__doc__},
 
+    {"endtag_into",
+     (PyCFunction)TDI_TextEncoder_endtag_into,        TDI_ARGS_FLAGS,
+     TDI_TextEncoder_endtag_into__doc__},
+
     {"name",
-     (PyCFunction)TDI_TextEncoder_name,               METH_VARARGS
-                                                    | METH_KEYWORDS,
+     (PyCFunction)TDI_TextEncoder_name,               TDI_ARGS_FLAGS,
      TDI_TextEncoder_name__doc__},
 
+    {"name_cache_info",
+     (PyCFunction)TDI_TextEncoder_name_cache_info,    METH_NOARGS,
+     TDI_TextEncoder_name_cache_info__doc__},
+
+    {"value_cache_info",
+     (PyCFunction)TDI_TextEncoder_value_cache_info,   METH_NOARGS,
+     TDI_TextEncoder_value_cache_info__doc__},
+
     {"attribute",
-     (PyCFunction)TDI_TextEncoder_attribute,          METH_VARARGS
-                                                    | METH_KEYWORDS,
+     (PyCFunction)TDI_TextEncoder_attribute,          TDI_ARGS_FLAGS,
      TDI_TextEncoder_attribute__doc__},
 
+    {"attribute_into",
+     (PyCFunction)TDI_TextEncoder_attribute_into,     TDI_ARGS_FLAGS,
+     TDI_TextEncoder_attribute_into__doc__},
+
     {"content",
-     (PyCFunction)TDI_TextEncoder_content,            METH_VARARGS
-                                                    | METH_KEYWORDS,
+     (PyCFunction)TDI_TextEncoder_content,            TDI_ARGS_FLAGS,
      TDI_TextEncoder_content__doc__},
 
+    {"content_into",
+     (PyCFunction)TDI_TextEncoder_content_into,       TDI_ARGS_FLAGS,
+     TDI_TextEncoder_content_into__doc__},
+
     {"encode",
-     (PyCFunction)TDI_TextEncoder_encode,             METH_VARARGS
-                                                    | METH_KEYWORDS,
+     (PyCFunction)TDI_TextEncoder_encode,             TDI_ARGS_FLAGS,
      TDI_TextEncoder_encode__doc__},
 
     {"escape",
-     (PyCFunction)TDI_TextEncoder_escape,             METH_VARARGS
-                                                    | METH_KEYWORDS,
+     (PyCFunction)TDI_TextEncoder_escape,             TDI_ARGS_FLAGS,
      TDI_TextEncoder_escape__doc__},
 
+    {"escape_content",
+     (PyCFunction)TDI_TextEncoder_escape_content,     TDI_ARGS_FLAGS,
+     TDI_TextEncoder_escape_content__doc__},
+
+    {"encode_tags",
+     (PyCFunction)TDI_TextEncoder_encode_tags,        TDI_ARGS_FLAGS,
+     TDI_TextEncoder_encode_tags__doc__},
+
+    {"content_join",
+     (PyCFunction)TDI_TextEncoder_content_join,       TDI_ARGS_FLAGS,
+     TDI_TextEncoder_content_join__doc__},
+
+    {"trim",
+     (PyCFunction)TDI_TextEncoder_trim,               METH_NOARGS,
+     TDI_TextEncoder_trim__doc__},
+
     {NULL, NULL}  /* Sentinel */
 };
 
@@ -691,12 +2189,21 @@ static int
 TDI_TextEncoder_setencoding(tdi_text_encoder_t *self, PyObject *value,
                             void *closure)
 {
-    PyObject *encoding = PyObject_Str(value);
-    if (!encoding)
+    tdi_codec_t codec;
+
+    if (!value) {
+        PyErr_SetString(PyExc_AttributeError, "cannot delete encoding");
+        return -1;
+    }
+
+    if (-1 == tdi_codec_init(&codec, value))
         return -1;
 
-    Py_CLEAR(self->encoding);
-    self->encoding = encoding;
+    tdi_codec_clear(&self->codec);
+    self->codec = codec;
+    if (self->names)
+        PyDict_Clear(self->names);
+    values_clear(self);
 
     return 0;
 }
@@ -704,7 +2211,7 @@ TDI_TextEncoder_setencoding(tdi_text_encoder_t *self, PyObject *value,
 static PyObject *
 TDI_TextEncoder_getencoding(tdi_text_encoder_t *self, void *closure)
 {
-    return Py_INCREF(self->encoding), self->encoding;
+    return Py_INCREF(self->codec.encoding), self->codec.encoding;
 }
 
 static PyGetSetDef TDI_TextEncoder_getset[] = {
@@ -719,28 +2226,84 @@ static PyGetSetDef TDI_TextEncoder_getset[] = {
 static PyObject *
 TDI_TextEncoder_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
 {
-    static char *kwlist[] = {"encoding", NULL};
-    PyObject *encoding;
+    static char *kwlist[] = {"encoding", "name_cache", "value_cache",
+                             "value_length", NULL};
+    PyObject *encoding, *names = NULL, *endtags = NULL;
+    PyObject *values[3] = {NULL, NULL, NULL};
     tdi_text_encoder_t *self;
+    tdi_codec_t codec;
+    Py_ssize_t names_max = 0, values_max = 0, values_length = 256;
+    int j;
 
-    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O", kwlist, &encoding))
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|nnn", kwlist,
+                                     &encoding, &names_max, &values_max,
+                                     &values_length))
         return NULL;
 
-    if (!(encoding = PyObject_Str(encoding)))
+    if (names_max < 0) {
+        PyErr_SetString(PyExc_ValueError,
+                        "name_cache must not be negative");
         return NULL;
+    }
+    if (values_max < 0) {
+        PyErr_SetString(PyExc_ValueError,
+                        "value_cache must not be negative");
+        return NULL;
+    }
+    if (values_length < 0) {
+        PyErr_SetString(PyExc_ValueError,
+                        "value_length must not be negative");
+        return NULL;
+    }
+
+    if (names_max > 0) {
+        if (!(names = PyDict_New()))
+            LCOV_EXCL_LINE_RETURN(NULL);
+        if (!(endtags = PyDict_New()))
+            LCOV_EXCL_LINE_GOTO(error_names);
+    }
+    if (values_max > 0) {
+        for (j = 0; j < 3; ++j) {
+            if (!(values[j] = PyDict_New()))
+                LCOV_EXCL_LINE_GOTO(error_names);
+        }
+    }
+
+    if (-1 == tdi_codec_init(&codec, encoding))
+        goto error_names;
 
     if (!(self = GENERIC_ALLOC(type))) {
         LCOV_EXCL_START
 
-        Py_DECREF(encoding);
-        return NULL;
+        tdi_codec_clear(&codec);
+        goto error_names;
 
         LCOV_EXCL_STOP
     }
 
-    self->encoding = encoding;
+    self->codec = codec;
+    tdi_attrscratch_init(&self->scratch);
+    self->names = names;
+    self->endtags = endtags;
+    self->names_max = names_max;
+    self->hits = self->misses = 0;
+    for (j = 0; j < 3; ++j) {
+        self->values[j].dict = values[j];
+        self->values[j].head.prev = self->values[j].head.next
+            = &self->values[j].head;
+    }
+    self->values_max = values_max;
+    self->values_length = values_length;
+    self->value_hits = self->value_misses = 0;
 
     return (PyObject *)self;
+
+error_names:
+    for (j = 0; j < 3; ++j)
+        Py_XDECREF(values[j]);
+    Py_XDECREF(endtags);
+    Py_XDECREF(names);
+    return NULL;
 }
 
 LCOV_EXCL_START
@@ -748,9 +2311,13 @@ static int
 TDI_TextEncoder_traverse(tdi_text_encoder_t *self, visitproc visit,
                          void *arg)
 {
-    Py_VISIT(self->encoding);
+    Py_VISIT(self->names);
+    Py_VISIT(self->endtags);
+    Py_VISIT(self->values[VALUE_ATTRIBUTE].dict);
+    Py_VISIT(self->values[VALUE_CONTENT].dict);
+    Py_VISIT(self->values[VALUE_ESCAPE_CONTENT].dict);
 
-    return 0;
+    return tdi_codec_traverse(&self->codec, visit, arg);
 }
 LCOV_EXCL_STOP
 
@@ -760,7 +2327,14 @@ TDI_TextEncoder_clear(tdi_text_encoder_t *self)
     if (self->weakreflist)
         PyObject_ClearWeakRefs((PyObject *)self);
 
-    Py_CLEAR(self->encoding);
+    tdi_codec_clear(&self->codec);
+    tdi_attrscratch_trim(&self->scratch);
+    values_clear(self);
+    Py_CLEAR(self->values[VALUE_ESCAPE_CONTENT].dict);
+    Py_CLEAR(self->values[VALUE_CONTENT].dict);
+    Py_CLEAR(self->values[VALUE_ATTRIBUTE].dict);
+    Py_CLEAR(self->endtags);
+    Py_CLEAR(self->names);
 
     return 0;
 }
@@ -768,7 +2342,7 @@ TDI_TextEncoder_clear(tdi_text_encoder_t *self)
 DEFINE_GENERIC_DEALLOC(TDI_TextEncoder)
 
 PyDoc_STRVAR(TDI_TextEncoder__doc__,
-"``TextEncoder(encoding)``\n\
+"``TextEncoder(encoding, name_cache=0, value_cache=0, value_length=256)``\n\
 \n\
 Encoder for text input");
 
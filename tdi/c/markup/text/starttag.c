@@ -0,0 +1,290 @@
+/*
+ * Copyright 2017
+ * Andr\xe9 Malo or his licensors, as applicable
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include "buffer.h"
+#include "length.h"
+#include "markup/text/starttag.h"
+
+
+/*
+ * Object structure for CompiledStartTag
+ *
+ * data contains the static parts of the tag: "[name", " key" for each key
+ * and the closing "]". ends[j] is the end offset of the j-th part (the
+ * head being part 0), the rest is the tail.
+ */
+typedef struct {
+    PyObject_HEAD
+    PyObject *weakreflist;
+
+    PyObject *data;
+    Py_ssize_t *ends;
+    Py_ssize_t nkeys;
+} tdi_compiled_starttag_t;
+
+
+/*
+ * Append a bytes object to the buffer
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+write_bytes(tdi_buf_t *buf, PyObject *value)
+{
+    if (!PyBytes_Check(value)) {
+        PyErr_SetString(PyExc_TypeError, "expected bytes");
+        return -1;
+    }
+
+    return tdi_buf_write(buf, PyBytes_AS_STRING(value),
+                         PyBytes_GET_SIZE(value));
+}
+
+
+/*
+ * Build the static parts
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+compile_starttag(tdi_compiled_starttag_t *self, PyObject *name,
+                 PyObject *keys, int closed)
+{
+    tdi_buf_t buf;
+    PyObject *items;
+    Py_ssize_t j, nkeys;
+
+    if (!(items = PySequence_Fast(keys, "expected iterable")))
+        return -1;
+    nkeys = PySequence_Fast_GET_SIZE(items);
+
+    if ((size_t)nkeys >= PY_SSIZE_T_MAX / sizeof *self->ends) {
+        LCOV_EXCL_START
+
+        PyErr_SetNone(PyExc_MemoryError);
+        goto error_items;
+
+        LCOV_EXCL_STOP
+    }
+    if (!(self->ends = PyMem_Malloc((size_t)(nkeys + 1)
+                                    * sizeof *self->ends))) {
+        LCOV_EXCL_START
+
+        PyErr_SetNone(PyExc_MemoryError);
+        goto error_items;
+
+        LCOV_EXCL_STOP
+    }
+
+    if (-1 == tdi_buf_init(&buf, 0))
+        LCOV_EXCL_LINE_GOTO(error_items);
+
+    if (-1 == tdi_buf_write(&buf, "[[", closed ? 2 : 1))
+        LCOV_EXCL_LINE_GOTO(error_buf);
+    if (-1 == write_bytes(&buf, name))
+        goto error_buf;
+    self->ends[0] = buf.length;
+
+    for (j = 0; j < nkeys; ++j) {
+        if (-1 == tdi_buf_write(&buf, " ", 1))
+            LCOV_EXCL_LINE_GOTO(error_buf);
+        if (-1 == write_bytes(&buf, PySequence_Fast_GET_ITEM(items, j)))
+            goto error_buf;
+        self->ends[j + 1] = buf.length;
+    }
+
+    if (-1 == tdi_buf_write(&buf, "]]", closed ? 2 : 1))
+        LCOV_EXCL_LINE_GOTO(error_buf);
+
+    if (!(self->data = tdi_buf_finish(&buf)))
+        LCOV_EXCL_LINE_GOTO(error_items);
+    self->nkeys = nkeys;
+
+    Py_DECREF(items);
+    return 0;
+
+error_buf:
+    tdi_buf_clear(&buf);
+error_items:
+    Py_DECREF(items);
+
+    return -1;
+}
+
+
+/* --------------- BEGIN TDI_CompiledStartTag DEFINITION --------------- */
+
+static PyObject *
+TDI_CompiledStartTag_call(tdi_compiled_starttag_t *self, PyObject *args,
+                          PyObject *kwds)
+{
+    PyObject *value, *result;
+    const char *data;
+    char *c;
+    Py_ssize_t j, length, start, size;
+
+    if (kwds && PyDict_Size(kwds)) {
+        PyErr_SetString(PyExc_TypeError,
+                        "keyword arguments are not supported");
+        return NULL;
+    }
+    if (PyTuple_GET_SIZE(args) != self->nkeys) {
+        PyErr_Format(PyExc_TypeError, "expected %ld values, got %ld",
+                     (long)self->nkeys, (long)PyTuple_GET_SIZE(args));
+        return NULL;
+    }
+
+    length = PyBytes_GET_SIZE(self->data);
+    for (j = 0; j < self->nkeys; ++j) {
+        value = PyTuple_GET_ITEM(args, j);
+        if (value == Py_None)
+            continue;
+        if (!PyBytes_Check(value)) {
+            PyErr_SetString(PyExc_TypeError, "expected bytes");
+            return NULL;
+        }
+        if (-1 == (length = length_add(length, PyBytes_GET_SIZE(value))))
+            LCOV_EXCL_LINE_RETURN(NULL);
+        if (-1 == (length = length_add(length, 1)))
+            LCOV_EXCL_LINE_RETURN(NULL);
+    }
+
+    if (!(result = PyBytes_FromStringAndSize(NULL, length)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+    c = PyBytes_AS_STRING(result);
+    data = PyBytes_AS_STRING(self->data);
+
+    (void)memcpy(c, data, (size_t)self->ends[0]);
+    c += self->ends[0];
+    for (j = 0; j < self->nkeys; ++j) {
+        start = self->ends[j];
+        size = self->ends[j + 1] - start;
+        (void)memcpy(c, data + start, (size_t)size);
+        c += size;
+
+        value = PyTuple_GET_ITEM(args, j);
+        if (value != Py_None) {
+            *c++ = '=';
+            size = PyBytes_GET_SIZE(value);
+            (void)memcpy(c, PyBytes_AS_STRING(value), (size_t)size);
+            c += size;
+        }
+    }
+    start = self->ends[self->nkeys];
+    (void)memcpy(c, data + start,
+                 (size_t)(PyBytes_GET_SIZE(self->data) - start));
+
+    return result;
+}
+
+static PyObject *
+TDI_CompiledStartTag_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+    static char *kwlist[] = {"name", "keys", "closed", NULL};
+    PyObject *name, *keys, *closed_;
+    tdi_compiled_starttag_t *self;
+    int closed;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OOO", kwlist,
+                                     &name, &keys, &closed_))
+        return NULL;
+
+    if (-1 == (closed = PyObject_IsTrue(closed_)))
+        return NULL;
+
+    if (!(self = GENERIC_ALLOC(type)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    if (-1 == compile_starttag(self, name, keys, closed)) {
+        Py_DECREF(self);
+        return NULL;
+    }
+
+    return (PyObject *)self;
+}
+
+static int
+TDI_CompiledStartTag_clear(tdi_compiled_starttag_t *self)
+{
+    if (self->weakreflist)
+        PyObject_ClearWeakRefs((PyObject *)self);
+
+    Py_CLEAR(self->data);
+    if (self->ends) {
+        PyMem_Free(self->ends);
+        self->ends = NULL;
+    }
+    self->nkeys = 0;
+
+    return 0;
+}
+
+DEFINE_GENERIC_DEALLOC(TDI_CompiledStartTag)
+
+PyDoc_STRVAR(TDI_CompiledStartTag__doc__,
+"``CompiledStartTag(name, keys, closed)``\n\
+\n\
+Precompiled starttag\n\
+\n\
+Calling the object with one value per key returns the starttag. Values are\n\
+expected to be quoted, escaped and encoded already. ``None`` emits the key\n\
+only.");
+
+PyTypeObject TDI_CompiledStartTag = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    EXT_MODULE_PATH ".CompiledStartTag",                /* tp_name */
+    sizeof(tdi_compiled_starttag_t),                    /* tp_basicsize */
+    0,                                                  /* tp_itemsize */
+    (destructor)TDI_CompiledStartTag_dealloc,           /* tp_dealloc */
+    0,                                                  /* tp_print */
+    0,                                                  /* tp_getattr */
+    0,                                                  /* tp_setattr */
+    0,                                                  /* tp_compare */
+    0,                                                  /* tp_repr */
+    0,                                                  /* tp_as_number */
+    0,                                                  /* tp_as_sequence */
+    0,                                                  /* tp_as_mapping */
+    0,                                                  /* tp_hash */
+    (ternaryfunc)TDI_CompiledStartTag_call,             /* tp_call */
+    0,                                                  /* tp_str */
+    0,                                                  /* tp_getattro */
+    0,                                                  /* tp_setattro */
+    0,                                                  /* tp_as_buffer */
+    Py_TPFLAGS_HAVE_WEAKREFS                            /* tp_flags */
+    | Py_TPFLAGS_HAVE_CLASS
+    | Py_TPFLAGS_BASETYPE,
+    TDI_CompiledStartTag__doc__,                        /* tp_doc */
+    0,                                                  /* tp_traverse */
+    0,                                                  /* tp_clear */
+    0,                                                  /* tp_richcompare */
+    offsetof(tdi_compiled_starttag_t, weakreflist),     /* tp_weaklistoffset */
+    0,                                                  /* tp_iter */
+    0,                                                  /* tp_iternext */
+    0,                                                  /* tp_methods */
+    0,                                                  /* tp_members */
+    0,                                                  /* tp_getset */
+    0,                                                  /* tp_base */
+    0,                                                  /* tp_dict */
+    0,                                                  /* tp_descr_get */
+    0,                                                  /* tp_descr_set */
+    0,                                                  /* tp_dictoffset */
+    0,                                                  /* tp_init */
+    0,                                                  /* tp_alloc */
+    TDI_CompiledStartTag_new,                           /* tp_new */
+};
+
+/* ---------------- END TDI_CompiledStartTag DEFINITION ---------------- */
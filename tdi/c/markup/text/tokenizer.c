@@ -0,0 +1,702 @@
+/*
+ * Copyright 2017
+ * Andr\xe9 Malo or his licensors, as applicable
+ *
+ * Licensed under the Apache License, Version 2.0 (the "License");
+ * you may not use this file except in compliance with the License.
+ * You may obtain a copy of the License at
+ *
+ *     http://www.apache.org/licenses/LICENSE-2.0
+ *
+ * Unless required by applicable law or agreed to in writing, software
+ * distributed under the License is distributed on an "AS IS" BASIS,
+ * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ * See the License for the specific language governing permissions and
+ * limitations under the License.
+ */
+
+#include "args.h"
+#include "bytestr.h"
+#include "markup/text/decoder.h"
+#include "markup/text/tokenizer.h"
+
+#ifdef EXT2
+#define INTERN PyString_InternFromString
+#else
+#define INTERN PyUnicode_InternFromString
+#endif
+
+#define IS_SPACE(c) ((c) == ' ' || (c) == '\t' || (c) == '\n' \
+                     || (c) == '\r' || (c) == '\f' || (c) == '\v')
+
+#define IS_NAME(c) (!IS_SPACE(c) && (c) != '[' && (c) != ']' && (c) != '=' \
+                    && (c) != '"' && (c) != '\'' && (c) != '/')
+
+#define IS_VALUE(c) (!IS_SPACE(c) && (c) != '[' && (c) != ']' \
+                     && (c) != '"' && (c) != '\'')
+
+/*
+ * Object structure for TextTokenizer
+ */
+typedef struct {
+    PyObject_HEAD
+    PyObject *weakreflist;
+
+    PyObject *errors;           /* error handler name */
+    PyObject *decoder;          /* C TextDecoder (called directly) or NULL */
+    PyObject *normalize;        /* bound decoder methods (if not) */
+    PyObject *decode;
+    PyObject *attribute;
+    PyObject *content;
+
+    PyObject *start;            /* event names */
+    PyObject *end;
+    PyObject *text;
+} tdi_text_tokenizer_t;
+
+
+/*
+ * Parsed tag
+ *
+ * The attributes are re-scanned (see attr_next) when the event is built.
+ */
+typedef enum {
+    TAG_START,
+    TAG_CLOSED,
+    TAG_END
+} tag_kind_t;
+
+typedef struct {
+    tag_kind_t kind;
+    const char *name;           /* tag name */
+    const char *name_end;
+    const char *attr;           /* start of the attributes */
+    const char *end;            /* behind the tag */
+} tag_t;
+
+
+/*
+ * Skip whitespace
+ *
+ * Return the pointer behind the whitespace
+ */
+static const char *
+scan_space(const char *p, const char *sentinel)
+{
+    while (p < sentinel && IS_SPACE(*p))
+        ++p;
+
+    return p;
+}
+
+
+/*
+ * Skip a name
+ *
+ * Return the pointer behind the name (p if there's no name)
+ */
+static const char *
+scan_name(const char *p, const char *sentinel)
+{
+    while (p < sentinel && IS_NAME(*p))
+        ++p;
+
+    return p;
+}
+
+
+/*
+ * Skip an attribute value (quoted or unquoted)
+ *
+ * A value running into the end of the data is skipped completely (the
+ * caller finds the tag incomplete).
+ *
+ * Return the pointer behind the value, NULL if there's no valid value
+ */
+static const char *
+scan_value(const char *p, const char *sentinel)
+{
+    const char *start = p;
+    char quote;
+
+    if (p < sentinel && (*p == '"' || *p == '\'')) {
+        for (quote = *p++; p < sentinel; ++p) {
+            if (*p == '\\') {
+                if (++p == sentinel)
+                    break;
+            }
+            else if (*p == quote) {
+                return p + 1;
+            }
+        }
+        return sentinel;
+    }
+
+    while (p < sentinel && IS_VALUE(*p))
+        ++p;
+
+    return (p > start || p == sentinel) ? p : NULL;
+}
+
+
+/*
+ * Scan the next attribute
+ *
+ * *pos is moved behind the attribute or onto the closing bracket. value
+ * and value_end are set to NULL for attributes without value.
+ *
+ * Return -2 if the data ends within the tag, -1 if the tag is invalid, 0
+ * if there are no more attributes, 1 if an attribute was found
+ */
+static int
+attr_next(const char **pos, const char *sentinel, const char **key,
+          const char **key_end, const char **value, const char **value_end)
+{
+    const char *p, *q;
+
+    if ((p = scan_space(*pos, sentinel)) == sentinel)
+        return -2;
+    if (*p == ']') {
+        *pos = p;
+        return 0;
+    }
+    if (p == *pos || (q = scan_name(p, sentinel)) == p)
+        return -1;
+
+    *key = p;
+    *key_end = q;
+    if (q < sentinel && *q == '=') {
+        if (!(p = scan_value(++q, sentinel)))
+            return -1;
+        *value = q;
+        *value_end = q = p;
+    }
+    else {
+        *value = *value_end = NULL;
+    }
+    *pos = q;
+
+    return 1;
+}
+
+
+/*
+ * Parse a tag
+ *
+ * p points to the opening bracket.
+ *
+ * Return -1 if the data ends within a (possibly) valid tag, 0 if there's
+ * no valid tag, 1 otherwise
+ */
+static int
+tag_parse(tag_t *tag, const char *p, const char *sentinel)
+{
+    const char *key, *key_end, *value, *value_end;
+    int res;
+
+    if (++p == sentinel)
+        return -1;
+
+    if (*p == '/') {
+        tag->name = ++p;
+        tag->name_end = p = scan_name(p, sentinel);
+        if (p == sentinel)
+            return -1;
+        if (p == tag->name || *p != ']')
+            return 0;
+        tag->kind = TAG_END;
+        tag->end = p + 1;
+        return 1;
+    }
+
+    tag->kind = TAG_START;
+    if (*p == '[') {
+        tag->kind = TAG_CLOSED;
+        if (++p == sentinel)
+            return -1;
+    }
+    tag->name = p;
+    tag->attr = tag->name_end = p = scan_name(p, sentinel);
+    if (p == sentinel)
+        return -1;
+    if (p == tag->name)
+        return 0;
+
+    while (1 == (res = attr_next(&p, sentinel, &key, &key_end, &value,
+                                 &value_end)))
+        ;
+    if (res < 0)
+        return res == -2 ? -1 : 0;
+
+    if (tag->kind == TAG_CLOSED) {
+        if (++p == sentinel)
+            return -1;
+        if (*p != ']')
+            return 0;
+    }
+    tag->end = p + 1;
+
+    return 1;
+}
+
+
+/*
+ * Find the end of the complete characters of trailing text
+ *
+ * Up to three UTF-8 continuation bytes and the lead byte before them are
+ * held back. With single byte encodings these are complete characters,
+ * which are merely delayed.
+ *
+ * Return the end pointer
+ */
+static const char *
+text_end(const char *start, const char *end)
+{
+    const char *p = end;
+
+    while (p > start && end - p < 3
+           && ((unsigned char)p[-1] & 0xC0) == 0x80)
+        --p;
+    if (p > start && ((unsigned char)p[-1] & 0xC0) == 0xC0)
+        --p;
+
+    return p;
+}
+
+
+/*
+ * Decode a piece of data
+ *
+ * The C TextDecoder is called directly, other decoders via their methods.
+ *
+ * Return the decoded value or NULL on error
+ */
+static PyObject *
+decode(tdi_text_tokenizer_t *self, tdi_text_decode_t what, PyObject *data,
+       const char *source, const char *start, const char *end)
+{
+    PyObject *method, *name, *result;
+
+    if (self->decoder)
+        return tdi_text_decoder_string(self->decoder, what, start,
+                                       (Py_ssize_t)(end - start),
+                                       self->errors);
+
+    method = what == TDI_TEXT_DECODE_ATTRIBUTE ? self->attribute
+           : what == TDI_TEXT_DECODE_CONTENT ? self->content
+           : self->decode;
+    result = PyObject_CallFunction(method, "(OOnn)", data, self->errors,
+                                   (Py_ssize_t)(start - source),
+                                   (Py_ssize_t)(end - start));
+    if (!result || what != TDI_TEXT_DECODE_NAME)
+        return result;
+
+    name = result;
+    result = PyObject_CallFunctionObjArgs(self->normalize, name, NULL);
+    Py_DECREF(name);
+    return result;
+}
+
+
+/*
+ * Append an event to the list
+ *
+ * The event is stolen.
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+push(PyObject *events, PyObject *event)
+{
+    int res;
+
+    if (!event)
+        return -1;
+
+    res = PyList_Append(events, event);
+    Py_DECREF(event);
+    return res;
+}
+
+
+/*
+ * Append a text event
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+push_text(tdi_text_tokenizer_t *self, PyObject *events, PyObject *data,
+          const char *source, const char *start, const char *end)
+{
+    PyObject *text;
+
+    if (!(text = decode(self, TDI_TEXT_DECODE_CONTENT, data, source, start,
+                        end)))
+        return -1;
+
+    return push(events, Py_BuildValue("(ON)", self->text, text));
+}
+
+
+/*
+ * Build the attribute list of a start tag
+ *
+ * Return the list or NULL on error
+ */
+static PyObject *
+tag_attributes(tdi_text_tokenizer_t *self, tag_t *tag, PyObject *data,
+               const char *source)
+{
+    PyObject *result, *key, *value;
+    const char *p, *key_s, *key_end, *value_s, *value_end;
+
+    if (!(result = PyList_New(0)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    for (p = tag->attr; 1 == attr_next(&p, tag->end, &key_s, &key_end,
+                                       &value_s, &value_end); ) {
+        if (!(key = decode(self, TDI_TEXT_DECODE_NAME, data, source, key_s,
+                           key_end)))
+            goto error;
+
+        if (!value_s) {
+            Py_INCREF(Py_None);
+            value = Py_None;
+        }
+        else if (!(value = decode(self, TDI_TEXT_DECODE_ATTRIBUTE, data,
+                                  source, value_s, value_end))) {
+            Py_DECREF(key);
+            goto error;
+        }
+
+        if (-1 == push(result, Py_BuildValue("(NN)", key, value)))
+            goto error;
+    }
+
+    return result;
+
+error:
+    Py_DECREF(result);
+    return NULL;
+}
+
+
+/*
+ * Append a tag event
+ *
+ * Return -1 on error, 0 on success
+ */
+static int
+push_tag(tdi_text_tokenizer_t *self, PyObject *events, tag_t *tag,
+         PyObject *data, const char *source)
+{
+    PyObject *name, *attr;
+
+    if (!(name = decode(self, TDI_TEXT_DECODE_NAME, data, source, tag->name,
+                        tag->name_end)))
+        return -1;
+
+    if (tag->kind == TAG_END)
+        return push(events, Py_BuildValue("(ON)", self->end, name));
+
+    if (!(attr = tag_attributes(self, tag, data, source))) {
+        Py_DECREF(name);
+        return -1;
+    }
+
+    return push(events, Py_BuildValue("(ONNO)", self->start, name, attr,
+                                      tag->kind == TAG_CLOSED ? Py_True
+                                                              : Py_False));
+}
+
+
+/*
+ * Split markup into events
+ *
+ * Unless final is true, scanning stops before a tag or character cut off
+ * by the end of the data. The number of bytes processed is stored in
+ * *consumed.
+ *
+ * Return the list of events or NULL on error
+ */
+static PyObject *
+scan(tdi_text_tokenizer_t *self, PyObject *data, int final,
+     Py_ssize_t *consumed)
+{
+    PyObject *events;
+    tdi_bytestr_t input;
+    const char *source, *sentinel, *text, *p;
+    tag_t tag;
+    int res;
+
+    Py_INCREF(data);
+    if (-1 == tdi_bytestr_init(&input, data))
+        return NULL;
+
+    if (!(events = PyList_New(0)))
+        LCOV_EXCL_LINE_GOTO(error_input);
+
+    text = p = source = input.bytes;
+    sentinel = source + input.length;
+    while ((p = memchr(p, '[', (size_t)(sentinel - p)))) {
+        if (1 != (res = tag_parse(&tag, p, sentinel))) {
+            if (res == -1 && !final) {
+                sentinel = p;
+                break;
+            }
+            /* Escape ("[]") or literal bracket */
+            p += (p + 1 < sentinel && p[1] == ']') ? 2 : 1;
+            continue;
+        }
+
+        if (p > text
+            && -1 == push_text(self, events, data, source, text, p))
+            goto error;
+        if (-1 == push_tag(self, events, &tag, data, source))
+            goto error;
+        text = p = tag.end;
+    }
+
+    if (!final && !p)
+        sentinel = text_end(text, sentinel);
+    if (sentinel > text
+        && -1 == push_text(self, events, data, source, text, sentinel))
+        goto error;
+
+    *consumed = (Py_ssize_t)(sentinel - source);
+    tdi_bytestr_clear(&input);
+    return events;
+
+error:
+    Py_DECREF(events);
+error_input:
+    tdi_bytestr_clear(&input);
+    return NULL;
+}
+
+/* ------------------ BEGIN TDI_TextTokenizer DEFINITION ----------------- */
+
+PyDoc_STRVAR(TDI_TextTokenizer_tokenize__doc__,
+"tokenize(self, data)\n\
+\n\
+Split markup into events\n\
+\n\
+:Parameters:\n\
+  `data` : ``bytes``\n\
+    The markup. Any object providing the buffer protocol (e.g.\n\
+    ``bytearray`` or an ``mmap``) is accepted as well.\n\
+\n\
+:Return: List of events\n\
+:Rtype: ``list``\n\
+\n\
+:Exceptions:\n\
+  - `TypeError` : Unicode data");
+
+static PyObject *
+TDI_TextTokenizer_tokenize(tdi_text_tokenizer_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {"data", NULL};
+    static const tdi_args_t spec = {"tokenize", kwlist, 1};
+    PyObject *argv[1];
+    Py_ssize_t consumed;
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+
+    return scan(self, argv[0], 1, &consumed);
+}
+
+
+PyDoc_STRVAR(TDI_TextTokenizer_scan__doc__,
+"scan(self, data, final=True)\n\
+\n\
+Split (a chunk of) markup into events\n\
+\n\
+:Parameters:\n\
+  `data` : ``bytes``\n\
+    The markup. Any object providing the buffer protocol (e.g.\n\
+    ``bytearray`` or an ``mmap``) is accepted as well.\n\
+\n\
+  `final` : ``bool``\n\
+    Is this the end of the input? If false, a tag or character cut off\n\
+    by the end of `data` is left unprocessed.\n\
+\n\
+:Return: The list of events and the number of bytes processed. The rest\n\
+         needs to be passed again (prepended to the next chunk).\n\
+:Rtype: ``tuple``\n\
+\n\
+:Exceptions:\n\
+  - `TypeError` : Unicode data");
+
+static PyObject *
+TDI_TextTokenizer_scan(tdi_text_tokenizer_t *self, TDI_ARGS_DEF)
+{
+    static const char * const kwlist[] = {"data", "final", NULL};
+    static const tdi_args_t spec = {"scan", kwlist, 1};
+    PyObject *argv[2] = {NULL, NULL};
+    PyObject *events;
+    Py_ssize_t consumed;
+    int final = 1;
+
+    if (-1 == tdi_args_parse(&spec, argv, TDI_ARGS))
+        return NULL;
+
+    if (argv[1] && -1 == (final = PyObject_IsTrue(argv[1])))
+        return NULL;
+
+    if (!(events = scan(self, argv[0], final, &consumed)))
+        return NULL;
+
+    return Py_BuildValue("(Nn)", events, consumed);
+}
+
+
+static struct PyMethodDef TDI_TextTokenizer_methods[] = {
+    {"tokenize",
+     (PyCFunction)TDI_TextTokenizer_tokenize,         TDI_ARGS_FLAGS,
+     TDI_TextTokenizer_tokenize__doc__},
+
+    {"scan",
+     (PyCFunction)TDI_TextTokenizer_scan,             TDI_ARGS_FLAGS,
+     TDI_TextTokenizer_scan__doc__},
+
+    {NULL, NULL}  /* Sentinel */
+};
+
+static PyObject *
+TDI_TextTokenizer_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+    static char *kwlist[] = {"decoder", "errors", NULL};
+    PyObject *decoder, *errors = NULL;
+    tdi_text_tokenizer_t *self;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "O|O", kwlist, &decoder,
+                                     &errors))
+        return NULL;
+
+    if (!(self = GENERIC_ALLOC(type)))
+        LCOV_EXCL_LINE_RETURN(NULL);
+
+    if (errors) {
+        Py_INCREF(errors);
+        self->errors = errors;
+    }
+    else if (!(self->errors = INTERN("strict")))
+        LCOV_EXCL_LINE_GOTO(error);
+
+    if (TDI_TextDecoder_CheckExact(decoder)) {
+        Py_INCREF(decoder);
+        self->decoder = decoder;
+    }
+    else if (!(self->normalize = PyObject_GetAttrString(decoder,
+                                                        "normalize")))
+        goto error;
+    else if (!(self->decode = PyObject_GetAttrString(decoder, "decode")))
+        goto error;
+    else if (!(self->attribute = PyObject_GetAttrString(decoder,
+                                                        "attribute")))
+        goto error;
+    else if (!(self->content = PyObject_GetAttrString(decoder, "content")))
+        goto error;
+
+    if (!(self->start = INTERN("start")))
+        LCOV_EXCL_LINE_GOTO(error);
+    if (!(self->end = INTERN("end")))
+        LCOV_EXCL_LINE_GOTO(error);
+    if (!(self->text = INTERN("text")))
+        LCOV_EXCL_LINE_GOTO(error);
+
+    return (PyObject *)self;
+
+error:
+    Py_DECREF(self);
+    return NULL;
+}
+
+LCOV_EXCL_START
+static int
+TDI_TextTokenizer_traverse(tdi_text_tokenizer_t *self, visitproc visit,
+                           void *arg)
+{
+    Py_VISIT(self->errors);
+    Py_VISIT(self->decoder);
+    Py_VISIT(self->normalize);
+    Py_VISIT(self->decode);
+    Py_VISIT(self->attribute);
+    Py_VISIT(self->content);
+
+    return 0;
+}
+LCOV_EXCL_STOP
+
+static int
+TDI_TextTokenizer_clear(tdi_text_tokenizer_t *self)
+{
+    if (self->weakreflist)
+        PyObject_ClearWeakRefs((PyObject *)self);
+
+    Py_CLEAR(self->errors);
+    Py_CLEAR(self->decoder);
+    Py_CLEAR(self->normalize);
+    Py_CLEAR(self->decode);
+    Py_CLEAR(self->attribute);
+    Py_CLEAR(self->content);
+    Py_CLEAR(self->start);
+    Py_CLEAR(self->end);
+    Py_CLEAR(self->text);
+
+    return 0;
+}
+
+DEFINE_GENERIC_DEALLOC(TDI_TextTokenizer)
+
+PyDoc_STRVAR(TDI_TextTokenizer__doc__,
+"``TextTokenizer(decoder, errors='strict')``\n\
+\n\
+Tokenizer for text markup");
+
+PyTypeObject TDI_TextTokenizer = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    EXT_MODULE_PATH ".TextTokenizer",                   /* tp_name */
+    sizeof(tdi_text_tokenizer_t),                       /* tp_basicsize */
+    0,                                                  /* tp_itemsize */
+    (destructor)TDI_TextTokenizer_dealloc,              /* tp_dealloc */
+    0,                                                  /* tp_print */
+    0,                                                  /* tp_getattr */
+    0,                                                  /* tp_setattr */
+    0,                                                  /* tp_compare */
+    0,                                                  /* tp_repr */
+    0,                                                  /* tp_as_number */
+    0,                                                  /* tp_as_sequence */
+    0,                                                  /* tp_as_mapping */
+    0,                                                  /* tp_hash */
+    0,                                                  /* tp_call */
+    0,                                                  /* tp_str */
+    0,                                                  /* tp_getattro */
+    0,                                                  /* tp_setattro */
+    0,                                                  /* tp_as_buffer */
+    Py_TPFLAGS_HAVE_WEAKREFS                            /* tp_flags */
+    | Py_TPFLAGS_HAVE_CLASS
+    | Py_TPFLAGS_BASETYPE
+    | Py_TPFLAGS_HAVE_GC,
+    TDI_TextTokenizer__doc__,                           /* tp_doc */
+    (traverseproc)TDI_TextTokenizer_traverse,           /* tp_traverse */
+    (inquiry)TDI_TextTokenizer_clear,                   /* tp_clear */
+    0,                                                  /* tp_richcompare */
+    offsetof(tdi_text_tokenizer_t, weakreflist),        /* tp_weaklistoffset */
+    0,                                                  /* tp_iter */
+    0,                                                  /* tp_iternext */
+    TDI_TextTokenizer_methods,                          /* tp_methods */
+    0,                                                  /* tp_members */
+    0,                                                  /* tp_getset */
+    0,                                                  /* tp_base */
+    0,                                                  /* tp_dict */
+    0,                                                  /* tp_descr_get */
+    0,                                                  /* tp_descr_set */
+    0,                                                  /* tp_dictoffset */
+    0,                                                  /* tp_init */
+    0,                                                  /* tp_alloc */
+    TDI_TextTokenizer_new,                              /* tp_new */
+};
+
+/* ------------------- END TDI_TextTokenizer DEFINITION ------------------ */
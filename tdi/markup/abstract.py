@@ -56,37 +56,116 @@ class Decoder(_abstract.base):
         """
 
     @_abstract.method
-    def decode(self, value, errors='strict'):
+    def decode(self, value, errors='strict', offset=0, length=None):
         """
         Decode an arbitrary value
 
         :Parameters:
           `value` : ``bytes``
-            attribute value
+            Raw value. Any object providing the buffer protocol
+            (e.g. ``bytearray`` or a ``memoryview`` of an ``mmap``) is
+            accepted as well.
 
           `errors` : ``str``
             Error handler description
 
+          `offset` : ``int``
+            Start of the value within the buffer
+
+          `length` : ``int``
+            Maximum length of the value within the buffer. If omitted or
+            ``None``, the rest of the buffer is used.
+
         :Return: The decoded value
         :Rtype: text
         """
 
     @_abstract.method
-    def attribute(self, value, errors='strict'):
+    def attribute(self, value, errors='strict', offset=0, length=None):
         """
         Decode a raw attribute value
 
         :Parameters:
           `value` : ``bytes``
-            Raw attribute value
+            Raw attribute value. Any object providing the buffer protocol
+            (e.g. ``bytearray`` or a ``memoryview`` of an ``mmap``) is
+            accepted as well.
 
           `errors` : ``str``
             Error handler description
 
+          `offset` : ``int``
+            Start of the value within the buffer
+
+          `length` : ``int``
+            Maximum length of the value within the buffer. If omitted or
+            ``None``, the rest of the buffer is used.
+
         :Return: The decoded attribute
         :Rtype: text
         """
 
+    @_abstract.method
+    def attributes(self, attr, errors='strict'):
+        """
+        Decode a list of raw attributes
+
+        :Parameters:
+          `attr` : iterable
+            List of ``(name, value)`` tuples. The name is decoded and
+            normalized, the value is decoded as attribute value (``None``
+            values are passed through)
+
+          `errors` : ``str``
+            Error handler description
+
+        :Return: List of decoded ``(name, value)`` tuples
+        :Rtype: ``list``
+        """
+
+    @_abstract.method
+    def content(self, value, errors='strict', offset=0, length=None):
+        """
+        Decode raw text content (and reverse `Encoder.escape`)
+
+        :Parameters:
+          `value` : ``bytes``
+            Raw text content. Any object providing the buffer protocol
+            (e.g. ``bytearray`` or a ``memoryview`` of an ``mmap``) is
+            accepted as well.
+
+          `errors` : ``str``
+            Error handler description
+
+          `offset` : ``int``
+            Start of the value within the buffer
+
+          `length` : ``int``
+            Maximum length of the value within the buffer. If omitted or
+            ``None``, the rest of the buffer is used.
+
+        :Return: The decoded content
+        :Rtype: text
+        """
+
+    @_abstract.method
+    def incremental(self, kind='decode', errors='strict'):
+        """
+        Create an incremental decoder for chunked input
+
+        :Parameters:
+          `kind` : ``str``
+            What to decode: ``'decode'`` (like `decode`), ``'content'``
+            (like `content`) or ``'attribute'`` (like `attribute`)
+
+          `errors` : ``str``
+            Error handler description
+
+        :Return: Incremental decoder, providing ``feed(chunk)`` and
+                 ``close()`` methods, both returning decoded text
+        :Rtype: any
+        """
+
 
 class Encoder(_abstract.base):
     """
@@ -103,12 +182,13 @@ class Encoder(_abstract.base):
         Build a starttag
 
         :Parameters:
-          `name` : ``bytes``
+          `name` : ``bytes`` or buffer
             The tag name (already encoded)
 
           `attr` : iterable
-            The tag attributes (``((name, value), ...)``), aleady quoted,
-            escaped and encoded
+            The tag attributes (``((name, value), ...)`` or a mapping
+            ``{name: value}``), aleady quoted, escaped and encoded. Names
+            and values may be bytes or other (contiguous) buffers.
 
           `closed` : ``bool``
             Closed tag?
@@ -117,19 +197,84 @@ class Encoder(_abstract.base):
         :Rtype: ``bytes``
         """
 
+    @_abstract.method
+    def compile_starttag(self, name, keys, closed):
+        """
+        Precompile a starttag with fixed name and attribute keys
+
+        The result is a callable, which takes one value per key (already
+        quoted, escaped and encoded, or ``None`` for keys without value) and
+        returns the starttag, like `starttag` would.
+
+        :Parameters:
+          `name` : ``bytes``
+            The tag name (already encoded)
+
+          `keys` : iterable
+            The attribute names (already encoded)
+
+          `closed` : ``bool``
+            Closed tag?
+
+        :Return: The compiled starttag
+        :Rtype: callable
+        """
+
+    @_abstract.method
+    def starttag_into(self, buffer, name, attr, closed):
+        """
+        Build a starttag and append it to a buffer
+
+        :Parameters:
+          `buffer` : ``bytearray``
+            The buffer to append to. Any object providing an ``extend``
+            method accepting bytes works as well.
+
+          `name` : ``bytes`` or buffer
+            The tag name (already encoded)
+
+          `attr` : iterable
+            The tag attributes (``((name, value), ...)`` or a mapping
+            ``{name: value}``), aleady quoted, escaped and encoded. Names
+            and values may be bytes or other (contiguous) buffers.
+
+          `closed` : ``bool``
+            Closed tag?
+
+        :Return: The number of bytes appended
+        :Rtype: ``int``
+        """
+
     @_abstract.method
     def endtag(self, name):
         """
         Build an endtag
 
         :Parameters:
-          `name` : ``bytes``
+          `name` : ``bytes`` or buffer
             Tag name (already encoded)
 
         :Return: The endtag
         :Rtype: ``bytes``
         """
 
+    @_abstract.method
+    def endtag_into(self, buffer, name):
+        """
+        Build an endtag and append it to a buffer
+
+        :Parameters:
+          `buffer` : ``bytearray``
+            The buffer to append to. Any object providing an ``extend``
+            method accepting bytes works as well.
+
+          `name` : ``bytes`` or buffer
+            Tag name (already encoded)
+
+        :Return: The number of bytes appended
+        :Rtype: ``int``
+        """
+
     @_abstract.method
     def name(self, name):
         """
@@ -159,6 +304,23 @@ class Encoder(_abstract.base):
         :Rtype: ``bytes``
         """
 
+    @_abstract.method
+    def attribute_into(self, buffer, value):
+        """
+        Encode an attribute value and append it to a buffer
+
+        :Parameters:
+          `buffer` : ``bytearray``
+            The buffer to append to. Any object providing an ``extend``
+            method accepting bytes works as well.
+
+          `value` : ``basestring``
+            The value to encode
+
+        :Return: The number of bytes appended
+        :Rtype: ``int``
+        """
+
     @_abstract.method
     def content(self, value):
         """
@@ -172,6 +334,23 @@ class Encoder(_abstract.base):
         :Rtype: ``bytes``
         """
 
+    @_abstract.method
+    def content_into(self, buffer, value):
+        """
+        Encode text content and append it to a buffer
+
+        :Parameters:
+          `buffer` : ``bytearray``
+            The buffer to append to. Any object providing an ``extend``
+            method accepting bytes works as well.
+
+          `value` : ``basestring``
+            The value to encode
+
+        :Return: The number of bytes appended
+        :Rtype: ``int``
+        """
+
     @_abstract.method
     def encode(self, value):
         """
@@ -197,3 +376,77 @@ class Encoder(_abstract.base):
         :Return: The escaped value
         :Rtype: ``basestring``
         """
+
+    @_abstract.method
+    def escape_content(self, value):
+        """
+        Escape and encode text content
+
+        This is equivalent to ``content(escape(value))``, but may be
+        implemented more efficiently.
+
+        :Parameters:
+          `value` : ``basestring``
+            The value to escape and encode
+
+        :Return: The escaped and encoded text
+        :Rtype: ``bytes``
+        """
+
+    @_abstract.method
+    def content_join(self, iterable, sep=b'', escape=True):
+        """
+        Encode the items of an iterable as text content and join them
+
+        This is equivalent to ``sep.join(map(escape_content, iterable))``
+        (or `content` instead of `escape_content`, if `escape` is false),
+        but may be implemented more efficiently.
+
+        :Parameters:
+          `iterable` : iterable
+            The values to encode
+
+          `sep` : ``bytes``
+            Separator (already encoded)
+
+          `escape` : ``bool``
+            Escape the values?
+
+        :Return: The joined content
+        :Rtype: ``bytes``
+        """
+
+    @_abstract.method
+    def encode_tags(self, ops):
+        """
+        Encode a sequence of tag operations into a single string
+
+        Each operation is a sequence, where the first item determines the
+        kind of the operation:
+
+        ``('start', name, attr, closed)``
+          A starttag, see `starttag`
+
+        ``('end', name)``
+          An endtag, see `endtag`
+
+        ``('content', value)``
+          Text content, see `content`
+
+        :Parameters:
+          `ops` : iterable
+            The operations
+
+        :Return: The encoded operations, concatenated
+        :Rtype: ``bytes``
+        """
+
+    @_abstract.method
+    def trim(self):
+        """
+        Release memory kept for reuse between calls
+
+        Implementations may hold on to temporary storage in order to avoid
+        allocations for every tag. This is bounded in size, but can be
+        released explicitly (e.g. after rendering a huge page).
+        """
@@ -27,3 +27,5 @@ This package contains TDI's builtin text markup.
 """
 __author__ = u"Andr\xe9 Malo"
 __docformat__ = "restructuredtext en"
+
+from .tokenizer import iterparse  # noqa pylint: disable = unused-import
@@ -0,0 +1,350 @@
+# -*- coding: ascii -*-
+u"""
+:Copyright:
+
+ Copyright 2017
+ Andr\xe9 Malo or his licensors, as applicable
+
+:License:
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+===================
+ Template Compiler
+===================
+
+Template Compiler.
+
+Everything in a parsed template not marked for user code is static. The
+compiler pre-encodes these parts into few large bytes blobs, interleaved
+with `Hole` descriptors for the marked nodes (nodes with a marker
+attribute, ``tdi`` by default). Rendering then mostly copies precomputed
+bytes instead of encoding every tag again.
+"""
+__author__ = u"Andr\xe9 Malo"
+__docformat__ = "restructuredtext en"
+
+
+class Hole(object):
+    """
+    Marked node within a compiled template
+
+    The marker attribute is not part of the node's attributes or tags.
+
+    :IVariables:
+      `name` : ``str``
+        The marker attribute value (``None`` if the attribute has no value)
+
+      `tagname` : ``str``
+        The (decoded) tag name
+
+      `attr` : ``list``
+        The (decoded) attributes as ``(name, value)`` tuples
+
+      `closed` : ``bool``
+        Closed tag?
+
+      `starttag` : ``bytes``
+        The encoded starttag
+
+      `endtag` : ``bytes``
+        The encoded endtag (empty for closed tags and for nodes not closed
+        within the template)
+
+      `content` : `CompiledTemplate`
+        The compiled content of the node (``None`` for closed tags)
+    """
+    __slots__ = ('name', 'tagname', 'attr', 'closed', 'starttag', 'endtag',
+                 'content')
+
+    def __init__(self, name, tagname, attr, closed, starttag):
+        """
+        Initialization
+
+        :Parameters:
+          `name` : ``str``
+            The marker attribute value
+
+          `tagname` : ``str``
+            The tag name
+
+          `attr` : ``list``
+            The attributes
+
+          `closed` : ``bool``
+            Closed tag?
+
+          `starttag` : ``bytes``
+            The encoded starttag
+        """
+        self.name = name
+        self.tagname = tagname
+        self.attr = attr
+        self.closed = closed
+        self.starttag = starttag
+        self.endtag = b''
+        self.content = None
+
+    def __repr__(self):
+        """ Debug representation """
+        return "<%s %r (%r)>" % (
+            self.__class__.__name__, self.name, self.tagname
+        )
+
+    def render_into(self, buffer, fill=None):
+        """
+        Render the node as it was compiled and append it to a buffer
+
+        :Parameters:
+          `buffer` : ``bytearray``
+            The buffer to append to. Any object providing an ``extend``
+            method accepting bytes works as well.
+
+          `fill` : callable
+            Passed to the content's `CompiledTemplate.render_into`, so it's
+            applied to nested holes
+
+        :Return: The number of bytes appended
+        :Rtype: ``int``
+        """
+        buffer.extend(self.starttag)
+        length = len(self.starttag)
+        if self.content is not None:
+            length += self.content.render_into(buffer, fill)
+        buffer.extend(self.endtag)
+        return length + len(self.endtag)
+
+
+class CompiledTemplate(object):
+    """
+    Compiled template
+
+    The template is stored as a sequence of static bytes blobs with one
+    `Hole` between each two of them.
+    """
+    __slots__ = ('_static', '_holes')
+
+    def __init__(self, static, holes):
+        """
+        Initialization
+
+        :Parameters:
+          `static` : iterable
+            The static blobs (``bytes``), one more than `holes`
+
+          `holes` : iterable
+            The holes (`Hole`)
+
+        :Exceptions:
+          - `ValueError` : Number of blobs and holes don't match
+        """
+        self._static = tuple(static)
+        self._holes = tuple(holes)
+        if len(self._static) != len(self._holes) + 1:
+            raise ValueError("Expected exactly one blob more than holes")
+
+    @property
+    def static(self):
+        """
+        The static blobs
+
+        :Type: ``tuple``
+        """
+        return self._static
+
+    @property
+    def holes(self):
+        """
+        The holes
+
+        :Type: ``tuple``
+        """
+        return self._holes
+
+    def render_into(self, buffer, fill=None):
+        """
+        Render the template and append it to a buffer
+
+        :Parameters:
+          `buffer` : ``bytearray``
+            The buffer to append to. Any object providing an ``extend``
+            method accepting bytes works as well.
+
+          `fill` : callable
+            Called as ``fill(hole, buffer)`` for each hole and expected to
+            append the node's output to the buffer and to return the number
+            of bytes appended (``hole.render_into`` renders the node
+            unchanged). If omitted or ``None``, all holes are rendered
+            unchanged.
+
+        :Return: The number of bytes appended
+        :Rtype: ``int``
+        """
+        static = self._static
+        buffer.extend(static[0])
+        length = len(static[0])
+        if not self._holes:
+            return length
+
+        extend = buffer.extend
+        for hole, blob in zip(self._holes, static[1:]):
+            if fill is None:
+                length += hole.render_into(buffer)
+            else:
+                length += fill(hole, buffer)
+            extend(blob)
+            length += len(blob)
+        return length
+
+    def render(self, fill=None):
+        """
+        Render the template
+
+        :Parameters:
+          `fill` : callable
+            Hole filler, see `render_into`
+
+        :Return: The rendered template
+        :Rtype: ``bytes``
+        """
+        if not self._holes:
+            return self._static[0]
+        buffer = bytearray()
+        self.render_into(buffer, fill)
+        return bytes(buffer)
+
+
+class _Builder(object):
+    """ Compiled template builder """
+
+    def __init__(self, encode):
+        """
+        Initialization
+
+        :Parameters:
+          `encode` : callable
+            Static operations encoder (`abstract.Encoder.encode_tags`)
+        """
+        self._encode = encode
+        self._static = []
+        self._holes = []
+        self._ops = []
+
+    def push(self, op):
+        """ Add a static operation """
+        self._ops.append(op)
+
+    def _flush(self):
+        """ Encode pending operations into a single blob """
+        self._static.append(self._encode(self._ops))
+        self._ops = []
+
+    def hole(self, hole):
+        """ Add a hole """
+        self._flush()
+        self._holes.append(hole)
+
+    def finish(self):
+        """ Build the template """
+        self._flush()
+        return CompiledTemplate(self._static, self._holes)
+
+
+def compile_events(events, encoder, marker=u'tdi'):
+    """
+    Compile parsed text markup
+
+    End tags close the innermost open tag of the same name, implicitly
+    closing tags opened after it. End tags without matching starttag are
+    kept as static markup.
+
+    :Parameters:
+      `events` : iterable
+        Events as produced by the tokenizer (`tokenizer.TextTokenizer`,
+        `tokenizer.iterparse` or `loader.load`)
+
+      `encoder` : `abstract.Encoder`
+        Output encoder
+
+      `marker` : ``str``
+        Name of the attribute marking nodes for user code (as normalized
+        by the decoder)
+
+    :Return: The compiled template
+    :Rtype: `CompiledTemplate`
+
+    :Exceptions:
+      - `ValueError` : Invalid event
+    """
+    # pylint: disable = too-many-branches
+
+    name, attribute = encoder.name, encoder.attribute
+    escape = encoder.escape
+
+    def encode_attr(attr):
+        """ Encode attribute list """
+        return [(name(key), None if value is None else attribute(value))
+                for key, value in attr]
+
+    builder = _Builder(encoder.encode_tags)
+    stack = []  # (tagname, hole, enclosing builder)
+    for event in events:
+        kind = event[0]
+        if kind == 'text':
+            builder.push(('content', escape(event[1])))
+        elif kind == 'start':
+            _, tagname, attr, closed = event
+            marked = [value for key, value in attr if key == marker]
+            if not marked:
+                builder.push(('start', name(tagname), encode_attr(attr),
+                              closed))
+                if not closed:
+                    stack.append((tagname, None, None))
+                continue
+
+            attr = [item for item in attr if item[0] != marker]
+            hole = Hole(marked[-1], tagname, attr, closed, encoder.starttag(
+                name(tagname), encode_attr(attr), closed
+            ))
+            builder.hole(hole)
+            if not closed:
+                stack.append((tagname, hole, builder))
+                builder = _Builder(encoder.encode_tags)
+        elif kind == 'end':
+            tagname = event[1]
+            for idx in range(len(stack) - 1, -1, -1):
+                if stack[idx][0] == tagname:
+                    break
+            else:
+                builder.push(('end', name(tagname)))
+                continue
+
+            while len(stack) > idx:
+                _, hole, parent = stack.pop()
+                if hole is None:
+                    if len(stack) == idx:
+                        builder.push(('end', name(tagname)))
+                    continue
+                hole.content = builder.finish()
+                if len(stack) == idx:
+                    hole.endtag = encoder.endtag(name(tagname))
+                builder = parent
+        else:
+            raise ValueError("Unknown event %r" % (kind,))
+
+    while stack:
+        _, hole, parent = stack.pop()
+        if hole is not None:
+            hole.content = builder.finish()
+            builder = parent
+    return builder.finish()
@@ -28,14 +28,27 @@ Text Input Decoder.
 __author__ = u"Andr\xe9 Malo"
 __docformat__ = "restructuredtext en"
 
+import codecs as _codecs
 import functools as _ft
 import re as _re
+import sys as _sys
 
 from ... import c as _c
 from ... import _util
 from .. import abstract as _abstract
 
 
+#: Text type
+#:
+#: :Type: ``type``
+_TEXT = type(_util.ur(''))
+
+if str is bytes:
+    _intern = lambda s: s  # pylint: disable = invalid-name
+else:
+    _intern = _sys.intern
+
+
 #: Backslash-escape Substituter
 #:
 #: :Type: callable
@@ -55,27 +68,188 @@ class TextDecoder(object):
         Character encoding
     """
 
-    def __init__(self, encoding):
+    def __init__(self, encoding, name_cache=0):
         """
         Initialization
 
         :Parameters:
           `encoding` : ``str``
             Character encoding
+
+          `name_cache` : ``int``
+            Maximum number of names kept in the name cache. If non-zero,
+            `normalize` maps equal names to the same (interned) string
+            object. Once the cache is full, new names are passed through.
+
+        :Exceptions:
+          - `LookupError` : Unknown encoding
+          - `ValueError` : Negative name cache size
         """
+        if name_cache < 0:
+            raise ValueError("name_cache must not be negative")
         self.encoding = encoding
+        self._names = {} if name_cache else None
+        self._names_max = name_cache
 
-    def normalize(self, name):  # pylint: disable = no-self-use
-        """ :See: `abstract.Decoder` """
-        return name
+    def _get_encoding(self):
+        """ Get encoding """
+        return self._encoding
+
+    def _set_encoding(self, encoding):
+        """ Set encoding (after validating it) """
+        self._encoding = _util.text_encoding(encoding)
 
-    def decode(self, value, errors='strict'):
+    encoding = property(_get_encoding, _set_encoding)
+    del _get_encoding, _set_encoding
+
+    def normalize(self, name):
+        """ :See: `abstract.Decoder` """
+        names = self._names
+        if names is None or type(name) is not _TEXT:
+            return name
+        try:
+            return names[name]
+        except KeyError:
+            if len(names) < self._names_max:
+                name = names[name] = _intern(name)
+            return name
+
+    def decode(self, value, errors='strict', offset=0, length=None):
         """ :See: `abstract.Decoder` """
-        return value.decode(self.encoding, errors)
+        return _codecs.decode(
+            _util.buffer_view(value, offset, length), self.encoding, errors
+        )
 
-    def attribute(self, value, errors='strict'):
+    def attribute(self, value, errors='strict', offset=0, length=None):
         """ :See: `abstract.Decoder` """
-        value = value.decode(self.encoding, errors)
+        value = self.decode(value, errors, offset, length)
         if value.startswith(u'"') or value.startswith(u"'"):
             value = value[1:-1]
         return _SLASHSUB(value)
+
+    def attributes(self, attr, errors='strict'):
+        """ :See: `abstract.Decoder` """
+        result = []
+        for item in attr:
+            item = tuple(item)
+            if len(item) != 2:
+                raise ValueError("Expected attribute of length 2")
+            name, value = item
+            name = self.normalize(self.decode(name, errors))
+            if value is not None:
+                value = self.attribute(value, errors)
+            result.append((name, value))
+        return result
+
+    def content(self, value, errors='strict', offset=0, length=None):
+        """ :See: `abstract.Decoder` """
+        return self.decode(value, errors, offset, length).replace(u'[]', u'[')
+
+    def incremental(self, kind='decode', errors='strict'):
+        """ :See: `abstract.Decoder` """
+        return IncrementalTextDecoder(self, kind, errors)
+
+
+class IncrementalTextDecoder(object):
+    """
+    Incremental decoder for chunked text input
+
+    Chunks are passed to `feed`, which returns the text decoded so far.
+    Incomplete multi-byte sequences and escape sequences at the end of a
+    chunk are kept until the next chunk arrives. `close` flushes the rest.
+    Only these few pending characters are buffered.
+    """
+
+    def __init__(self, decoder, kind='decode', errors='strict'):
+        """
+        Initialization
+
+        :Parameters:
+          `decoder` : `TextDecoder`
+            The decoder to take the encoding from
+
+          `kind` : ``str``
+            Decoding mode: ``'decode'`` (like ``decoder.decode``),
+            ``'content'`` (like ``decoder.content``) or ``'attribute'``
+            (like ``decoder.attribute``)
+
+          `errors` : ``str``
+            Error handler description
+
+        :Exceptions:
+          - `ValueError` : Unknown kind
+        """
+        try:
+            self._process = dict(
+                decode=self._decode,
+                content=self._content,
+                attribute=self._attribute,
+            )[kind]
+        except KeyError:
+            raise ValueError("Unknown kind %r" % (kind,))
+        self._decoder = _codecs.getincrementaldecoder(decoder.encoding)(
+            errors
+        )
+        self._pending = u''
+        self._quoted = None
+
+    def feed(self, chunk):
+        """
+        Decode a chunk of input
+
+        :Parameters:
+          `chunk` : ``bytes``
+            The next chunk
+
+        :Return: The decoded text (may be empty)
+        :Rtype: text
+        """
+        return self._process(self._decoder.decode(chunk), False)
+
+    def close(self):
+        """
+        Finish decoding
+
+        :Return: The remaining decoded text
+        :Rtype: text
+
+        :Exceptions:
+          - `UnicodeDecodeError` : The input ended within a multi-byte
+            sequence (depending on the error handler)
+        """
+        return self._process(self._decoder.decode(b'', True), True)
+
+    def _decode(self, text, final):  # pylint: disable = unused-argument
+        """ Process decoded text in decode mode """
+        return text
+
+    def _content(self, text, final):
+        """ Process decoded text in content mode """
+        text, self._pending = self._pending + text, u''
+        if not final and text.endswith(u'['):
+            text, self._pending = text[:-1], text[-1:]
+        return text.replace(u'[]', u'[')
+
+    def _attribute(self, text, final):
+        """ Process decoded text in attribute mode """
+        text, self._pending = self._pending + text, u''
+        if self._quoted is None:
+            if not text:
+                return text
+            self._quoted = text.startswith(u'"') or text.startswith(u"'")
+            if self._quoted:
+                text = text[1:]
+
+        if final:
+            if self._quoted:
+                text = text[:-1]
+        else:
+            # Keep a possible closing quote and an unfinished escape
+            end = len(text) - int(self._quoted)
+            pos = end
+            while pos > 0 and text[pos - 1] == u'\\':
+                pos -= 1
+            if (end - pos) % 2:
+                end -= 1
+            text, self._pending = text[:end], text[end:]
+        return _SLASHSUB(text)
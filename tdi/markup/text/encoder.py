@@ -28,10 +28,102 @@ Text Output Encoder.
 __author__ = u"Andr\xe9 Malo"
 __docformat__ = "restructuredtext en"
 
+import collections as _collections
+
 from ... import c as _c
+from ... import _util
 from .. import abstract as _abstract
 
 
+#: Text type
+#:
+#: :Type: ``type``
+_TEXT = type(_util.ur(''))
+
+if str is bytes:
+    def _bytes(value):
+        """
+        Get bytes from a bytes or buffer object
+
+        (Python 3's ``bytes.join`` accepts buffers directly.)
+
+        :Parameters:
+          `value` : any
+            The value to convert
+
+        :Return: The value as bytes
+        :Rtype: ``bytes``
+
+        :Exceptions:
+          - `TypeError` : Value is unicode or not a buffer
+        """
+        if isinstance(value, bytes):
+            return value
+        if isinstance(value, unicode):
+            raise TypeError("expected bytes")
+        return memoryview(value).tobytes()
+
+
+@_c.impl
+class CompiledStartTag(object):
+    """
+    Precompiled starttag
+
+    Calling the object with one value per key returns the starttag. Values
+    are expected to be quoted, escaped and encoded already. ``None`` emits
+    the key only.
+    """
+
+    def __init__(self, name, keys, closed):
+        """
+        Initialization
+
+        :Parameters:
+          `name` : ``bytes``
+            The tag name (already encoded)
+
+          `keys` : iterable
+            The attribute names (already encoded)
+
+          `closed` : ``bool``
+            Closed tag?
+        """
+        keys = tuple(keys)
+        for item in (name,) + keys:
+            if not isinstance(item, bytes):
+                raise TypeError("expected bytes")
+        self._head = (b'[[' if closed else b'[') + name
+        self._keys = tuple([b' ' + key for key in keys])
+        self._tail = b']]' if closed else b']'
+
+    def __call__(self, *values):
+        """
+        Build the starttag
+
+        :Parameters:
+          `values` : ``tuple``
+            The attribute values, one per key (``bytes`` or ``None``)
+
+        :Return: The starttag
+        :Rtype: ``bytes``
+        """
+        if len(values) != len(self._keys):
+            raise TypeError("expected %d values, got %d" % (
+                len(self._keys), len(values)
+            ))
+        result = [self._head]
+        push = result.append
+        for key, value in zip(self._keys, values):
+            push(key)
+            if value is not None:
+                if not isinstance(value, bytes):
+                    raise TypeError("expected bytes")
+                push(b'=')
+                push(value)
+        push(self._tail)
+        return b''.join(result)
+
+
 @_abstract.impl('Encoder')
 @_c.impl
 class TextEncoder(object):
@@ -44,57 +136,228 @@ class TextEncoder(object):
     """
     # pylint: disable = no-self-use
 
-    def __init__(self, encoding):
+    def __init__(self, encoding, name_cache=0, value_cache=0,
+                 value_length=256):
         """
         Initialization
 
         :Parameters:
           `encoding` : ``str``
             The target encoding
+
+          `name_cache` : ``int``
+            Maximum number of entries kept in the name cache and in the
+            endtag cache each. If non-zero, `name` and `endtag` results are
+            cached (for text names and bytes names respectively). Once a
+            cache is full, new names are encoded without being stored. See
+            also `name_cache_info`.
+
+          `value_cache` : ``int``
+            Maximum number of entries kept in the attribute, content and
+            escape_content caches each. If non-zero, the results of these
+            methods (and their ``_into`` variants) are cached for text
+            values up to `value_length` characters. A full cache drops its
+            least recently used entry before the next result is stored. See
+            also `value_cache_info`.
+
+          `value_length` : ``int``
+            Maximum length of cached values
+
+        :Exceptions:
+          - `LookupError` : Unknown encoding
+          - `ValueError` : Negative cache size or value length
         """
+        if name_cache < 0:
+            raise ValueError("name_cache must not be negative")
+        if value_cache < 0:
+            raise ValueError("value_cache must not be negative")
+        if value_length < 0:
+            raise ValueError("value_length must not be negative")
+        self._names = {} if name_cache else None
+        self._endtags = {} if name_cache else None
+        self._names_max = name_cache
+        self._hits = self._misses = 0
+        if value_cache:
+            self._values = [_collections.OrderedDict() for _ in range(3)]
+        else:
+            self._values = [None, None, None]
+        self._values_max = value_cache
+        self._values_length = value_length
+        self._value_hits = self._value_misses = 0
         self.encoding = encoding
 
+    def _get_encoding(self):
+        """ Get encoding """
+        return self._encoding
+
+    def _set_encoding(self, encoding):
+        """ Set encoding (after validating it) """
+        self._encoding = _util.text_encoding(encoding)
+        if self._names is not None:
+            self._names.clear()
+        for cache in self._values:
+            if cache is not None:
+                cache.clear()
+
+    encoding = property(_get_encoding, _set_encoding)
+    del _get_encoding, _set_encoding
+
     def starttag(self, name, attr, closed):
         """ :See: `abstract.Encoder` """
-        if str is bytes and not isinstance(name, bytes):
-            raise TypeError("expected bytes")
+        if str is bytes:
+            name = _bytes(name)
         result = [b'[[' if closed else b'[', name]
         push = result.append
+        if hasattr(attr, 'keys'):
+            attr = attr.items()
         for key, value in attr:
             push(b' ')
-            if str is bytes and not isinstance(key, bytes):
-                raise TypeError("expected bytes")
+            if str is bytes:
+                key = _bytes(key)
             push(key)
             if value is not None:
                 push(b'=')
-                if str is bytes and not isinstance(value, bytes):
-                    raise TypeError("expected bytes")
+                if str is bytes:
+                    value = _bytes(value)
                 push(value)
         push(b']]' if closed else b']')
         return b''.join(result)
 
+    def compile_starttag(self, name, keys, closed):
+        """ :See: `abstract.Encoder` """
+        return CompiledStartTag(name, keys, closed)
+
+    def starttag_into(self, buffer, name, attr, closed):
+        """ :See: `abstract.Encoder` """
+        result = self.starttag(name, attr, closed)
+        buffer.extend(result)
+        return len(result)
+
+    def _cached(self, cache, name, func):
+        """
+        Look up name in a cache, call func on misses
+
+        :Parameters:
+          `cache` : ``dict``
+            The cache
+
+          `name` : hashable
+            The name
+
+          `func` : callable
+            Function producing the value for `name`
+
+        :Return: The (cached) value
+        :Rtype: any
+        """
+        try:
+            result = cache[name]
+        except KeyError:
+            self._misses += 1
+            result = func(name)
+            if len(cache) < self._names_max:
+                cache[name] = result
+        else:
+            self._hits += 1
+        return result
+
+    def _endtag(self, name):
+        """ Build endtag """
+        if str is bytes:
+            name = _bytes(name)
+        return b''.join([b'[/', name, b']'])
+
     def endtag(self, name):
         """ :See: `abstract.Encoder` """
-        if str is bytes and not isinstance(name, bytes):
-            raise TypeError("expected bytes")
-        return name.join([b'[/', b']'])
+        if self._endtags is None or type(name) is not bytes:
+            return self._endtag(name)
+        return self._cached(self._endtags, name, self._endtag)
+
+    def endtag_into(self, buffer, name):
+        """ :See: `abstract.Encoder` """
+        result = self.endtag(name)
+        buffer.extend(result)
+        return len(result)
 
     if bytes is str:
-        def name(self, name):
-            """ :See: `abstract.Encoder` """
+        def _name(self, name):
+            """ Encode name """
             if isinstance(name, unicode):
                 return name.encode(self.encoding, 'strict')
             return str(name)
     else:
-        def name(self, name):
-            """ :See: `abstract.Encoder` """
+        def _name(self, name):
+            """ Encode name """
             if isinstance(name, bytes):
                 return name
             return str(name).encode(self.encoding, 'strict')
 
+    def name(self, name):
+        """ :See: `abstract.Encoder` """
+        if self._names is None or type(name) is not _TEXT:
+            return self._name(name)
+        return self._cached(self._names, name, self._name)
+
+    def name_cache_info(self):
+        """
+        Return name cache statistics
+
+        :Return: Hits, misses, maximum size and current size (summed over
+                 the name and endtag caches)
+        :Rtype: ``tuple``
+        """
+        size = 0
+        if self._names is not None:
+            size = len(self._names) + len(self._endtags)
+        return (self._hits, self._misses, self._names_max, size)
+
+    def _value(self, which, value, func):
+        """
+        Encode a value, using the value cache if possible
+
+        :Parameters:
+          `which` : ``int``
+            Index of the cache
+
+          `value` : any
+            The value to encode
+
+          `func` : callable
+            The uncached encoder
+
+        :Return: The encoded value
+        :Rtype: ``bytes``
+        """
+        cache = self._values[which]
+        if cache is None or type(value) is not _TEXT \
+                or len(value) > self._values_length:
+            return func(value)
+        try:
+            result = cache.pop(value)
+        except KeyError:
+            self._value_misses += 1
+            result = func(value)
+            if len(cache) >= self._values_max:
+                cache.popitem(False)
+        else:
+            self._value_hits += 1
+        cache[value] = result  # (re-)insert as most recently used
+        return result
+
+    def value_cache_info(self):
+        """
+        Return value cache statistics
+
+        :Return: Hits, misses, maximum size and current size (summed over
+                 the attribute, content and escape_content caches)
+        :Rtype: ``tuple``
+        """
+        size = sum([len(cache) for cache in self._values if cache])
+        return (self._value_hits, self._value_misses, self._values_max, size)
+
     if bytes is str:
-        def attribute(self, value):
-            """ :See: `abstract.Encoder` """
+        def _attribute(self, value):
+            """ Encode attribute (uncached) """
             if isinstance(value, unicode):
                 return (
                     value
@@ -108,8 +371,8 @@ class TextEncoder(object):
                 .replace('"', '\\"')
             ).join(['"', '"'])
     else:
-        def attribute(self, value):
-            """ :See: `abstract.Encoder` """
+        def _attribute(self, value):
+            """ Encode attribute (uncached) """
             if isinstance(value, bytes):
                 return (
                     value
@@ -123,19 +386,39 @@ class TextEncoder(object):
                 .replace('"', '\\"')
             ).join(['"', '"']).encode(self.encoding, 'strict')
 
+    def attribute(self, value):
+        """ :See: `abstract.Encoder` """
+        return self._value(0, value, self._attribute)
+
+    def attribute_into(self, buffer, value):
+        """ :See: `abstract.Encoder` """
+        result = self.attribute(value)
+        buffer.extend(result)
+        return len(result)
+
     if bytes is str:
-        def content(self, value):
-            """ :See: `abstract.Encoder` """
+        def _content(self, value):
+            """ Encode content (uncached) """
             if isinstance(value, unicode):
                 return value.encode(self.encoding, 'strict')
             return str(value)
     else:
-        def content(self, value):
-            """ :See: `abstract.Encoder` """
+        def _content(self, value):
+            """ Encode content (uncached) """
             if isinstance(value, bytes):
                 return value
             return str(value).encode(self.encoding, 'strict')
 
+    def content(self, value):
+        """ :See: `abstract.Encoder` """
+        return self._value(1, value, self._content)
+
+    def content_into(self, buffer, value):
+        """ :See: `abstract.Encoder` """
+        result = self.content(value)
+        buffer.extend(result)
+        return len(result)
+
     if bytes is str:
         def encode(self, value):
             """ :See: `abstract.Encoder` """
@@ -161,3 +444,46 @@ class TextEncoder(object):
             if isinstance(value, bytes):
                 return value.replace(b'[', b'[]')
             return str(value).replace('[', '[]')
+
+    def _escape_content(self, value):
+        """ Escape and encode content (uncached) """
+        return self._content(self.escape(value))
+
+    def escape_content(self, value):
+        """ :See: `abstract.Encoder` """
+        return self._value(2, value, self._escape_content)
+
+    def content_join(self, iterable, sep=b'', escape=True):
+        """ :See: `abstract.Encoder` """
+        if not isinstance(sep, bytes):
+            raise TypeError("expected bytes")
+        func = self._escape_content if escape else self._content
+        return sep.join([func(item) for item in iterable])
+
+    def encode_tags(self, ops):
+        """ :See: `abstract.Encoder` """
+        result = []
+        push = result.append
+        for op in ops:
+            op = tuple(op)
+            kind = op[0] if op else None
+            if kind == 'start':
+                if len(op) != 4:
+                    raise ValueError("Expected start operation of length 4")
+                push(self.starttag(op[1], op[2], op[3]))
+            elif kind == 'end':
+                if len(op) != 2:
+                    raise ValueError("Expected end operation of length 2")
+                push(self.endtag(op[1]))
+            elif kind == 'content':
+                if len(op) != 2:
+                    raise ValueError(
+                        "Expected content operation of length 2"
+                    )
+                push(self._content(op[1]))
+            else:
+                raise ValueError("Unknown operation")
+        return b''.join(result)
+
+    def trim(self):
+        """ :See: `abstract.Encoder` """
@@ -0,0 +1,187 @@
+# -*- coding: ascii -*-
+u"""
+:Copyright:
+
+ Copyright 2017
+ Andr\xe9 Malo or his licensors, as applicable
+
+:License:
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+=============
+ Text Loader
+=============
+
+Text Loader.
+
+Template files are memory mapped (read-only) instead of being read into a
+bytes object. The tokenizer and the decoder work on the mapping directly.
+The events returned by `load` keep the mapping open, so the raw source
+stays available (`MappedEvents.data`) without a private copy per process:
+its pages are shared with other processes via the page cache.
+"""
+__author__ = u"Andr\xe9 Malo"
+__docformat__ = "restructuredtext en"
+
+import mmap as _mmap
+
+from . import tokenizer as _tokenizer
+
+
+if str is bytes:
+    #: Create a view of the data (Python 2's mmap doesn't export memoryviews)
+    #:
+    #: :Type: callable
+    _view = buffer  # noqa pylint: disable = undefined-variable
+else:
+    _view = memoryview
+
+
+class MappedFile(object):
+    """
+    Read-only memory mapped file
+
+    Use it as context manager or call `close` explicitly.
+
+    :IVariables:
+      `data` : ``memoryview``
+        The file contents (empty for empty files). On Python 2 this is a
+        ``buffer`` (mmaps do not support memoryviews there). It must not be
+        used after the file is closed.
+
+      `closed` : ``bool``
+        Is the file closed?
+    """
+
+    def __init__(self, filename):
+        """
+        Initialization
+
+        :Parameters:
+          `filename` : ``str``
+            Name of the file to map
+
+        :Exceptions:
+          - `IOError` : The file could not be opened or mapped
+        """
+        self._map = None
+        self.closed = False
+        with open(filename, 'rb') as fp:
+            try:
+                self._map = _mmap.mmap(fp.fileno(), 0,
+                                       access=_mmap.ACCESS_READ)
+            except ValueError:
+                # Empty files cannot be mapped
+                self.data = _view(b'')
+                return
+
+        try:
+            # The tokenizer scans sequentially
+            self._map.madvise(_mmap.MADV_SEQUENTIAL)
+        except AttributeError:
+            pass
+        self.data = _view(self._map)
+
+    def close(self):
+        """ Release the view and unmap the file """
+        data, self.data = self.data, _view(b'')
+        mapped, self._map = self._map, None
+        self.closed = True
+        try:
+            try:
+                data.release()
+            except AttributeError:
+                pass
+            if mapped is not None:
+                mapped.close()
+        except BufferError:
+            # Slices of the data are still alive (e.g. referenced by a
+            # traceback). The mapping goes away together with them.
+            pass
+
+    def __enter__(self):
+        """ Context manager entry """
+        return self
+
+    def __exit__(self, *args):
+        """ Context manager exit """
+        self.close()
+
+
+class MappedEvents(list):
+    """
+    List of events, keeping the mapped source file open
+
+    The mapping is closed by `close` or when the list is garbage
+    collected.
+    """
+    __slots__ = ('source',)
+
+    def __init__(self, events, source):
+        """
+        Initialization
+
+        :Parameters:
+          `events` : iterable
+            The events
+
+          `source` : `MappedFile`
+            The mapped source file
+        """
+        list.__init__(self, events)
+        self.source = source
+
+    @property
+    def data(self):
+        """
+        The raw source (a view into the mapping)
+
+        :Type: ``memoryview``
+        """
+        return self.source.data
+
+    def close(self):
+        """ Unmap the source file (the events stay available) """
+        self.source.close()
+
+
+def load(filename, decoder, errors='strict'):
+    """
+    Tokenize a template file via a read-only memory mapping
+
+    :Parameters:
+      `filename` : ``str``
+        Name of the template file
+
+      `decoder` : `abstract.Decoder`
+        Decoder for names, attribute values and text
+
+      `errors` : ``str``
+        Error handler description, passed to the decoder
+
+    :Return: List of events (see `tokenizer.TextTokenizer`)
+    :Rtype: `MappedEvents`
+
+    :Exceptions:
+      - `IOError` : The file could not be opened or mapped
+    """
+    source = MappedFile(filename)
+    try:
+        events = _tokenizer.TextTokenizer(decoder, errors).tokenize(
+            source.data
+        )
+    except Exception:
+        source.close()
+        raise
+    return MappedEvents(events, source)
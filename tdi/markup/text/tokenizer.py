@@ -0,0 +1,339 @@
+# -*- coding: ascii -*-
+u"""
+:Copyright:
+
+ Copyright 2017
+ Andr\xe9 Malo or his licensors, as applicable
+
+:License:
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+================
+ Text Tokenizer
+================
+
+Text Tokenizer.
+
+The tokenizer splits text markup (as produced by `encoder.TextEncoder`)
+into events:
+
+``('start', name, attr, closed)``
+  A starttag (``[name key=value]``, or ``[[name key=value]]`` if `closed`
+  is true). `attr` is a list of ``(name, value)`` tuples, the value is
+  ``None`` for keys without value.
+
+``('end', name)``
+  An endtag (``[/name]``)
+
+``('text', text)``
+  Text between tags with escapes (``[]``) resolved
+
+Names and values are decoded via the decoder's ``decode``/``normalize``,
+``attribute`` and ``content`` methods. Brackets not starting a valid tag
+are passed through as text. The markup is scanned bytewise, so the input
+encoding must be ASCII compatible (like UTF-8 or the ISO-8859 family).
+
+`iterparse` tokenizes file-like objects chunk by chunk.
+"""
+__author__ = u"Andr\xe9 Malo"
+__docformat__ = "restructuredtext en"
+
+import errno as _errno
+import io as _io
+import re as _re
+
+from ... import c as _c
+from ... import _util
+
+
+#: Text type
+#:
+#: :Type: ``type``
+_TEXT = type(_util.ur(''))
+
+#: Name pattern
+#:
+#: :Type: ``bytes``
+_NAME = br'''[^\s\[\]='"/]+'''
+
+#: Attribute value pattern
+#:
+#: :Type: ``bytes``
+_VALUE = br'''"(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|[^\s\[\]'"]+'''
+
+#: Tag finder
+#:
+#: :Type: callable
+_TAG = _re.compile(br'''
+    \[(?:
+        /(?P<end>%(name)s)\]
+      | (?P<closed>\[)?(?P<name>%(name)s)
+        (?P<attr>(?:\s+%(name)s(?:=(?:%(value)s))?)*)
+        \s*\](?(closed)\])
+    )
+''' % {b'name': _NAME, b'value': _VALUE}, _re.X | _re.S).search
+
+#: Attribute iterator
+#:
+#: :Type: callable
+_ATTR = _re.compile(br'''
+    \s+(?P<key>%(name)s)(?:=(?P<value>%(value)s))?
+''' % {b'name': _NAME, b'value': _VALUE}, _re.X | _re.S).finditer
+
+#: Bracket iterator (no escapes)
+#:
+#: :Type: callable
+_BRACKET = _re.compile(br'\[(?!\])').finditer
+
+#: Matcher for tags cut off by the end of the data
+#:
+#: :Type: callable
+_PARTIAL = _re.compile(br'''
+    \[(?:
+        /(?:%(name)s)?
+      | \[?(?:
+            %(name)s(?:\s+%(name)s(?:=(?:%(value)s))?)*
+            (?:\s+%(name)s=(?:"(?:[^"\\]|\\.)*\\?|'(?:[^'\\]|\\.)*\\?)?|\s*)
+        )?
+      | \[%(name)s(?:\s+%(name)s(?:=(?:%(value)s))?)*\s*\]
+    )?\Z
+''' % {b'name': _NAME, b'value': _VALUE}, _re.X | _re.S).match
+
+if str is bytes:
+    #: Create a view of the data (Python 2's regex engine doesn't accept
+    #: memoryviews)
+    #:
+    #: :Type: callable
+    _buffer = buffer  # noqa pylint: disable = undefined-variable
+
+
+@_c.impl
+class TextTokenizer(object):
+    """
+    Tokenizer for text markup
+
+    See the module documentation for the produced events.
+    """
+
+    def __init__(self, decoder, errors='strict'):
+        """
+        Initialization
+
+        :Parameters:
+          `decoder` : `abstract.Decoder`
+            Decoder for names, attribute values and text
+
+          `errors` : ``str``
+            Error handler description, passed to the decoder
+        """
+        self._normalize = decoder.normalize
+        self._decode = decoder.decode
+        self._attribute = decoder.attribute
+        self._content = decoder.content
+        self._errors = errors
+
+    def _name(self, data, start, end):
+        """ Decode and normalize a name """
+        return self._normalize(
+            self._decode(data, self._errors, start, end - start)
+        )
+
+    def tokenize(self, data):
+        """
+        Split markup into events
+
+        :Parameters:
+          `data` : ``bytes``
+            The markup. Any object providing the buffer protocol (e.g.
+            ``bytearray`` or an ``mmap``) is accepted as well.
+
+        :Return: List of events
+        :Rtype: ``list``
+
+        :Exceptions:
+          - `TypeError` : Unicode data
+        """
+        return self.scan(data)[0]
+
+    def scan(self, data, final=True):
+        """
+        Split (a chunk of) markup into events
+
+        :Parameters:
+          `data` : ``bytes``
+            The markup. Any object providing the buffer protocol (e.g.
+            ``bytearray`` or an ``mmap``) is accepted as well. Python 2's
+            regex engine does not accept memoryviews, so the Python
+            implementation copies them into a bytes object there (pass a
+            ``buffer`` to avoid the copy).
+
+          `final` : ``bool``
+            Is this the end of the input? If false, a tag or character cut
+            off by the end of `data` is left unprocessed.
+
+        :Return: The list of events and the number of bytes processed. The
+                 rest needs to be passed again (prepended to the next
+                 chunk).
+        :Rtype: ``tuple``
+
+        :Exceptions:
+          - `TypeError` : Unicode data
+        """
+        if isinstance(data, _TEXT):
+            raise TypeError("expected bytes")
+        if str is bytes and isinstance(data, memoryview):
+            data = data.tobytes()
+        errors = self._errors
+
+        result = []
+        push = result.append
+        text = 0
+        length = len(data)
+        while text < length:
+            match = _TAG(data, text)
+            start = length if match is None else match.start()
+            if not final:
+                for bracket in _BRACKET(data, text, start):
+                    if _PARTIAL(data, bracket.start()):
+                        start, match = bracket.start(), None
+                        break
+                else:
+                    if match is None:
+                        start = _text_end(data, text, length)
+            if start > text:
+                push(('text', self._content(data, errors, text,
+                                            start - text)))
+            if match is None:
+                text = start
+                break
+            text = match.end()
+
+            if match.start('end') >= 0:
+                push(('end', self._name(data, *match.span('end'))))
+                continue
+
+            name = self._name(data, *match.span('name'))
+            attr = []
+            for item in _ATTR(data, *match.span('attr')):
+                key = self._name(data, *item.span('key'))
+                vstart, vend = item.span('value')
+                value = None if vstart < 0 else self._attribute(
+                    data, errors, vstart, vend - vstart
+                )
+                attr.append((key, value))
+            push(('start', name, attr, match.start('closed') >= 0))
+
+        return result, text
+
+
+def _text_end(data, start, end):
+    """
+    Find the end of the complete characters of trailing text
+
+    Up to three UTF-8 continuation bytes and the lead byte before them are
+    held back. With single byte encodings these are complete characters,
+    which are merely delayed.
+
+    :Parameters:
+      `data` : ``bytes``
+        The data
+
+      `start` : ``int``
+        Start of the text
+
+      `end` : ``int``
+        End of the text
+
+    :Return: The end of the complete characters
+    :Rtype: ``int``
+    """
+    tail = bytearray(data[max(start, end - 4):end])
+    pos = len(tail)
+    while pos and len(tail) - pos < 3 and tail[pos - 1] & 0xC0 == 0x80:
+        pos -= 1
+    if pos and tail[pos - 1] & 0xC0 == 0xC0:
+        pos -= 1
+    return end - len(tail) + pos
+
+
+def iterparse(fileobj, decoder, chunk_size=65536, errors='strict'):
+    """
+    Tokenize markup from a file-like object lazily
+
+    The file is read chunk by chunk via ``readinto`` into a single reused
+    buffer. Tags and characters cut off by a chunk boundary are carried
+    over into the next chunk. The buffer only grows if a single tag does
+    not fit into it. Text may be split into several consecutive text
+    events.
+
+    Non-blocking streams are not supported. If ``readinto`` returns
+    ``None`` (no data available yet), a ``BlockingIOError`` is raised from
+    the iterator.
+
+    :Parameters:
+      `fileobj` : file
+        Binary file-like object providing ``readinto``
+
+      `decoder` : `abstract.Decoder`
+        Decoder for names, attribute values and text
+
+      `chunk_size` : ``int``
+        Size of the read buffer
+
+      `errors` : ``str``
+        Error handler description, passed to the decoder
+
+    :Return: Iterator over the events (see `TextTokenizer`)
+    :Rtype: iterable
+
+    :Exceptions:
+      - `ValueError` : Invalid chunk size
+    """
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be positive")
+    scan = TextTokenizer(decoder, errors).scan
+
+    def parse():
+        """ Generator doing the actual work """
+        buf = bytearray(chunk_size)
+        view = memoryview(buf)
+        filled, final = 0, False
+        while not final:
+            if filled == len(buf):
+                del view
+                buf.extend(bytearray(len(buf)))
+                view = memoryview(buf)
+
+            read = fileobj.readinto(view[filled:])
+            if read is None:
+                raise _io.BlockingIOError(
+                    _errno.EAGAIN, "No data available from non-blocking stream"
+                )
+            elif read:
+                filled += read
+            else:
+                final = True
+
+            if str is bytes:
+                # Python 2's regex engine does not accept memoryviews
+                events, consumed = scan(_buffer(buf, 0, filled), final)
+            else:
+                events, consumed = scan(view[:filled], final)
+            if consumed:
+                filled -= consumed
+                view[:filled] = view[consumed:consumed + filled]
+            for event in events:
+                yield event
+
+    return parse()
@@ -0,0 +1,294 @@
+# -*- coding: ascii -*-
+u"""
+:Copyright:
+
+ Copyright 2017
+ Andr\xe9 Malo or his licensors, as applicable
+
+:License:
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+===========
+ Text Tree
+===========
+
+Text Tree.
+
+Compact document tree for parsed templates. Elements use ``__slots__``
+instead of per-instance dicts, text is stored as plain strings and the
+attributes are kept as the decoded ``(name, value)`` pairs produced by the
+decoder. Use a decoder with a name cache to share equal names between
+nodes.
+"""
+__author__ = u"Andr\xe9 Malo"
+__docformat__ = "restructuredtext en"
+
+import sys as _sys
+
+from ... import _util
+
+
+#: Text type
+#:
+#: :Type: ``type``
+_TEXT = type(_util.ur(''))
+
+
+class Element(object):
+    """
+    Element node
+
+    :IVariables:
+      `name` : ``str``
+        The (decoded) tag name
+
+      `attr` : ``tuple``
+        The (decoded) attributes as ``(name, value)`` tuples
+
+      `closed` : ``bool``
+        Closed tag?
+
+      `ended` : ``bool``
+        Was the element closed by its own endtag? (``False`` for closed
+        tags and for elements closed implicitly)
+
+      `children` : ``tuple``
+        The child nodes (`Element` and `EndTag` objects and text strings),
+        ``None`` for closed tags
+    """
+    __slots__ = ('name', 'attr', 'closed', 'ended', 'children')
+
+    def __init__(self, name, attr, closed, ended=False, children=None):
+        """
+        Initialization
+
+        :Parameters:
+          `name` : ``str``
+            The tag name
+
+          `attr` : iterable
+            The attributes
+
+          `closed` : ``bool``
+            Closed tag?
+
+          `ended` : ``bool``
+            Closed by its own endtag?
+
+          `children` : iterable
+            The child nodes (ignored for closed tags)
+        """
+        self.name = name
+        self.attr = tuple(attr)
+        self.closed = closed
+        self.ended = ended and not closed
+        self.children = None if closed else tuple(children or ())
+
+    def __repr__(self):
+        """ Debug representation """
+        return "<%s %r>" % (self.__class__.__name__, self.name)
+
+
+class EndTag(object):
+    """
+    End tag without matching starttag
+
+    :IVariables:
+      `name` : ``str``
+        The (decoded) tag name
+    """
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        """
+        Initialization
+
+        :Parameters:
+          `name` : ``str``
+            The tag name
+        """
+        self.name = name
+
+    def __repr__(self):
+        """ Debug representation """
+        return "<%s %r>" % (self.__class__.__name__, self.name)
+
+
+class Tree(object):
+    """
+    Document tree
+
+    :IVariables:
+      `children` : ``tuple``
+        The top level nodes (`Element` and `EndTag` objects and text
+        strings)
+    """
+    __slots__ = ('children',)
+
+    def __init__(self, children):
+        """
+        Initialization
+
+        :Parameters:
+          `children` : iterable
+            The top level nodes
+        """
+        self.children = tuple(children)
+
+    def events(self):
+        """
+        Generate the events of the tree
+
+        The events look like the tokenizer's (see `tokenizer.TextTokenizer`)
+        and can be passed to `compiler.compile_events`, for example.
+
+        :Return: Iterator over the events
+        :Rtype: iterable
+        """
+        stack = [(None, iter(self.children))]
+        while stack:
+            element, children = stack[-1]
+            for node in children:
+                if isinstance(node, _TEXT):
+                    yield ('text', node)
+                    continue
+                if isinstance(node, EndTag):
+                    yield ('end', node.name)
+                    continue
+                yield ('start', node.name, list(node.attr), node.closed)
+                if not node.closed:
+                    stack.append((node, iter(node.children)))
+                    break
+            else:
+                stack.pop()
+                if element is not None and element.ended:
+                    yield ('end', element.name)
+
+    def footprint(self):
+        """
+        Measure the memory used by the tree
+
+        All objects referenced by the tree (nodes, attribute tuples,
+        strings) are counted once, as reported by ``sys.getsizeof``. Objects
+        shared between nodes (like cached names) are counted only once, too.
+        ``None`` and the booleans are not counted.
+
+        :Return: Number of nodes (elements, end tags and text strings),
+                 total size in bytes and the average size per node in bytes
+        :Rtype: ``tuple``
+        """
+        seen = set()
+        size = [0]
+
+        def count(obj):
+            """ Add the object's size, if not seen before """
+            if obj is None or obj is True or obj is False:
+                return
+            if id(obj) not in seen:
+                seen.add(id(obj))
+                size[0] += _sys.getsizeof(obj)
+
+        count(self)
+        count(self.children)
+        nodes = 0
+        todo = list(self.children)
+        while todo:
+            node = todo.pop()
+            nodes += 1
+            count(node)
+            if isinstance(node, Element):
+                count(node.name)
+                count(node.attr)
+                for pair in node.attr:
+                    count(pair)
+                    for item in pair:
+                        count(item)
+                if node.children is not None:
+                    count(node.children)
+                    todo.extend(node.children)
+            elif isinstance(node, EndTag):
+                count(node.name)
+
+        return nodes, size[0], float(size[0]) / nodes if nodes else 0.0
+
+
+def build_tree(events):
+    """
+    Build a document tree from parsed text markup
+
+    Adjacent text is merged. End tags close the innermost open element of
+    the same name, implicitly closing elements opened after it. End tags
+    without matching starttag are kept as `EndTag` nodes, so the tree's
+    events reproduce the input events (except for merged text).
+
+    :Parameters:
+      `events` : iterable
+        Events as produced by the tokenizer (`tokenizer.TextTokenizer`,
+        `tokenizer.iterparse` or `loader.load`)
+
+    :Return: The document tree
+    :Rtype: `Tree`
+
+    :Exceptions:
+      - `ValueError` : Invalid event
+    """
+    root = []
+    stack = []  # (name, attr, children)
+    children = root
+    text = []
+
+    def flush():
+        """ Add pending text """
+        if text:
+            children.append(_TEXT().join(text) if len(text) > 1 else text[0])
+            del text[:]
+
+    def finish(ended):
+        """ Close the innermost open element """
+        name, attr, nodes = stack.pop()
+        parent = stack[-1][2] if stack else root
+        parent.append(Element(name, attr, False, ended, nodes))
+        return parent
+
+    for event in events:
+        kind = event[0]
+        if kind == 'text':
+            text.append(event[1])
+        elif kind == 'start':
+            flush()
+            _, name, attr, closed = event
+            if closed:
+                children.append(Element(name, attr, True))
+            else:
+                stack.append((name, attr, []))
+                children = stack[-1][2]
+        elif kind == 'end':
+            for idx in range(len(stack) - 1, -1, -1):
+                if stack[idx][0] == event[1]:
+                    break
+            else:
+                flush()
+                children.append(EndTag(event[1]))
+                continue
+            flush()
+            while len(stack) > idx + 1:
+                finish(False)
+            children = finish(True)
+        else:
+            raise ValueError("Unknown event %r" % (kind,))
+
+    flush()
+    while stack:
+        children = finish(False)
+    return Tree(root)
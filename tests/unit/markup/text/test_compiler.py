@@ -0,0 +1,174 @@
+# -*- coding: ascii -*-
+u"""
+:Copyright:
+
+ Copyright 2017
+ Andr\xe9 Malo or his licensors, as applicable
+
+:License:
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+=====================================
+ Tests for tdi.markup.text.compiler
+=====================================
+
+"""
+__author__ = u"Andr\xe9 Malo"
+__docformat__ = "restructuredtext en"
+
+from pytest import raises
+
+from tdi.markup.text import compiler as _compiler
+from tdi.markup.text import decoder as _decoder
+from tdi.markup.text import encoder as _encoder
+from tdi.markup.text import tokenizer as _tokenizer
+
+from .... import _util as _test
+
+multi = _test.multi_impl(globals(), _decoder, _encoder, _tokenizer,
+                         _compiler)
+
+
+class _Chunks(object):
+    """ Buffer collecting chunks, providing extend only """
+
+    def __init__(self):
+        self.chunks = []
+
+    def extend(self, data):
+        """ Add chunk """
+        self.chunks.append(bytes(data))
+
+
+def _compile(data, **kwargs):
+    """ Tokenize and compile """
+    events = _tokenizer.TextTokenizer(
+        _decoder.TextDecoder('utf-8')
+    ).tokenize(data)
+    return _compiler.compile_events(
+        events, _encoder.TextEncoder('utf-8'), **kwargs
+    )
+
+
+@multi
+def test_static():
+    """ markup.text.compiler.compile_events() merges static markup """
+    data = u'a[]b[x y="1 [] \\"" z=2 w]\xe9[[br]]t[/x]c'.encode('utf-8')
+    template = _compile(data)
+    assert template.static == (data.replace(b'z=2', b'z="2"'),)
+    assert template.holes == ()
+    assert template.render() == template.static[0]
+
+    buf = bytearray(b'>')
+    assert template.render_into(buf) == len(template.static[0])
+    assert buf == b'>' + template.static[0]
+
+    assert _compile(b'').static == (b'',)
+    assert _compile(b'').render() == b''
+
+
+@multi
+def test_holes():
+    """ markup.text.compiler.compile_events() leaves holes for marked nodes """
+    template = _compile(
+        b'a[x][p tdi=foo k=v]in[[br tdi]][b]c[/b][/p]t[/x]'
+    )
+    assert template.static == (b'a[x]', b't[/x]')
+    hole, = template.holes
+    assert hole.name == u'foo'
+    assert hole.tagname == u'p'
+    assert hole.attr == [(u'k', u'v')]
+    assert not hole.closed
+    assert hole.starttag == b'[p k="v"]'
+    assert hole.endtag == b'[/p]'
+    assert hole.content.static == (b'in', b'[b]c[/b]')
+
+    inner, = hole.content.holes
+    assert inner.name is None
+    assert inner.tagname == u'br'
+    assert inner.closed
+    assert inner.starttag == b'[[br]]'
+    assert inner.endtag == b''
+    assert inner.content is None
+
+    assert template.render() == b'a[x][p k="v"]in[[br]][b]c[/b][/p]t[/x]'
+
+    def fill(hole, buf):
+        """ Replace foo's content, drop the rest """
+        if hole.name != u'foo':
+            return 0
+        data = hole.starttag + b'new' + hole.endtag
+        buf.extend(data)
+        return len(data)
+
+    assert template.render(fill) == b'a[x][p k="v"]new[/p]t[/x]'
+
+    seen = []
+
+    def keep(hole, buf):
+        """ Render unchanged """
+        seen.append(hole.name)
+        return hole.render_into(buf, keep)
+
+    buf = bytearray()
+    assert template.render_into(buf, keep) == len(template.render())
+    assert buf == template.render()
+    assert seen == [u'foo', None]
+
+    # only extend is needed
+    chunks = _Chunks()
+    assert template.render_into(chunks, fill) == 25
+    assert b''.join(chunks.chunks) == b'a[x][p k="v"]new[/p]t[/x]'
+
+
+@multi
+def test_marker():
+    """ markup.text.compiler.compile_events() accepts other markers """
+    template = _compile(b'[a tdi=x][b id=y][/b][/a]', marker=u'id')
+    assert template.static == (b'[a tdi="x"]', b'[/a]')
+    assert template.holes[0].name == u'y'
+    assert template.holes[0].content.static == (b'',)
+
+
+@multi
+def test_nesting():
+    """ markup.text.compiler.compile_events() closes holes implicitly """
+    template = _compile(b'[a][b tdi=x][c]1[/a]2[/b][d tdi=y]3')
+    assert template.static == (b'[a]', b'[/a]2[/b]', b'')
+    first, second = template.holes
+    assert first.content.static == (b'[c]1',)
+    assert first.endtag == b''
+    assert second.content.static == (b'3',)
+    assert second.endtag == b''
+    assert template.render() == b'[a][b][c]1[/a]2[/b][d]3'
+
+    template = _compile(b'[b tdi=x][b]1[/b]2[/b]')
+    assert template.static == (b'', b'')
+    assert template.holes[0].content.static == (b'[b]1[/b]2',)
+    assert template.holes[0].endtag == b'[/b]'
+
+    # stray end tags are kept
+    template = _compile(b'a[/z]b[x tdi=y]c[/z][/x]')
+    assert template.static == (b'a[/z]b', b'')
+    assert template.holes[0].content.static == (b'c[/z]',)
+    assert template.render() == b'a[/z]b[x]c[/z][/x]'
+
+
+def test_invalid():
+    """ markup.text.compiler.compile_events() rejects unknown events """
+    encoder = _encoder.TextEncoder('utf-8')
+    with raises(ValueError):
+        _compiler.compile_events([('foo',)], encoder)
+    with raises(ValueError):
+        _compiler.CompiledTemplate((b'',), (None,))
@@ -32,6 +32,7 @@ import weakref as _weakref
 from pytest import raises
 
 from tdi.markup.text import decoder as _decoder
+from tdi.markup.text import encoder as _encoder
 from tdi.markup import abstract as _abstract
 
 from .... import _util as _test
@@ -43,20 +44,70 @@ c = _test.c_impl(_decoder)
 @multi
 def test_init():
     """ markup.decoder.text.TextDecoder() inits properly """
-    inst = _decoder.TextDecoder('foo')
+    inst = _decoder.TextDecoder('utf-8')
     assert isinstance(inst, _abstract.Decoder)
-    assert inst.encoding == 'foo'
+    assert inst.encoding == 'utf-8'
+
+
+@multi
+def test_init_lookup_error():
+    """ markup.decoder.text.TextDecoder() validates the encoding """
+    with raises(LookupError):
+        _decoder.TextDecoder('foo')
+
+    with raises(LookupError):
+        _decoder.TextDecoder('hex')
 
 
 @multi
 def test_normalize():
     """ markup.decoder.text.TextDecoder().normalize() just passes through """
-    inst = _decoder.TextDecoder('foo')
+    inst = _decoder.TextDecoder('utf-8')
     mocked = object()
     result = inst.normalize(mocked)
     assert result is mocked
 
 
+@multi
+def test_normalize_cache():
+    """ markup.decoder.text.TextDecoder().normalize() caches names """
+    inst = _decoder.TextDecoder('utf-8', name_cache=2)
+
+    first = inst.normalize(b'xx'.decode('ascii'))
+    result = inst.normalize(b'xx'.decode('ascii'))
+    assert result is first
+    assert result == u'xx'
+
+    second = inst.normalize(b'yy'.decode('ascii'))
+    assert inst.normalize(b'yy'.decode('ascii')) is second
+
+    # full
+    third = b'zz'.decode('ascii')
+    assert inst.normalize(third) is third
+
+    mocked = object()
+    assert inst.normalize(mocked) is mocked
+
+
+@multi
+def test_normalize_cache_attributes():
+    """ markup.decoder.text.TextDecoder().attributes() normalizes names """
+    inst = _decoder.TextDecoder('utf-8', name_cache=10)
+
+    first = inst.attributes([(b'a', b'b'), (b'a', None)])
+    second = inst.attributes([(b'a', b'c')])
+    assert first == [(u'a', u'b'), (u'a', None)]
+    assert first[0][0] is first[1][0]
+    assert first[0][0] is second[0][0]
+
+
+@multi
+def test_normalize_cache_error():
+    """ markup.decoder.text.TextDecoder() checks name_cache """
+    with raises(ValueError):
+        _decoder.TextDecoder('utf-8', name_cache=-1)
+
+
 @c
 def test_normalize_arg_error():
     """ markup.decoder.text.TextDecoder().normalize() checks arguments """
@@ -73,6 +124,44 @@ def test_decode():
     assert result == u'Andr\xe9'
 
 
+@multi
+def test_decode_codecs():
+    """ markup.decoder.text.TextDecoder().decode() uses resolved codecs """
+    for encoding in ('utf-8', 'latin-1', 'cp1252', 'utf-16'):
+        inst = _decoder.TextDecoder(encoding)
+        assert inst.decode(u'Andr\xe9'.encode(encoding)) == u'Andr\xe9'
+        assert inst.attribute(u'"a"'.encode(encoding)) == u'a'
+
+    inst = _decoder.TextDecoder('ascii')
+    assert inst.decode(b'Andr\xe9', 'replace') == u'Andr\ufffd'
+    with raises(UnicodeDecodeError):
+        inst.decode(b'Andr\xe9')
+
+
+@multi
+def test_decode_keyword_args():
+    """ markup.decoder.text.TextDecoder().decode() accepts keyword args """
+    inst = _decoder.TextDecoder('utf-8')
+    assert inst.decode(value=b'Andr\xc3\xa9') == u'Andr\xe9'
+    assert inst.decode(b'Andr\xe9', errors='replace') == u'Andr\ufffd'
+    assert inst.attribute(b'"Andr\xe9"', errors='replace') == \
+        u'Andr\ufffd'
+
+
+@c
+def test_decode_keyword_arg_errors():
+    """ markup.decoder.text.TextDecoder().decode() checks keyword args """
+    inst = _decoder.TextDecoder('utf-8')
+    with raises(TypeError):
+        inst.decode(b'x', 'strict', 'strict')
+    with raises(TypeError):
+        inst.decode(b'x', 'strict', errors='strict')
+    with raises(TypeError):
+        inst.decode(b'x', error='strict')
+    with raises(TypeError):
+        inst.decode(errors='strict')
+
+
 @c
 def test_decode_arg_error():
     """ markup.decoder.text.TextDecoder().decode() checks arguments """
@@ -145,6 +234,47 @@ def test_attribute_slash():
     assert result == u'An\\dr\\'
 
 
+@multi
+def test_attribute_malformed():
+    """
+    markup.decoder.text.TextDecoder().attribute() decodes the whole value
+    """
+    for encoding in ('utf-8', 'ascii', 'cp1252'):
+        inst = _decoder.TextDecoder(encoding)
+        for value, start in ((b'"\x81', 1), (b"'\x81'", 1), (b'"a\x81b"', 2),
+                             (b'a\x81', 1), (b'"\\\x81"', 2)):
+            with raises(UnicodeDecodeError) as exc:
+                inst.attribute(value)
+            assert exc.value.object == value
+            assert exc.value.start == start
+
+    inst = _decoder.TextDecoder('utf-8')
+    assert inst.attribute(b'"\xff', 'replace') == u''
+    assert inst.attribute(b'"a\xffb"', 'replace') == u'a\ufffdb'
+    with raises(UnicodeDecodeError) as exc:
+        inst.attributes([(b'\xe9', b'"\xff')])
+    assert exc.value.object == b'\xe9'
+
+
+@multi
+def test_attribute_narrow():
+    """
+    markup.decoder.text.TextDecoder().attribute() strips a wide last char
+    """
+    inst = _decoder.TextDecoder('utf-8')
+    assert inst.attribute(b'"ab\xff', 'replace') == u'ab'
+    assert inst.attribute(b'"a\\b\xff', 'replace') == u'ab'
+    assert inst.attribute(b'"\xc3\xa9b\xff', 'replace') == u'\xe9b'
+    assert inst.attribute(b'"ab\xf0\x9f\x98\x80') == u'ab'
+    assert inst.attributes([(b'k', b'"ab\xff')], 'replace') == [
+        (u'k', u'ab')
+    ]
+
+    value = b'"' + b'a' * 100000 + b'\xff'
+    for _ in range(10):
+        assert inst.attribute(value, 'replace') == u'a' * 100000
+
+
 @c
 def test_attribute_arg_error():
     """ markup.decoder.text.TextDecoder().attribute() checks arguments """
@@ -153,13 +283,215 @@ def test_attribute_arg_error():
         inst.attribute()  # pylint: disable = no-value-for-parameter
 
 
+@multi
+def test_attributes():
+    """ markup.decoder.text.TextDecoder().attributes() decodes all attrs """
+    values = [
+        (b'a', None),
+        (b'b', b'"xx"'),
+        (b'c', b"'y\\'y'"),
+        (b'd', b'z'),
+        (b'e', b'"'),
+        (b'f', b'\'a'),
+        (b'g', u'"Andr\xe9"'.encode('utf-8')),
+        (b'h', u'"Andr\xe9'.encode('utf-8')),
+        (b'i', b''),
+        (u'\xe9'.encode('utf-8'), b'"a\\\\b"'),
+    ]
+    for encoding in ('utf-8', 'cp1252'):
+        inst = _decoder.TextDecoder(encoding)
+        expected = [(
+            inst.decode(name),
+            None if value is None else inst.attribute(value)
+        ) for name, value in values]
+
+        result = inst.attributes(iter(values))
+        assert result == expected
+        assert result[1] == (u'b', u'xx')
+
+    inst = _decoder.TextDecoder('utf-8')
+    assert inst.attributes([[b'a', b'"b"']]) == [(u'a', u'b')]
+    assert inst.attributes([]) == []
+
+
+@multi
+def test_attributes_errors():
+    """ markup.decoder.text.TextDecoder().attributes() checks input """
+    inst = _decoder.TextDecoder('utf-8')
+
+    with raises(ValueError):
+        inst.attributes([(b'a',)])
+    with raises(ValueError):
+        inst.attributes([(b'a', b'b', b'c')])
+    with raises(TypeError):
+        inst.attributes([None])
+    with raises(TypeError):
+        inst.attributes(None)
+    with raises(UnicodeDecodeError):
+        inst.attributes([(b'a', b'"\xe9"')])
+    with raises(UnicodeDecodeError):
+        inst.attributes([(b'\xe9', None)])
+
+    result = inst.attributes([(b'a', b'"\xe9"')], errors='replace')
+    assert result == [(u'a', u'\ufffd')]
+
+
+@c
+def test_attributes_arg_error():
+    """ markup.decoder.text.TextDecoder().attributes() checks arguments """
+    inst = _decoder.TextDecoder('utf-8')
+    with raises(TypeError):
+        inst.attributes()  # pylint: disable = no-value-for-parameter
+
+
+@multi
+def test_content():
+    """ markup.decoder.text.TextDecoder().content() unescapes """
+    values = [
+        u'', u'Andr\xe9', u'[]', u'[', u']', u'a[]b[]]c', u'[[]]', u'x[',
+        u'\u20ac[]\u20ac', u'[]\U0001f600', u'no brackets at all',
+    ]
+    for encoding in ('utf-8', 'latin-1', 'utf-16'):
+        inst = _decoder.TextDecoder(encoding)
+        for value in values:
+            try:
+                encoded = value.encode(encoding)
+            except UnicodeError:
+                continue
+            assert inst.content(encoded) == value.replace(u'[]', u'[')
+
+
+@multi
+def test_content_roundtrip():
+    """ markup.decoder.text.TextDecoder().content() reverses escaping """
+    encoder = _encoder.TextEncoder('utf-8')
+    inst = _decoder.TextDecoder('utf-8')
+
+    value = u'[x[]] Andr\xe9 [[' * 1000
+    assert inst.content(encoder.escape_content(value)) == value
+
+
+@multi
+def test_content_errors():
+    """ markup.decoder.text.TextDecoder().content() respects errors """
+    inst = _decoder.TextDecoder('utf-8')
+    assert inst.content(b'[]\xe9', 'replace') == u'[\ufffd'
+    assert inst.content(b'\xe9', errors='replace') == u'\ufffd'
+    with raises(UnicodeDecodeError):
+        inst.content(b'[]\xe9')
+    with raises(UnicodeDecodeError):
+        inst.content(b'\xe9')
+
+
+@c
+def test_content_arg_error():
+    """ markup.decoder.text.TextDecoder().content() checks arguments """
+    inst = _decoder.TextDecoder('utf-8')
+    with raises(TypeError):
+        inst.content()  # pylint: disable = no-value-for-parameter
+
+
+@multi
+def test_buffer_input():
+    """ markup.decoder.text.TextDecoder() accepts buffer objects """
+    text = u'xx"Andr\xe9"yy [][zz'
+    for encoding in ('latin-1', 'cp1252', 'utf-8'):
+        data = text.encode(encoding)
+        inst = _decoder.TextDecoder(encoding)
+        for value in (bytearray(data), memoryview(data), data):
+            assert inst.decode(value) == text
+            assert inst.decode(value, offset=0) == text
+            assert inst.decode(value, offset=1, length=1) == u'x'
+            assert inst.attribute(value, offset=2, length=len(data) - 10) \
+                == u'Andr\xe9'
+            assert inst.content(value, 'strict', len(data) - 6) == u' [[zz'
+            assert inst.decode(value, length=0) == u''
+            assert inst.decode(value, offset=len(data) + 10) == u''
+            assert inst.decode(value, 'strict', len(data) - 1, 1000) == u'z'
+
+
+@multi
+def test_buffer_input_none():
+    """ markup.decoder.text.TextDecoder() treats None offsets as 0 """
+    inst = _decoder.TextDecoder('utf-8')
+    for value in (b'"xy"', bytearray(b'"xy"'), memoryview(b'"xy"')):
+        assert inst.decode(value, offset=None) == u'"xy"'
+        assert inst.decode(value, 'strict', None, 2) == u'"x'
+        assert inst.attribute(value, offset=None, length=None) == u'xy'
+        assert inst.content(value, offset=None) == u'"xy"'
+
+
+@multi
+def test_buffer_input_errors():
+    """ markup.decoder.text.TextDecoder() checks buffer arguments """
+    inst = _decoder.TextDecoder('utf-8')
+
+    with raises(ValueError):
+        inst.decode(b'xx', offset=-1)
+    with raises(ValueError):
+        inst.decode(b'xx', length=-1)
+    with raises(TypeError):
+        inst.decode(u'xx')
+    with raises(TypeError):
+        inst.decode(12)
+    with raises(UnicodeDecodeError):
+        inst.decode(bytearray(b'x\xe9'), offset=1)
+    assert inst.decode(bytearray(b'x\xe9'), length=1) == u'x'
+
+
+def _feed_chunks(inc, data, size):
+    """ Feed data in chunks of size to an incremental decoder """
+    result = []
+    for pos in range(0, len(data), size):
+        result.append(inc.feed(data[pos:pos + size]))
+    result.append(inc.close())
+    return u''.join(result)
+
+
+@multi
+def test_incremental():
+    """ markup.decoder.text.TextDecoder().incremental() decodes chunks """
+    inst = _decoder.TextDecoder('utf-8')
+    values = [
+        b'', b'"', b"'", b'"a', b'\\', b'"\\"', b'a\\\\b\\',
+        u'"Andr\xe9 [] [[]] \\\\\\" \u20ac\U0001f600"'.encode('utf-8'),
+        u'x[]\u20ac[[[]]][\\"'.encode('utf-8'),
+    ]
+    for kind in ('decode', 'content', 'attribute'):
+        method = getattr(inst, kind)
+        for value in values:
+            expected = method(value)
+            for size in range(1, max(2, len(value) + 1)):
+                result = _feed_chunks(inst.incremental(kind), value, size)
+                assert result == expected, (kind, value, size)
+
+
+@multi
+def test_incremental_errors():
+    """ markup.decoder.text.TextDecoder().incremental() handles errors """
+    inst = _decoder.TextDecoder('utf-8')
+
+    inc = inst.incremental()
+    assert inc.feed(b'Andr\xc3') == u'Andr'
+    with raises(UnicodeDecodeError):
+        inc.close()
+
+    # Python 2's codec holds back the invalid byte until more data arrives,
+    # so only the combined result is the same across versions
+    inc = inst.incremental('content', errors='replace')
+    assert inc.feed(b'x\xe9[') + inc.close() == u'x\ufffd['
+
+    with raises(ValueError):
+        inst.incremental('foo')
+
+
 @multi
 def test_weakref():
     """ markup.decoder.text.TextDecoder() accepts and clears weakrefs """
-    inst = _decoder.TextDecoder('foo')
+    inst = _decoder.TextDecoder('utf-8')
     ref = _weakref.ref(inst)
 
-    assert ref().encoding == 'foo'
+    assert ref().encoding == 'utf-8'
     del inst
     assert ref() is None
 
@@ -177,10 +509,20 @@ def test_new_argerror():
 @c
 def test_setencoding():
     """ markup.decoder.text.TextDecoder() accepts encoding """
-    inst = _decoder.TextDecoder('foo')
-    inst.encoding = 'bar'
+    inst = _decoder.TextDecoder('utf-8')
+    inst.encoding = 'latin-1'
 
-    assert inst.encoding == 'bar'
+    assert inst.encoding == 'latin-1'
 
     with raises(RuntimeError):
         inst.encoding = _test.badstr
+
+
+@multi
+def test_setencoding_lookup_error():
+    """ markup.decoder.text.TextDecoder() validates new encodings """
+    inst = _decoder.TextDecoder('utf-8')
+    with raises(LookupError):
+        inst.encoding = 'foo'
+
+    assert inst.encoding == 'utf-8'
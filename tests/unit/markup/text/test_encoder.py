@@ -44,15 +44,39 @@ python = _test.python_impl(_encoder)
 @multi
 def test_init():
     """ markup.encoder.text.TextEncoder() inits properly """
-    inst = _encoder.TextEncoder('foo')
+    inst = _encoder.TextEncoder('utf-8')
     assert isinstance(inst, _abstract.Encoder)
-    assert inst.encoding == 'foo'
+    assert inst.encoding == 'utf-8'
+
+
+@multi
+def test_init_lookup_error():
+    """ markup.encoder.text.TextEncoder() validates the encoding """
+    with raises(LookupError):
+        _encoder.TextEncoder('foo')
+
+    with raises(LookupError):
+        _encoder.TextEncoder('hex')
+
+
+@multi
+def test_encoding_codecs():
+    """ markup.encoder.text.TextEncoder() encodes with resolved codecs """
+    for encoding in ('utf-8', 'latin-1', 'cp1252', 'utf-16'):
+        inst = _encoder.TextEncoder(encoding)
+        assert inst.content(u'Andr\xe9') == u'Andr\xe9'.encode(encoding)
+        assert inst.name(u'xx') == u'xx'.encode(encoding)
+
+    inst = _encoder.TextEncoder('ascii')
+    assert inst.content(u'Andre') == b'Andre'
+    with raises(UnicodeEncodeError):
+        inst.content(u'Andr\xe9')
 
 
 @multi
 def test_starttag_simple():
     """ markup.encoder.text.TextEncoder().starttag() emits regular tags """
-    inst = _encoder.TextEncoder('foo')
+    inst = _encoder.TextEncoder('utf-8')
 
     result = inst.starttag(b'xx', iter([]), False)
     assert result == b'[xx]'
@@ -65,7 +89,7 @@ def test_starttag_simple():
 @multi
 def test_starttag_many_attributes():
     """ markup.encoder.text.TextEncoder().starttag() deals with many attrs """
-    inst = _encoder.TextEncoder('foo')
+    inst = _encoder.TextEncoder('utf-8')
 
     result = inst.starttag(b'yy', iter([(b'aa', None), (b'bb', b'cc'),
                                         (b'x', None), (b'zz', b'vv'),
@@ -74,13 +98,111 @@ def test_starttag_many_attributes():
                            False)
     assert result == b'[yy aa bb=cc x zz=vv lalala=lololo uauaua=l]'
 
+    attr = [(('a%d' % idx).encode('ascii'), idx % 3 and b'v' or None)
+            for idx in range(30)]
+    expected = b'[yy ' + b' '.join([
+        value is None and key or key + b'=' + value for key, value in attr
+    ]) + b']'
+    assert inst.starttag(b'yy', attr, False) == expected
+    assert inst.starttag(b'yy', tuple(attr), False) == expected
+    assert inst.starttag(b'yy', iter(attr), False) == expected
+    assert inst.starttag(b'yy', [list(item) for item in attr],
+                         False) == expected
+
+
+class _Mapping(object):
+    """ Minimal mapping """
+
+    def __init__(self, items):
+        self._items = items
+
+    def keys(self):
+        """ Return keys """
+        return [key for key, _ in self._items]
+
+    def items(self):
+        """ Return items """
+        return iter(self._items)
+
+
+class _Dict(dict):
+    """ dict subclass with custom items """
+
+    def items(self):
+        """ Return items, sorted """
+        return sorted(dict.items(self))
+
+
+@multi
+def test_starttag_mapping():
+    """ markup.encoder.text.TextEncoder().starttag() accepts mappings """
+    inst = _encoder.TextEncoder('utf-8')
+
+    assert inst.starttag(b'xx', {}, False) == b'[xx]'
+    assert inst.starttag(b'xx', {b'a': None}, True) == b'[[xx a]]'
+
+    attr = dict(_attrs('a', 30))
+    result = inst.starttag(b'xx', attr, False)
+    assert result == _tag(b'xx', list(attr.items()))
+
+    attr = [(b'b', b'1'), (b'a', None)]
+    assert inst.starttag(b'xx', _Mapping(attr), False) == b'[xx b=1 a]'
+    assert inst.starttag(b'xx', _Dict(attr), False) == b'[xx a b=1]'
+    assert inst.encode_tags([('start', b'x', {b'a': b'1'}, False)]) == \
+        b'[x a=1]'
+
+    buf = bytearray()
+    assert inst.starttag_into(buf, b'x', {b'a': b'1'}, False) == 7
+    assert buf == b'[x a=1]'
+
+    with raises(TypeError):
+        inst.starttag(b'xx', {u'a': None}, False)
+    with raises(TypeError):
+        inst.starttag(b'xx', {b'a': u'b'}, False)
+    with raises(TypeError):
+        inst.starttag(b'xx', _Mapping([None]), False)
+
+
+@multi
+def test_buffer_names():
+    """ markup.encoder.text.TextEncoder() accepts buffers as names """
+    inst = _encoder.TextEncoder('utf-8', name_cache=10)
+    shared = bytearray(b'xxdivclassfoo')
+    view = memoryview(shared)
+
+    result = inst.starttag(view[2:5], [(view[5:10], view[10:]),
+                                       (bytearray(b'a'), None)], False)
+    assert result == b'[div class=foo a]'
+    result = inst.starttag(bytearray(b'x'), {b'k': view[:2]}, True)
+    assert result == b'[[x k=xx]]'
+    assert inst.encode_tags([
+        ('start', view[2:5], [], False), ('end', view[2:5]),
+    ]) == b'[div][/div]'
+
+    for _ in range(2):
+        assert inst.endtag(view[2:5]) == b'[/div]'
+        assert inst.endtag(bytearray(b'p')) == b'[/p]'
+
+    buf = bytearray()
+    assert inst.starttag_into(buf, view[2:5], [(view[5:10], None)],
+                              False) == 11
+    assert inst.endtag_into(buf, view[2:5]) == 6
+    assert buf == b'[div class][/div]'
+
+    with raises(TypeError):
+        inst.starttag(b'x', [(view[5:10], u'foo')], False)
+    with raises(TypeError):
+        inst.starttag(b'x', [(None, b'foo')], False)
+    with raises(TypeError):
+        inst.endtag(None)
+
 
 @multi
 def test_starttag_invalid_attributes():
     """
     markup.encoder.text.TextEncoder().starttag() deals with broken attrs
     """
-    inst = _encoder.TextEncoder('foo')
+    inst = _encoder.TextEncoder('utf-8')
 
     with raises(TypeError):
         inst.starttag(b'yy', iter([(b'aa', None), (u'bb', b'cc')]), False)
@@ -120,7 +242,7 @@ def test_starttag_invalid_attributes():
 @multi
 def test_starttag_closing():
     """ markup.encoder.text.TextEncoder().starttag() emits closing tags """
-    inst = _encoder.TextEncoder('foo')
+    inst = _encoder.TextEncoder('utf-8')
 
     result = inst.starttag(b'xx', iter([]), True)
     assert result == b'[[xx]]'
@@ -153,10 +275,42 @@ def test_starttag_arg_error():
         inst.starttag()  # pylint: disable = no-value-for-parameter
 
 
+@multi
+def test_keyword_args():
+    """ markup.encoder.text.TextEncoder() methods accept keyword args """
+    inst = _encoder.TextEncoder('utf-8')
+
+    result = inst.starttag(b'xx', closed=True, attr=[(b'a', b'b')])
+    assert result == b'[[xx a=b]]'
+    assert inst.endtag(name=b'xx') == b'[/xx]'
+    assert inst.content(value=u'x') == b'x'
+
+    buf = bytearray()
+    assert inst.content_into(value=b'x', buffer=buf) == 1
+    assert buf == b'x'
+
+
+@c
+def test_keyword_arg_errors():
+    """ markup.encoder.text.TextEncoder() methods check keyword args """
+    inst = _encoder.TextEncoder('utf-8')
+
+    with raises(TypeError):
+        inst.starttag(b'xx', [], False, True)
+    with raises(TypeError):
+        inst.starttag(b'xx', [], False, name=b'yy')
+    with raises(TypeError):
+        inst.starttag(b'xx', [], closed=False, foo=1)
+    with raises(TypeError):
+        inst.starttag(b'xx', closed=False)
+    with raises(TypeError):
+        inst.content(**{'value': b'x', 'value_': b'y'})
+
+
 @multi
 def test_endtag():
     """ markup.encoder.text.TextEncoder().endtag() emits endtags """
-    inst = _encoder.TextEncoder('foo')
+    inst = _encoder.TextEncoder('utf-8')
 
     result = inst.endtag(b'xx')
     assert result == b'[/xx]'
@@ -196,6 +350,134 @@ def test_name_bytes():
     assert result == b'Andr\xe9'
 
 
+@multi
+def test_name_cache():
+    """ markup.encoder.text.TextEncoder() caches names and endtags """
+    inst = _encoder.TextEncoder('utf-8', name_cache=2)
+    assert inst.name_cache_info() == (0, 0, 2, 0)
+
+    assert inst.name(u'Andr\xe9') == b'Andr\xc3\xa9'
+    assert inst.name(u'Andr\xe9') == b'Andr\xc3\xa9'
+    assert inst.name(b'xx') == b'xx'
+    assert inst.endtag(b'xx') == b'[/xx]'
+    assert inst.endtag(b'xx') == b'[/xx]'
+    assert inst.endtag(b'yy') == b'[/yy]'
+    assert inst.name_cache_info() == (2, 3, 2, 3)
+
+    # full
+    assert inst.endtag(b'zz') == b'[/zz]'
+    assert inst.endtag(b'zz') == b'[/zz]'
+    assert inst.name_cache_info() == (2, 5, 2, 3)
+
+    # name cache depends on the encoding
+    inst.encoding = 'latin-1'
+    assert inst.name(u'Andr\xe9') == b'Andr\xe9'
+    assert inst.name(u'Andr\xe9') == b'Andr\xe9'
+    assert inst.name_cache_info() == (3, 6, 2, 3)
+
+    with raises(UnicodeError):
+        inst.name(u'\u20ac')
+    with raises(TypeError):
+        inst.endtag(u'xx')
+
+
+@multi
+def test_name_cache_disabled():
+    """ markup.encoder.text.TextEncoder() name cache is off by default """
+    inst = _encoder.TextEncoder('utf-8')
+    assert inst.name(u'xx') == b'xx'
+    assert inst.endtag(b'xx') == b'[/xx]'
+    assert inst.name_cache_info() == (0, 0, 0, 0)
+
+    with raises(ValueError):
+        _encoder.TextEncoder('utf-8', name_cache=-1)
+
+
+@multi
+def test_value_cache():
+    """ markup.encoder.text.TextEncoder() caches attributes and content """
+    inst = _encoder.TextEncoder('utf-8', value_cache=2, value_length=4)
+    assert inst.value_cache_info() == (0, 0, 2, 0)
+
+    for _ in range(3):
+        assert inst.attribute(u'a"b') == b'"a\\"b"'
+        assert inst.content(u'\xe9[') == b'\xc3\xa9['
+        assert inst.escape_content(u'\xe9[') == b'\xc3\xa9[]'
+    assert inst.value_cache_info() == (6, 3, 2, 3)
+
+    buf = bytearray()
+    assert inst.attribute_into(buf, u'a"b') == 6
+    assert inst.content_into(buf, u'x') == 1
+    assert buf == b'"a\\"b"x'
+    assert inst.value_cache_info() == (7, 4, 2, 4)
+
+    # full: the least recently used entry is dropped
+    assert inst.content(u'y') == b'y'
+    assert inst.value_cache_info() == (7, 5, 2, 4)
+    assert inst.content(u'x') == b'x'
+    assert inst.value_cache_info() == (8, 5, 2, 4)
+    assert inst.content(u'\xe9[') == b'\xc3\xa9['
+    assert inst.value_cache_info() == (8, 6, 2, 4)
+
+    # too long or not text
+    assert inst.content(u'abcde') == b'abcde'
+    assert inst.content(b'x') == b'x'
+    assert inst.attribute(5) == b'"5"'
+    assert inst.content_join([u'x', u'y']) == b'xy'
+    assert inst.encode_tags([('content', u'x')]) == b'x'
+    assert inst.value_cache_info() == (8, 6, 2, 4)
+
+    # cache depends on the encoding
+    inst.encoding = 'latin-1'
+    assert inst.value_cache_info() == (8, 6, 2, 0)
+    assert inst.content(u'\xe9[') == b'\xe9['
+
+    with raises(UnicodeError):
+        inst.content(u'\u20ac')
+    assert inst.value_cache_info() == (8, 8, 2, 1)
+
+
+@multi
+def test_value_cache_lru():
+    """ markup.encoder.text.TextEncoder() drops least recently used values """
+    inst = _encoder.TextEncoder('utf-8', value_cache=3)
+    hot = [u'a', u'b', u'c']
+
+    # working set one larger than the cache: cycling misses every time
+    for _ in range(3):
+        for value in hot + [u'd']:
+            assert inst.attribute(value) == b'"' + value.encode('ascii') + b'"'
+    assert inst.value_cache_info() == (0, 12, 3, 3)
+
+    # recently used values survive a cold one
+    inst = _encoder.TextEncoder('utf-8', value_cache=3)
+    for value in hot:
+        inst.attribute(value)
+    for idx in range(10):
+        for value in hot[1:]:
+            inst.attribute(value)
+        inst.attribute(u'x%d' % idx)
+    assert inst.value_cache_info() == (20, 13, 3, 3)
+    inst.attribute(u'b')
+    inst.attribute(u'c')
+    assert inst.value_cache_info() == (22, 13, 3, 3)
+    inst.attribute(u'a')
+    assert inst.value_cache_info() == (22, 14, 3, 3)
+
+
+@multi
+def test_value_cache_disabled():
+    """ markup.encoder.text.TextEncoder() value cache is off by default """
+    inst = _encoder.TextEncoder('utf-8')
+    assert inst.content(u'xx') == b'xx'
+    assert inst.value_cache_info() == (0, 0, 0, 0)
+
+    with raises(ValueError):
+        _encoder.TextEncoder('utf-8', value_cache=-1)
+    with raises(ValueError):
+        _encoder.TextEncoder('utf-8', value_length=-1)
+
+
 @c
 def test_name_badstr():
     """ markup.encoder.text.TextEncoder().name() raises on bad string """
@@ -276,6 +558,44 @@ def test_content_bytes():
     assert result == b'Andr\xe9'
 
 
+class _Int(int):
+    """ int subclass with custom str """
+
+    def __str__(self):
+        return 'int'
+
+
+@multi
+def test_numbers():
+    """ markup.encoder.text.TextEncoder() formats numbers like str() """
+    values = [
+        0, 5, -17, 2 ** 62, -2 ** 63, 2 ** 64, -10 ** 30,
+        0.0, -0.0, 1.5, 0.1, 1e16, 1e-7, 1.0 / 3, 2.0 ** 70,
+        float('inf'), float('-inf'), float('nan'), True, _Int(3),
+        type(2 ** 64)(7),  # long on Python 2
+    ]
+    for encoding in ('utf-8', 'latin-1', 'ascii', 'utf-16'):
+        inst = _encoder.TextEncoder(encoding)
+        for value in values:
+            if str is bytes:
+                # Python 2 passes str() results through unencoded
+                expected = str(value)
+                quoted = '"%s"' % (expected,)
+            else:
+                expected = str(value).encode(encoding)
+                quoted = (u'"%s"' % (str(value),)).encode(encoding)
+            assert inst.content(value) == expected
+            assert inst.encode(value) == expected
+            assert inst.attribute(value) == quoted
+
+            buf = bytearray()
+            assert inst.content_into(buf, value) == len(expected)
+            assert buf == expected
+        assert inst.encode_tags([('content', 42)]) == (
+            b'42' if str is bytes else u'42'.encode(encoding)
+        )
+
+
 @c
 def test_content_badstr():
     """ markup.encoder.text.TextEncoder().content() raises on bad string """
@@ -358,13 +678,512 @@ def test_escape_arg_error():
         inst.escape()  # pylint: disable = no-value-for-parameter
 
 
+@multi
+def test_escape_content_unicode():
+    """ markup.encoder.text.TextEncoder().escape_content() accepts unicode """
+    values = [
+        u'', u'Andre', u'[', u'[[x[', u'A[ndr\xe9', u'[\u20ac[',
+        u'x[\U0001f600]', u'\u0100[\xff',
+    ]
+    for encoding in ('utf-8', 'latin-1', 'ascii', 'cp1252', 'utf-16'):
+        inst = _encoder.TextEncoder(encoding)
+        for value in values:
+            try:
+                expected = value.replace(u'[', u'[]').encode(encoding)
+            except UnicodeError:
+                with raises(UnicodeEncodeError):
+                    inst.escape_content(value)
+            else:
+                assert inst.escape_content(value) == expected
+
+
+@multi
+def test_escape_content_surrogate():
+    """ markup.encoder.text.TextEncoder().escape_content() is strict """
+    inst = _encoder.TextEncoder('utf-8')
+    if str is bytes:
+        # Python 2's UTF-8 codec encodes lone surrogates
+        assert inst.escape_content(u'[\ud800') == b'[]\xed\xa0\x80'
+    else:
+        with raises(UnicodeEncodeError):
+            inst.escape_content(u'[\ud800')
+
+
+@multi
+def test_escape_content_bytes():
+    """ markup.encoder.text.TextEncoder().escape_content() accepts bytes """
+    inst = _encoder.TextEncoder('utf-8')
+
+    result = inst.escape_content(b'Andr[\xe9')
+    assert result == b'Andr[]\xe9'
+
+
+@multi
+def test_escape_content_other():
+    """ markup.encoder.text.TextEncoder().escape_content() converts to str """
+    inst = _encoder.TextEncoder('utf-8')
+
+    result = inst.escape_content(12)
+    assert result == b'12'
+
+
+@c
+def test_escape_content_badstr():
+    """
+    markup.encoder.text.TextEncoder().escape_content() raises on bad str
+    """
+    inst = _encoder.TextEncoder('utf-8')
+    with raises(RuntimeError):
+        inst.escape_content(_test.badstr)
+
+
+@multi
+def test_content_join():
+    """ markup.encoder.text.TextEncoder().content_join() joins content """
+    values = [
+        u'', u'Andre', u'[', u'A[ndr\xe9', u'[\u20ac[', u'x[\U0001f600]',
+        b'by[tes', 12, 1.5,
+    ]
+    for encoding in ('utf-8', 'latin-1', 'cp1252', 'utf-16'):
+        inst = _encoder.TextEncoder(encoding)
+        for sep in (b'', b', '):
+            for escape, func in ((True, inst.escape_content),
+                                 (False, inst.content)):
+                try:
+                    expected = sep.join([func(value) for value in values])
+                except UnicodeError:
+                    with raises(UnicodeEncodeError):
+                        inst.content_join(values, sep, escape)
+                else:
+                    assert inst.content_join(iter(values), sep,
+                                             escape) == expected
+
+    inst = _encoder.TextEncoder('utf-8')
+    assert inst.content_join([]) == b''
+    assert inst.content_join([u'[a', u'b'] * 300) == b'[]ab' * 300
+    assert inst.content_join((u'a', u'b'), sep=b'[') == b'a[b'
+    assert inst.content_join(iterable=[u'[a'], escape=0) == b'[a'
+
+
+@multi
+def test_content_join_errors():
+    """ markup.encoder.text.TextEncoder().content_join() handles errors """
+    inst = _encoder.TextEncoder('ascii')
+
+    with raises(TypeError):
+        inst.content_join([u'a'], sep=u',')
+    with raises(TypeError):
+        inst.content_join(None)
+    with raises(RuntimeError):
+        inst.content_join(_test.baditer(u'a', RuntimeError()))
+    with raises(UnicodeEncodeError):
+        inst.content_join([u'a', u'\xe9'])
+    with raises(RuntimeError):
+        inst.content_join([u'a'], escape=_test.badbool)
+
+
+@c
+def test_content_join_badstr():
+    """ markup.encoder.text.TextEncoder().content_join() handles bad str """
+    inst = _encoder.TextEncoder('utf-8')
+    with raises(RuntimeError):
+        inst.content_join([u'a', _test.badstr])
+    with raises(RuntimeError):
+        inst.content_join([u'a', _test.badstr], escape=False)
+
+
+@c
+def test_escape_content_arg_error():
+    """
+    markup.encoder.text.TextEncoder().escape_content() checks arguments
+    """
+    inst = _encoder.TextEncoder('utf-8')
+    with raises(TypeError):
+        inst.escape_content()  # pylint: disable = no-value-for-parameter
+
+
+@multi
+def test_encode_tags():
+    """ markup.encoder.text.TextEncoder().encode_tags() emits tags """
+    inst = _encoder.TextEncoder('utf-8')
+
+    result = inst.encode_tags(iter([
+        ('start', b'xx', iter([(b'aa', None), (b'bb', b'cc')]), False),
+        ('content', u'Andr\xe9['),
+        ['start', b'yy', [], True],
+        ('content', b'Andr\xe9'),
+        ('end', b'xx'),
+    ]))
+    assert result == (
+        b'[xx aa bb=cc]Andr\xc3\xa9[[[yy]]Andr\xe9[/xx]'
+    )
+
+    assert inst.encode_tags([]) == b''
+
+
+@multi
+def test_encode_tags_large():
+    """ markup.encoder.text.TextEncoder().encode_tags() grows the result """
+    inst = _encoder.TextEncoder('utf-8')
+
+    ops = []
+    for _ in range(500):
+        ops.append(('start', b'xx', [(b'aa', b'"bb"')], False))
+        ops.append(('content', u'foo'))
+        ops.append(('end', b'xx'))
+    result = inst.encode_tags(ops)
+    assert result == b'[xx aa="bb"]foo[/xx]' * 500
+
+
+@multi
+def test_encode_tags_unicode_kinds():
+    """ markup.encoder.text.TextEncoder().encode_tags() takes text kinds """
+    inst = _encoder.TextEncoder('utf-8')
+    assert inst.encode_tags([
+        (u'start', b'x', [(b'a', b'"b"')], False),
+        (u'content', u'\xe9'),
+        (u'end', b'x'),
+    ]) == b'[x a="b"]\xc3\xa9[/x]'
+
+
+@multi
+def test_encode_tags_errors():
+    """ markup.encoder.text.TextEncoder().encode_tags() raises on errors """
+    inst = _encoder.TextEncoder('utf-8')
+
+    with raises(TypeError):
+        inst.encode_tags(None)
+
+    with raises(TypeError):
+        inst.encode_tags([None])
+
+    with raises(RuntimeError):
+        inst.encode_tags(_test.baditer(RuntimeError()))
+
+    with raises(ValueError):
+        inst.encode_tags([()])
+
+    with raises(ValueError):
+        inst.encode_tags([('foo', b'xx')])
+
+    if str is bytes:
+        # bytes are the native str type
+        assert inst.encode_tags([(b'end', b'xx')]) == b'[/xx]'
+    else:
+        with raises(ValueError):
+            inst.encode_tags([(b'end', b'xx')])
+
+    with raises(ValueError):
+        inst.encode_tags([('end\x00', b'xx')])
+
+    with raises(ValueError):
+        inst.encode_tags([(u'\xe9nd', b'xx')])
+
+    with raises(ValueError):
+        inst.encode_tags([('start', b'xx', [])])
+
+    with raises(ValueError):
+        inst.encode_tags([('end', b'xx', b'yy')])
+
+    with raises(ValueError):
+        inst.encode_tags([('content',)])
+
+    with raises(TypeError):
+        inst.encode_tags([('start', u'xx', [], False)])
+
+    with raises(TypeError):
+        inst.encode_tags([('start', b'xx', None, False)])
+
+    with raises(RuntimeError):
+        inst.encode_tags([('start', b'xx', [], _test.badbool)])
+
+    with raises(TypeError):
+        inst.encode_tags([('end', u'xx')])
+
+    with raises(RuntimeError):
+        inst.encode_tags([('content', _test.badstr)])
+
+
+@c
+def test_encode_tags_arg_error():
+    """ markup.encoder.text.TextEncoder().encode_tags() checks arguments """
+    inst = _encoder.TextEncoder('utf-8')
+    with raises(TypeError):
+        inst.encode_tags()  # pylint: disable = no-value-for-parameter
+
+
+def _attrs(prefix, count):
+    """ Create a list of count attributes """
+    return [(('%s%d' % (prefix, idx)).encode('ascii'), b'v')
+            for idx in range(count)]
+
+
+def _tag(name, attr):
+    """ Build expected starttag """
+    return b'[' + b' '.join([name] + [
+        key + b'=' + value for key, value in attr
+    ]) + b']'
+
+
+@multi
+def test_compile_starttag():
+    """ markup.encoder.text.TextEncoder().compile_starttag() works """
+    inst = _encoder.TextEncoder('utf-8')
+
+    tpl = inst.compile_starttag(b'xx', [b'a', b'bb', b'c'], False)
+    assert tpl(b'"1"', None, b'3') == b'[xx a="1" bb c=3]'
+    assert tpl(None, None, None) == b'[xx a bb c]'
+    assert tpl(b'', b'x', b'') == b'[xx a= bb=x c=]'
+
+    tpl = inst.compile_starttag(b'yy', iter([b'a']), True)
+    assert tpl(b'v') == b'[[yy a=v]]'
+
+    tpl = inst.compile_starttag(b'zz', (), True)
+    assert tpl() == b'[[zz]]'
+
+    tpl = inst.compile_starttag(name=b'zz', keys=[], closed=0)
+    assert tpl() == b'[zz]'
+
+    attr = _attrs('k', 30)
+    tpl = inst.compile_starttag(b'x', [key for key, _ in attr], False)
+    assert tpl(*[value for _, value in attr]) == _tag(b'x', attr)
+
+
+@multi
+def test_compile_starttag_errors():
+    """ markup.encoder.text.TextEncoder().compile_starttag() checks input """
+    inst = _encoder.TextEncoder('utf-8')
+
+    with raises(TypeError):
+        inst.compile_starttag(u'x', [], False)
+    with raises(TypeError):
+        inst.compile_starttag(b'x', [b'a', u'b'], False)
+    with raises(TypeError):
+        inst.compile_starttag(b'x', None, False)
+    with raises(RuntimeError):
+        inst.compile_starttag(b'x', _test.baditer(RuntimeError()), False)
+    with raises(RuntimeError):
+        inst.compile_starttag(b'x', [], _test.badbool)
+
+    tpl = inst.compile_starttag(b'x', [b'a', b'b'], False)
+    with raises(TypeError) as exc:
+        tpl(b'a')
+    assert str(exc.value) == "expected 2 values, got 1"
+    with raises(TypeError) as exc:
+        tpl(b'a', b'b', b'c')
+    assert str(exc.value) == "expected 2 values, got 3"
+    with raises(TypeError):
+        tpl(b'a', u'b')
+
+
+@multi
+def test_scratch_reuse():
+    """ markup.encoder.text.TextEncoder() reuses attribute storage """
+    inst = _encoder.TextEncoder('utf-8')
+
+    for count in (20, 10, 40, 300, 30):
+        attr = _attrs('a', count)
+        assert inst.starttag(b'x', attr, False) == _tag(b'x', attr)
+        assert inst.encode_tags([
+            ('start', b'y', attr, False), ('start', b'z', attr, False),
+        ]) == _tag(b'y', attr) + _tag(b'z', attr)
+
+    assert inst.trim() is None
+    assert inst.trim() is None
+    attr = _attrs('b', 50)
+    assert inst.starttag(b'x', attr, False) == _tag(b'x', attr)
+
+
+@multi
+def test_scratch_reentrant():
+    """ markup.encoder.text.TextEncoder() deals with nested starttags """
+    inst = _encoder.TextEncoder('utf-8')
+    inner = _attrs('i', 30)
+    results = []
+
+    def gen():
+        """ Produce attributes, while building other tags """
+        for idx, item in enumerate(_attrs('o', 30)):
+            if idx == 20:
+                results.append(inst.starttag(b'y', inner, False))
+                inst.trim()
+                results.append(inst.starttag(b'z', iter(inner), False))
+            yield item
+
+    assert inst.starttag(b'x', gen(), False) == _tag(b'x', _attrs('o', 30))
+    assert results == [_tag(b'y', inner), _tag(b'z', inner)]
+
+
+class _Extendable(object):
+    """ Target with extend method """
+
+    def __init__(self):
+        self.items = []
+
+    def extend(self, value):
+        """ Collect value """
+        self.items.append(value)
+
+
+@multi
+def test_starttag_into():
+    """ markup.encoder.text.TextEncoder().starttag_into() appends tags """
+    inst = _encoder.TextEncoder('utf-8')
+
+    buf = bytearray(b'..')
+    result = inst.starttag_into(buf, b'yy', iter([(b'aa', None),
+                                                  (b'bb', b'cc')]), True)
+    assert result == 15
+    assert buf == bytearray(b'..[[yy aa bb=cc]]')
+
+    target = _Extendable()
+    result = inst.starttag_into(target, b'xx', [], False)
+    assert result == 4
+    assert target.items == [b'[xx]']
+
+
+@multi
+def test_starttag_into_errors():
+    """ markup.encoder.text.TextEncoder().starttag_into() raises errors """
+    inst = _encoder.TextEncoder('utf-8')
+
+    buf = bytearray()
+    with raises(TypeError):
+        inst.starttag_into(buf, u'x', [], False)
+    with raises(TypeError):
+        inst.starttag_into(buf, b'x', [(b'aa', u'bb')], False)
+    with raises(RuntimeError):
+        inst.starttag_into(buf, b'x', [], _test.badbool)
+    with raises(AttributeError):
+        inst.starttag_into(None, b'x', [], False)
+    assert buf == bytearray()
+
+
+@multi
+def test_endtag_into():
+    """ markup.encoder.text.TextEncoder().endtag_into() appends endtags """
+    inst = _encoder.TextEncoder('utf-8')
+
+    buf = bytearray(b'..')
+    result = inst.endtag_into(buf, b'xx')
+    assert result == 5
+    assert buf == bytearray(b'..[/xx]')
+
+    target = _Extendable()
+    result = inst.endtag_into(target, b'xx')
+    assert result == 5
+    assert target.items == [b'[/xx]']
+
+    with raises(TypeError):
+        inst.endtag_into(buf, u'xx')
+    with raises(AttributeError):
+        inst.endtag_into(None, b'xx')
+
+
+@multi
+def test_attribute_into():
+    """ markup.encoder.text.TextEncoder().attribute_into() appends attrs """
+    inst = _encoder.TextEncoder('utf-8')
+
+    buf = bytearray(b'..')
+    result = inst.attribute_into(buf, u'A\\nd"r\xe9')
+    assert result == 12
+    result = inst.attribute_into(buf, b'A\\nd"r\xe9')
+    assert result == 11
+    assert buf == bytearray(
+        b'.."A\\\\nd\\"r\xc3\xa9""A\\\\nd\\"r\xe9"'
+    )
+
+    target = _Extendable()
+    assert inst.attribute_into(target, b'x') == 3
+    assert inst.attribute_into(target, u'y') == 3
+    assert target.items == [b'"x"', b'"y"']
+
+    with raises(AttributeError):
+        inst.attribute_into(None, b'xx')
+
+
+@multi
+def test_large_values():
+    """ markup.encoder.text.TextEncoder() handles large values """
+    text = u'a[b"c\\\xe9' * 100000
+    data = b'a[b"c\\' * 100000
+    attr = b''.join([
+        b'"', data.replace(b'\\', b'\\\\').replace(b'"', b'\\"'), b'"'
+    ])
+
+    for encoding in ('utf-8', 'latin-1', 'cp1252'):
+        inst = _encoder.TextEncoder(encoding)
+        escaped = text.replace(u'[', u'[]').encode(encoding)
+        assert inst.escape_content(text) == escaped
+        assert inst.content_join([text, text]) == escaped * 2
+
+        assert inst.escape_content(data) == data.replace(b'[', b'[]')
+        assert inst.content_join([data], escape=True) == \
+            data.replace(b'[', b'[]')
+        assert inst.attribute(data) == attr
+
+        buf = bytearray(b'..')
+        assert inst.attribute_into(buf, data) == len(attr)
+        assert buf == b'..' + attr
+
+
+@c
+def test_attribute_into_badstr():
+    """ markup.encoder.text.TextEncoder().attribute_into() raises on badstr """
+    inst = _encoder.TextEncoder('utf-8')
+    with raises(RuntimeError):
+        inst.attribute_into(bytearray(), _test.badstr)
+
+
+@multi
+def test_content_into():
+    """ markup.encoder.text.TextEncoder().content_into() appends content """
+    inst = _encoder.TextEncoder('utf-8')
+
+    buf = bytearray(b'..')
+    assert inst.content_into(buf, u'Andr\xe9') == 6
+    assert inst.content_into(buf, b'Andr\xe9') == 5
+    assert buf == bytearray(b'..Andr\xc3\xa9Andr\xe9')
+
+    target = _Extendable()
+    assert inst.content_into(target, b'x') == 1
+    assert target.items == [b'x']
+
+    with raises(AttributeError):
+        inst.content_into(None, b'xx')
+
+
+@c
+def test_content_into_badstr():
+    """ markup.encoder.text.TextEncoder().content_into() raises on badstr """
+    inst = _encoder.TextEncoder('utf-8')
+    with raises(RuntimeError):
+        inst.content_into(bytearray(), _test.badstr)
+
+
+@c
+def test_into_arg_error():
+    """ markup.encoder.text.TextEncoder().*_into() check arguments """
+    inst = _encoder.TextEncoder('utf-8')
+    # pylint: disable = no-value-for-parameter
+    with raises(TypeError):
+        inst.starttag_into(bytearray(), b'x', [])
+    with raises(TypeError):
+        inst.endtag_into(bytearray())
+    with raises(TypeError):
+        inst.attribute_into(bytearray())
+    with raises(TypeError):
+        inst.content_into(bytearray())
+
+
 @multi
 def test_weakref():
     """ markup.encoder.text.TextEncoder() accepts and clears weakrefs """
-    inst = _encoder.TextEncoder('foo')
+    inst = _encoder.TextEncoder('utf-8')
     ref = _weakref.ref(inst)
 
-    assert ref().encoding == 'foo'
+    assert ref().encoding == 'utf-8'
     del inst
     assert ref() is None
 
@@ -382,10 +1201,21 @@ def test_new_argerror():
 @c
 def test_setencoding():
     """ markup.encoder.text.TextEncoder() accepts encoding """
-    inst = _encoder.TextEncoder('foo')
-    inst.encoding = 'bar'
+    inst = _encoder.TextEncoder('utf-8')
+    inst.encoding = 'latin-1'
 
-    assert inst.encoding == 'bar'
+    assert inst.encoding == 'latin-1'
 
     with raises(RuntimeError):
         inst.encoding = _test.badstr
+
+
+@multi
+def test_setencoding_lookup_error():
+    """ markup.encoder.text.TextEncoder() validates new encodings """
+    inst = _encoder.TextEncoder('utf-8')
+    with raises(LookupError):
+        inst.encoding = 'foo'
+
+    assert inst.encoding == 'utf-8'
+    assert inst.content(u'Andr\xe9') == b'Andr\xc3\xa9'
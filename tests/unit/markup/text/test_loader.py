@@ -0,0 +1,130 @@
+# -*- coding: ascii -*-
+u"""
+:Copyright:
+
+ Copyright 2017
+ Andr\xe9 Malo or his licensors, as applicable
+
+:License:
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+==================================
+ Tests for tdi.markup.text.loader
+==================================
+
+"""
+__author__ = u"Andr\xe9 Malo"
+__docformat__ = "restructuredtext en"
+
+import os as _os
+import tempfile as _tempfile
+
+from pytest import raises
+
+from tdi.markup.text import decoder as _decoder
+from tdi.markup.text import loader as _loader
+from tdi.markup.text import tokenizer as _tokenizer
+
+from .... import _util as _test
+
+multi = _test.multi_impl(globals(), _decoder, _tokenizer, _loader)
+
+
+def _tempfile_with(data):
+    """ Create a temporary file with content """
+    fd, filename = _tempfile.mkstemp()
+    try:
+        _os.write(fd, data)
+    finally:
+        _os.close(fd)
+    return filename
+
+
+@multi
+def test_load():
+    """ markup.text.loader.load() tokenizes the mapped file """
+    decoder = _decoder.TextDecoder('utf-8')
+    data = u'a[]b[x y="1 [] \\"" z=2 w]\xe9\u20ac[[br]]t[/x]c'.encode('utf-8')
+    filename = _tempfile_with(data)
+    try:
+        events = _loader.load(filename, decoder)
+        try:
+            assert events == _tokenizer.TextTokenizer(decoder).tokenize(data)
+        finally:
+            events.close()
+    finally:
+        _os.remove(filename)
+
+    filename = _tempfile_with(b'[a]\xff')
+    try:
+        with raises(UnicodeDecodeError):
+            _loader.load(filename, decoder)
+        events = _loader.load(filename, decoder, errors='replace')
+        events.close()
+        assert events == [('start', u'a', [], False), ('text', u'\ufffd')]
+    finally:
+        _os.remove(filename)
+
+
+@multi
+def test_load_mapped():
+    """ markup.text.loader.load() keeps the file mapped """
+    filename = _tempfile_with(b'[a]x')
+    try:
+        events = _loader.load(filename, _decoder.TextDecoder('utf-8'))
+        assert isinstance(events.source, _loader.MappedFile)
+        assert not events.source.closed
+        assert bytes(events.data[1:2]) == b'a'
+
+        events.close()
+        assert events.source.closed
+        assert bytes(events.data) == b''
+        assert events == [('start', u'a', [], False), ('text', u'x')]
+    finally:
+        _os.remove(filename)
+
+
+@multi
+def test_load_empty():
+    """ markup.text.loader.load() accepts empty files """
+    filename = _tempfile_with(b'')
+    try:
+        events = _loader.load(filename, _decoder.TextDecoder('utf-8'))
+        assert events == []
+        assert bytes(events.data) == b''
+        events.close()
+    finally:
+        _os.remove(filename)
+
+
+def test_load_missing():
+    """ markup.text.loader.load() fails on missing files """
+    filename = _tempfile_with(b'')
+    _os.remove(filename)
+    with raises(EnvironmentError):
+        _loader.load(filename, _decoder.TextDecoder('utf-8'))
+
+
+def test_mapped_file():
+    """ markup.text.loader.MappedFile() maps and unmaps the file """
+    filename = _tempfile_with(b'abc')
+    try:
+        with _loader.MappedFile(filename) as source:
+            assert bytes(source.data) == b'abc'
+            assert not source.closed
+        assert source.closed
+        assert bytes(source.data) == b''
+        source.close()
+    finally:
+        _os.remove(filename)
@@ -0,0 +1,311 @@
+# -*- coding: ascii -*-
+u"""
+:Copyright:
+
+ Copyright 2017
+ Andr\xe9 Malo or his licensors, as applicable
+
+:License:
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+=====================================
+ Tests for tdi.markup.text.tokenizer
+=====================================
+
+"""
+__author__ = u"Andr\xe9 Malo"
+__docformat__ = "restructuredtext en"
+
+import io as _io
+import weakref as _weakref
+
+from pytest import raises
+
+from tdi.markup.text import decoder as _decoder
+from tdi.markup.text import encoder as _encoder
+from tdi.markup.text import tokenizer as _tokenizer
+
+from .... import _util as _test
+
+multi = _test.multi_impl(globals(), _decoder, _tokenizer)
+
+
+class _Decoder(object):
+    """ Decoder wrapper, uppercasing names """
+
+    def __init__(self, decoder):
+        self.calls = []
+        self._decoder = decoder
+
+    def normalize(self, name):
+        """ Uppercase name """
+        self.calls.append('normalize')
+        return name.upper()
+
+    def decode(self, *args):
+        """ Decode value """
+        self.calls.append('decode')
+        return self._decoder.decode(*args)
+
+    def attribute(self, *args):
+        """ Decode attribute """
+        self.calls.append('attribute')
+        return self._decoder.attribute(*args)
+
+    def content(self, *args):
+        """ Decode content """
+        self.calls.append('content')
+        return self._decoder.content(*args)
+
+
+def _tokenize(data, encoding='utf-8', **kwargs):
+    """ Tokenize with a fresh tokenizer """
+    return _tokenizer.TextTokenizer(
+        _decoder.TextDecoder(encoding), **kwargs
+    ).tokenize(data)
+
+
+@multi
+def test_tokenize():
+    """ markup.text.tokenizer.TextTokenizer() emits events """
+    assert _tokenize(
+        b'a[]b[x y="1[]\\"\\z" z=2 w]\n[[br]]t[/x]'
+    ) == [
+        ('text', u'a[b'),
+        ('start', u'x', [(u'y', u'1[]"z'), (u'z', u'2'), (u'w', None)],
+         False),
+        ('text', u'\n'),
+        ('start', u'br', [], True),
+        ('text', u't'),
+        ('end', u'x'),
+    ]
+    assert _tokenize(b'') == []
+    assert _tokenize(b'[a]') == [('start', u'a', [], False)]
+    assert _tokenize(b"[[a\tb='x]]'  ]][/a]") == [
+        ('start', u'a', [(u'b', u'x]]')], True),
+        ('end', u'a'),
+    ]
+
+
+@multi
+def test_tokenize_invalid():
+    """ markup.text.tokenizer.TextTokenizer() passes invalid tags as text """
+    for data in (b'[', b'[ a]', b'[/]', b'[/a ]', b'[a', b'[[a',
+                 b'[a b="c]', b'[a b=]', b'[a b="c"d]', b'[a=b]', b'[]]',
+                 b'[/a/]', b'[a/]', b'[[]x]'):
+        assert _tokenize(data) == [
+            ('text', data.decode('ascii').replace(u'[]', u'[')),
+        ], data
+
+    assert _tokenize(b'[[a][b]]') == [
+        ('text', u'['), ('start', u'a', [], False),
+        ('start', u'b', [], False), ('text', u']'),
+    ]
+    assert _tokenize(b'x[[y]') == [
+        ('text', u'x['), ('start', u'y', [], False),
+    ]
+
+
+@multi
+def test_tokenize_roundtrip():
+    """ markup.text.tokenizer.TextTokenizer() reads TextEncoder output """
+    encoder = _encoder.TextEncoder('utf-8')
+    data = b''.join([
+        encoder.starttag(b'a', [(b'b', encoder.attribute(u'x"\\y]'))],
+                         False),
+        encoder.escape_content(u'[\xe9]'),
+        encoder.starttag(b'c', [(b'd', None)], True),
+        encoder.endtag(b'a'),
+    ])
+    assert _tokenize(data) == [
+        ('start', u'a', [(u'b', u'x"\\y]')], False),
+        ('text', u'[\xe9]'),
+        ('start', u'c', [(u'd', None)], True),
+        ('end', u'a'),
+    ]
+
+
+@multi
+def test_tokenize_buffer():
+    """ markup.text.tokenizer.TextTokenizer() accepts buffers """
+    data = b'xx[a b=c]d[/a]'
+    expected = [
+        ('text', u'xx'), ('start', u'a', [(u'b', u'c')], False),
+        ('text', u'd'), ('end', u'a'),
+    ]
+    assert _tokenize(bytearray(data)) == expected
+    assert _tokenize(memoryview(data)) == expected
+    assert _tokenize(memoryview(b'..' + data)[2:]) == expected
+
+    with raises(TypeError):
+        _tokenize(u'[a]')
+    with raises(TypeError):
+        _tokenize(None)
+
+
+@multi
+def test_tokenize_decoder():
+    """ markup.text.tokenizer.TextTokenizer() routes through the decoder """
+    decoder = _Decoder(_decoder.TextDecoder('latin-1'))
+    tokenizer = _tokenizer.TextTokenizer(decoder)
+    assert tokenizer.tokenize(b'\xe9[a b=c d][/a]') == [
+        ('text', u'\xe9'),
+        ('start', u'A', [(u'B', u'c'), (u'D', None)], False),
+        ('end', u'A'),
+    ]
+    assert decoder.calls == [
+        'content', 'decode', 'normalize', 'decode', 'normalize',
+        'attribute', 'decode', 'normalize', 'decode', 'normalize',
+    ]
+
+    decoder = _decoder.TextDecoder('utf-8', name_cache=10)
+    events = _tokenizer.TextTokenizer(decoder).tokenize(
+        b'[' + b'x' * 20 + b'][/' + b'x' * 20 + b']'
+    )
+    assert events[0][1] is events[1][1]
+
+
+@multi
+def test_tokenize_errors():
+    """ markup.text.tokenizer.TextTokenizer() passes the error handler """
+    with raises(UnicodeDecodeError):
+        _tokenize(b'[a]\xff')
+    with raises(UnicodeDecodeError):
+        _tokenize(b'[a b=\xff]')
+    with raises(UnicodeDecodeError):
+        _tokenize(b'[\xff]')
+
+    assert _tokenize(b'[\xff b="\xff"]\xff', errors='replace') == [
+        ('start', u'\ufffd', [(u'b', u'\ufffd')], False),
+        ('text', u'\ufffd'),
+    ]
+
+    with raises(AttributeError):
+        _tokenizer.TextTokenizer(None)
+
+
+@multi
+def test_scan():
+    """ markup.text.tokenizer.TextTokenizer().scan() stops at cut tags """
+    scan = _tokenizer.TextTokenizer(_decoder.TextDecoder('utf-8')).scan
+    for data in (b'[', b'[/', b'[/a', b'[[', b'[a', b'[a ', b'[a b',
+                 b'[a b=', b'[a b=c', b'[a b="c', b'[a b="c\\',
+                 b"[a b='c]", b'[a b="c"', b'[a b="x[]'):
+        assert scan(b'x[]' + data, False) == ([('text', u'x[')], 3), data
+        assert scan(b'x[]' + data) == ([
+            ('text', u'x[' + data.decode('ascii').replace(u'[]', u'[')),
+        ], len(data) + 3), data
+
+    for data in (b'[]', b'[ ', b'[a=', b'[/a ', b'[a b= ', b'[a b="c"d',
+                 b'[[]x'):
+        assert scan(data, False) == ([
+            ('text', data.decode('ascii').replace(u'[]', u'[')),
+        ], len(data)), data
+
+    assert scan(b'[[a b]', False) == ([], 0)
+    assert scan(b'[[a b]') == ([
+        ('text', u'['), ('start', u'a', [(u'b', None)], False),
+    ], 6)
+    assert scan(b'[a]x[/a', False) == ([
+        ('start', u'a', [], False), ('text', u'x'),
+    ], 4)
+    assert scan(b'', False) == ([], 0)
+
+    euro = u'\u20ac'.encode('utf-8')
+    for cut in range(1, len(euro)):
+        assert scan(b'a' + euro[:cut], False) == ([('text', u'a')], 1)
+    assert scan(b'a' + euro, False) == ([('text', u'a')], 1)
+    assert scan(b'a' + euro + b'b', False) == (
+        [('text', u'a\u20acb')], 5
+    )
+    assert scan(b'a\xe9', False) == ([('text', u'a')], 1)
+
+    with raises(TypeError):
+        scan(u'[a]', False)
+
+
+@multi
+def test_iterparse():
+    """ markup.text.tokenizer.iterparse() yields events per chunk """
+    decoder = _decoder.TextDecoder('utf-8')
+    data = (
+        u'a[]b[x y="1 [] \\"" z=2 w]\xe9\u20ac[[br]]t[/x]c'
+    ).encode('utf-8')
+    expected = _tokenizer.TextTokenizer(decoder).tokenize(data)
+
+    def merged(events):
+        """ Merge adjacent text events """
+        result = []
+        for event in events:
+            if event[0] == 'text' and result and result[-1][0] == 'text':
+                event = ('text', result.pop()[1] + event[1])
+            result.append(event)
+        return result
+
+    for chunk_size in (1, 2, 3, 5, 8, 13, 64):
+        events = _tokenizer.iterparse(_io.BytesIO(data), decoder,
+                                      chunk_size=chunk_size)
+        assert merged(events) == expected, chunk_size
+
+    events = _tokenizer.iterparse(_io.BytesIO(data), decoder)
+    assert next(events) == expected[0]
+    assert list(events) == expected[1:]
+
+    assert list(_tokenizer.iterparse(_io.BytesIO(b''), decoder)) == []
+    assert list(_tokenizer.iterparse(_io.BytesIO(b'[a'), decoder, 1)) == [
+        ('text', u'[a'),
+    ]
+
+    with raises(ValueError):
+        _tokenizer.iterparse(_io.BytesIO(data), decoder, 0)
+
+    with raises(UnicodeDecodeError):
+        list(_tokenizer.iterparse(_io.BytesIO(b'[a]\xff'), decoder))
+
+
+class _NonBlocking(object):
+    """ Stream returning a chunk, then no data """
+
+    def __init__(self, data):
+        self._data = [data]
+
+    def readinto(self, buf):
+        """ Read chunk or nothing """
+        if not self._data:
+            return None
+        data = self._data.pop()
+        buf[:len(data)] = data
+        return len(data)
+
+
+@multi
+def test_iterparse_nonblocking():
+    """ markup.text.tokenizer.iterparse() rejects non-blocking streams """
+    events = _tokenizer.iterparse(_NonBlocking(b'x[a]y'),
+                                  _decoder.TextDecoder('utf-8'))
+    assert next(events) == ('text', u'x')
+    assert next(events) == ('start', u'a', [], False)
+    assert next(events) == ('text', u'y')
+    with raises(_io.BlockingIOError):
+        next(events)
+
+
+@multi
+def test_weakref():
+    """ markup.text.tokenizer.TextTokenizer() is weak referencable """
+    inst = _tokenizer.TextTokenizer(_decoder.TextDecoder('utf-8'))
+    ref = _weakref.ref(inst)
+    assert ref() is inst
+    del inst
+    assert ref() is None
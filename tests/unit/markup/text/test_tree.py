@@ -0,0 +1,152 @@
+# -*- coding: ascii -*-
+u"""
+:Copyright:
+
+ Copyright 2017
+ Andr\xe9 Malo or his licensors, as applicable
+
+:License:
+
+ Licensed under the Apache License, Version 2.0 (the "License");
+ you may not use this file except in compliance with the License.
+ You may obtain a copy of the License at
+
+     http://www.apache.org/licenses/LICENSE-2.0
+
+ Unless required by applicable law or agreed to in writing, software
+ distributed under the License is distributed on an "AS IS" BASIS,
+ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+ See the License for the specific language governing permissions and
+ limitations under the License.
+
+================================
+ Tests for tdi.markup.text.tree
+================================
+
+"""
+__author__ = u"Andr\xe9 Malo"
+__docformat__ = "restructuredtext en"
+
+from pytest import raises
+
+from tdi.markup.text import compiler as _compiler
+from tdi.markup.text import decoder as _decoder
+from tdi.markup.text import encoder as _encoder
+from tdi.markup.text import tokenizer as _tokenizer
+from tdi.markup.text import tree as _tree
+
+from .... import _util as _test
+
+multi = _test.multi_impl(globals(), _decoder, _encoder, _tokenizer,
+                         _compiler, _tree)
+
+
+def _events(data):
+    """ Tokenize """
+    return _tokenizer.TextTokenizer(
+        _decoder.TextDecoder('utf-8', name_cache=16)
+    ).tokenize(data)
+
+
+@multi
+def test_build():
+    """ markup.text.tree.build_tree() builds the element tree """
+    tree = _tree.build_tree(_events(
+        b'a[]b[x y="1 [] \\"" w][[br k=v]]t[/x][p]c'
+    ))
+    text, x, p = tree.children
+    assert text == u'a[b'
+    assert (x.name, x.attr, x.closed, x.ended) == (
+        u'x', ((u'y', u'1 [] "'), (u'w', None)), False, True
+    )
+    br, t = x.children
+    assert (br.name, br.attr, br.closed, br.ended, br.children) == (
+        u'br', ((u'k', u'v'),), True, False, None
+    )
+    assert t == u't'
+    assert (p.name, p.ended, p.children) == (u'p', False, (u'c',))
+
+    assert _tree.build_tree([]).children == ()
+
+
+@multi
+def test_events():
+    """ markup.text.tree.Tree.events() reproduces the events """
+    events = _events(b'a[x y=1][[br]]t[/x][p][q]c[/p][/z]d[e]f[/e]')
+    tree = _tree.build_tree(events)
+    assert list(tree.events()) == [
+        ('text', u'a'),
+        ('start', u'x', [(u'y', u'1')], False),
+        ('start', u'br', [], True),
+        ('text', u't'),
+        ('end', u'x'),
+        ('start', u'p', [], False),
+        ('start', u'q', [], False),
+        ('text', u'c'),
+        ('end', u'p'),
+        ('end', u'z'),
+        ('text', u'd'),
+        ('start', u'e', [], False),
+        ('text', u'f'),
+        ('end', u'e'),
+    ]
+
+    template = _compiler.compile_events(
+        tree.events(), _encoder.TextEncoder('utf-8')
+    )
+    assert template.render() == (
+        b'a[x y="1"][[br]]t[/x][p][q]c[/p][/z]d[e]f[/e]'
+    )
+
+
+@multi
+def test_stray_endtag():
+    """ markup.text.tree.build_tree() keeps stray end tags """
+    events = _events(b'a[/z]b[x]c[/y][/x]d')
+    tree = _tree.build_tree(events)
+    a, z, b, x, d = tree.children
+    assert (a, b, d) == (u'a', u'b', u'd')
+    assert isinstance(z, _tree.EndTag)
+    assert z.name == u'z'
+    c, y = x.children
+    assert c == u'c'
+    assert y.name == u'y'
+    assert x.ended
+    assert list(tree.events()) == events
+
+    encoder = _encoder.TextEncoder('utf-8')
+    assert _compiler.compile_events(tree.events(), encoder).render() == (
+        _compiler.compile_events(events, encoder).render()
+    )
+    assert tree.footprint()[0] == 7
+
+
+@multi
+def test_footprint():
+    """ markup.text.tree.Tree.footprint() measures the tree """
+    assert _tree.build_tree([]).footprint()[:1] == (0,)
+    tree = _tree.build_tree(_events(b'[x y=1]a[/x][x y=1]a[/x]'))
+    nodes, size, per_node = tree.footprint()
+    assert nodes == 4
+    assert size > 0
+    assert per_node == size / 4.0
+
+    # name strings are shared via the decoder's name cache
+    first, second = tree.children
+    assert first.name is second.name
+
+
+def test_slots():
+    """ markup.text.tree.Element() and EndTag() have no instance dict """
+    element = _tree.Element(u'x', [], True, True, [u'a'])
+    assert not hasattr(element, '__dict__')
+    assert element.attr == ()
+    assert element.children is None
+    assert not element.ended
+    assert not hasattr(_tree.EndTag(u'x'), '__dict__')
+
+
+def test_invalid():
+    """ markup.text.tree.build_tree() rejects unknown events """
+    with raises(ValueError):
+        _tree.build_tree([('foo',)])